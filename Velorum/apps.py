@@ -3,6 +3,22 @@ Configuración de la aplicación Django Velorum
 """
 
 from django.apps import AppConfig
+import os
+import sys
+
+
+def es_comando_de_gestion():
+    """
+    True si el proceso es un comando de manage.py / django-admin que no sirve
+    requests (migrate, makemigrations, check, shell, test...): ahí no hace
+    falta el scheduler y la BD puede no estar migrada todavía.
+    """
+    if len(sys.argv) < 2:
+        return False
+    programa = os.path.basename(sys.argv[0])
+    if programa not in ('manage.py', 'django-admin', 'django-admin.py', '__main__.py'):
+        return False
+    return sys.argv[1] != 'runserver'
 
 
 class VelorumConfig(AppConfig):
@@ -13,11 +29,14 @@ class VelorumConfig(AppConfig):
         """
         Hook que se ejecuta cuando Django está listo
         """
-        import os
-        
         # Iniciar scheduler:
+        # - Comandos de gestión (migrate, check, createcachetable...): nunca
         # - En desarrollo (runserver): solo cuando RUN_MAIN=true (evita duplicados en auto-reload)
         # - En producción (gunicorn/otros): siempre (RUN_MAIN no existe)
+        # Con varios workers, solo el líder (SchedulerLock en BD) ejecuta los jobs programados
+        if es_comando_de_gestion():
+            return
+        
         run_main = os.environ.get('RUN_MAIN')
         is_production = run_main is None  # gunicorn no setea RUN_MAIN
         is_dev_main = run_main == 'true'  # runserver proceso principal
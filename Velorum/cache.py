@@ -0,0 +1,173 @@
+"""
+Backend de cache en dos niveles
+
+- Nivel local: LRU en memoria del proceso, con TTL corto (LOCAL_TIMEOUT).
+- Nivel compartido: otro alias de CACHES (Redis, memcached o tabla de BD),
+  visible para todos los workers.
+
+Las lecturas se sirven del nivel local si la entrada está vigente y si no
+del compartido (guardando una copia local). Las escrituras van a los dos.
+Otro proceso puede ver un valor viejo como mucho LOCAL_TIMEOUT segundos.
+
+Configuración:
+    CACHES = {
+        'default': {
+            'BACKEND': 'Velorum.cache.TieredCache',
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 5, 'LOCAL_MAX_ENTRIES': 1000},
+        },
+        'shared': {...},
+    }
+"""
+
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+import pickle
+import threading
+import time
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local = OrderedDict()  # clave -> (expira, valor serializado)
+        self._lock = threading.Lock()
+        self._stats = {'hits_local': 0, 'hits_shared': 0, 'misses': 0, 'sets': 0}
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # ---- Nivel local ----
+
+    def _local_expira(self, timeout):
+        """Vencimiento local: nunca más que LOCAL_TIMEOUT ni que el TTL pedido"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if ttl <= 0:
+            return None
+        return time.monotonic() + ttl
+
+    def _local_get(self, key):
+        with self._lock:
+            entrada = self._local.get(key)
+            if entrada is None:
+                return _MISSING
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(valor)
+
+    def _local_set(self, key, value, timeout):
+        expira = self._local_expira(timeout)
+        if expira is None:
+            self._local_delete(key)
+            return
+        valor = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (expira, valor)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def _sumar(self, contador):
+        with self._lock:
+            self._stats[contador] += 1
+
+    # ---- API de cache ----
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        valor = self._local_get(local_key)
+        if valor is not _MISSING:
+            self._sumar('hits_local')
+            return valor
+
+        valor = self.shared.get(key, _MISSING, version=version)
+        if valor is _MISSING:
+            self._sumar('misses')
+            return default
+
+        self._sumar('hits_shared')
+        self._local_set(local_key, valor, None)
+        return valor
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._local_set(local_key, value, timeout)
+        self._sumar('sets')
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        # Operación condicional: decide el nivel compartido
+        agregado = self.shared.add(key, value, timeout=timeout, version=version)
+        if agregado:
+            self._local_set(local_key, value, timeout)
+        else:
+            self._local_delete(local_key)
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if self._local_get(local_key) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        # Atómico solo si el nivel compartido lo es (Redis/memcached sí, BD no)
+        valor = self.shared.incr(key, delta, version=version)
+        self._local_set(local_key, valor, None)
+        return valor
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # ---- Métricas ----
+
+    def stats(self):
+        """
+        Contadores de este proceso
+
+        Returns:
+            dict: aciertos por nivel, fallos, escrituras, entradas locales y hit ratio
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+        lecturas = stats['hits_local'] + stats['hits_shared'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits_local'] + stats['hits_shared']) / lecturas, 4) if lecturas else None
+        stats['shared_backend'] = type(self.shared).__name__
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for contador in self._stats:
+                self._stats[contador] = 0
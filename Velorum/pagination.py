@@ -0,0 +1,208 @@
+"""
+Paginación por keyset (cursor)
+
+En lugar de OFFSET + COUNT(*), cada página se pide "a partir de" la última fila
+vista: WHERE (orden, id) > (valor, último_id) ORDER BY orden, id LIMIT n.
+El costo no crece con la profundidad de la página y las filas insertadas
+mientras se navega no desplazan ni duplican resultados.
+
+El modo keyset se activa cuando el cliente manda ?cursor (vacío para la
+primera página). Sin cursor se usa legacy_pagination_class, para no romper
+a los clientes existentes; si es None la respuesta es la lista completa,
+como antes.
+
+Solo se puede paginar por columnas propias y no nulas del modelo (un keyset
+sobre una columna con NULL saltea esas filas). Si el queryset viene ordenado
+por otra cosa (p. ej. la relevancia de una búsqueda ?q=, que es una
+anotación) el pedido con cursor se rechaza con 400 en lugar de cambiar el
+orden en silencio; esas consultas se paginan por número de página.
+
+Respuesta:
+    {"next": "<url con cursor>", "previous": "<url con cursor>", "results": [...]}
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import base64
+import json
+
+
+def _valor_json(valor):
+    # isoformat completo: DjangoJSONEncoder trunca microsegundos y rompería la igualdad
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    # Orden si el queryset no trae uno; siempre se agrega id como desempate
+    default_ordering = ('-id',)
+    # Paginación cuando no hay ?cursor (None = sin paginar)
+    legacy_pagination_class = None
+    invalid_cursor_message = 'Cursor inválido'
+    invalid_ordering_message = 'Este orden no admite paginación por cursor; usar paginación por página'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if self.cursor_query_param not in request.query_params:
+            if self.legacy_pagination_class is None:
+                return None
+            self.legacy = self.legacy_pagination_class()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset)
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        reverso = bool(cursor and cursor['r'])
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(cursor['v'], reverso))
+        orden = [self.invertir(campo) for campo in self.ordering] if reverso else list(self.ordering)
+
+        filas = list(queryset.order_by(*orden)[:page_size + 1])
+        hay_mas = len(filas) > page_size
+        filas = filas[:page_size]
+        if reverso:
+            filas.reverse()
+
+        self.primera = filas[0] if filas else None
+        self.ultima = filas[-1] if filas else None
+        # Yendo hacia atrás, siempre hay página siguiente (de ahí venimos)
+        self.has_next = bool(filas) and (reverso or hay_mas)
+        self.has_previous = bool(filas) and (hay_mas if reverso else cursor is not None)
+        return filas
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    # ---- Orden ----
+
+    def get_ordering(self, queryset):
+        """
+        Orden del queryset (o default_ordering si no trae uno) con id como
+        último desempate. Si el orden usa algo que no sea una columna propia
+        no nula del modelo, responde 400.
+        """
+        orden = list(queryset.query.order_by)
+        if not orden:
+            orden = list(self.default_ordering)
+        elif not all(self.es_columna(queryset.model, campo) for campo in orden):
+            raise ValidationError({'error': self.invalid_ordering_message})
+        orden = ['-id' if campo == '-pk' else 'id' if campo == 'pk' else campo for campo in orden]
+
+        nombres = [campo.lstrip('-') for campo in orden]
+        if 'id' in nombres:
+            return tuple(orden[:nombres.index('id') + 1])
+        return tuple(orden) + ('-id' if orden[0].startswith('-') else 'id',)
+
+    @staticmethod
+    def es_columna(model, campo):
+        """
+        True si `campo` es una columna propia y no nula del modelo
+        (no una anotación, una relación ni una columna que admite NULL)
+        """
+        if not isinstance(campo, str) or '__' in campo or campo == '?':
+            return False
+        nombre = campo.lstrip('-')
+        if nombre == 'pk':
+            return True
+        try:
+            field = model._meta.get_field(nombre)
+        except Exception:
+            return False
+        return field.concrete and not field.null
+
+    @staticmethod
+    def invertir(campo):
+        return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+    def keyset_filter(self, valores, reverso):
+        """
+        (a, b, id) > (va, vb, vid) expandido para columnas con distinto sentido:
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)
+        """
+        condicion = Q()
+        iguales = Q()
+        for campo, valor in zip(self.ordering, valores):
+            nombre = campo.lstrip('-')
+            descendente = campo.startswith('-') != reverso
+            condicion |= iguales & Q(**{f"{nombre}__{'lt' if descendente else 'gt'}": valor})
+            iguales &= Q(**{nombre: valor})
+        return condicion
+
+    # ---- Cursor ----
+
+    def encode_cursor(self, fila, reverso):
+        valores = [_valor_json(getattr(fila, campo.lstrip('-'))) for campo in self.ordering]
+        payload = json.dumps({'v': valores, 'r': reverso}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param, '').strip()
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            valores = payload['v']
+            if len(valores) != len(self.ordering):
+                raise ValueError('El cursor no corresponde al orden actual')
+            payload['v'] = [
+                self.model._meta.get_field(campo.lstrip('-')).to_python(valor)
+                for campo, valor in zip(self.ordering, valores)
+            ]
+            payload['r'] = bool(payload.get('r'))
+            return payload
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.ultima, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.primera, True)
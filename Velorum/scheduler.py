@@ -1,16 +1,74 @@
 """
 Configuración del scheduler para tareas automáticas
+
+Cada proceso (worker de gunicorn) arranca su scheduler, pero los jobs
+programados solo corren en el proceso líder: el que tiene el SchedulerLock
+en la BD. El lock se renueva con un heartbeat; si el líder muere, su lease
+vence y otro proceso lo toma en el siguiente heartbeat.
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
 import logging
+import os
+import socket
+import uuid
 
 logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler()
 scheduler_started = False
 
+# Liderazgo entre procesos
+LOCK_NAME = 'scheduler'
+LOCK_TTL = timedelta(seconds=getattr(settings, 'SCHEDULER_LOCK_TTL_SECONDS', 90))
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Espera antes del primer heartbeat (después de que Django terminó de arrancar)
+HEARTBEAT_DELAY = timedelta(seconds=5)
+es_lider = False
+
+
+def heartbeat():
+    """
+    Toma o renueva el lock de líder
+    
+    Returns:
+        bool: True si este proceso es el líder
+    """
+    global es_lider
+    from market.models import SchedulerLock
+    
+    close_old_connections()
+    try:
+        lider = SchedulerLock.adquirir(LOCK_NAME, PROCESS_ID, LOCK_TTL)
+        if lider and not es_lider:
+            logger.info(f"👑 Proceso {PROCESS_ID} es ahora el líder del scheduler")
+        es_lider = lider
+    except Exception as e:
+        # Por ejemplo, si las migraciones todavía no se aplicaron
+        logger.warning(f"No se pudo renovar el lock del scheduler: {str(e)}")
+        es_lider = False
+    finally:
+        close_old_connections()
+    
+    return es_lider
+
+
+def run_as_leader(func, *args):
+    """
+    Ejecuta un job programado solo si este proceso es el líder
+    (renueva el lock justo antes para no correr con un lease vencido)
+    """
+    if not heartbeat():
+        logger.debug(f"Job {func.__name__} omitido: este proceso no es el líder")
+        return None
+    return func(*args)
+
 
 def start():
     """
@@ -23,11 +81,27 @@ def start():
         return
     
     try:
-        from market.scraper import sync_external_products
+        from market.sync_jobs import run_scheduled_sync
+        from market.mp_inbox import procesar_bandeja
+        from market.stock import liberar_reservas_vencidas
+        
+        # Heartbeat del lock de líder. El primer intento espera unos segundos: start()
+        # corre en AppConfig.ready() y no hay que tocar la BD mientras Django inicializa
+        scheduler.add_job(
+            func=heartbeat,
+            trigger=IntervalTrigger(seconds=max(1, int(LOCK_TTL.total_seconds() / 3))),
+            id='scheduler_heartbeat',
+            name='Renovar lock de líder del scheduler',
+            replace_existing=True,
+            max_instances=1,
+            next_run_time=timezone.now() + HEARTBEAT_DELAY
+        )
         
-        # Configurar job de sincronización cada 30 minutos
+        # Configurar job de sincronización cada 30 minutos (solo en el líder; queda
+        # registrada como SyncJob y no se superpone con una manual, ver market/sync_jobs.py)
         scheduler.add_job(
-            func=sync_external_products,
+            func=run_as_leader,
+            args=[run_scheduled_sync],
             trigger=IntervalTrigger(minutes=30),
             id='sync_external_products',
             name='Sincronizar productos externos',
@@ -35,11 +109,33 @@ def start():
             max_instances=1  # Solo una instancia a la vez
         )
         
+        # Devolver el stock de checkouts de MP abandonados (solo en el líder)
+        scheduler.add_job(
+            func=run_as_leader,
+            args=[liberar_reservas_vencidas],
+            trigger=IntervalTrigger(seconds=getattr(settings, 'STOCK_HOLD_SWEEP_SECONDS', 60)),
+            id='liberar_reservas_vencidas',
+            name='Liberar reservas de stock vencidas',
+            replace_existing=True,
+            max_instances=1
+        )
+        
+        # Procesar notificaciones de Mercado Pago encoladas por el webhook (solo en el líder)
+        scheduler.add_job(
+            func=run_as_leader,
+            args=[procesar_bandeja],
+            trigger=IntervalTrigger(seconds=getattr(settings, 'MP_INBOX_POLL_SECONDS', 10)),
+            id='procesar_notificaciones_mp',
+            name='Procesar notificaciones de Mercado Pago',
+            replace_existing=True,
+            max_instances=1
+        )
+        
         scheduler.start()
         scheduler_started = True
         
-        logger.info("✅ Scheduler iniciado - Sincronización automática cada 30 minutos")
-        
+        logger.info("✅ Scheduler iniciado - Sincronización automática cada 30 minutos (solo en el proceso líder)")
+    
     except Exception as e:
         logger.error(f"Error al iniciar scheduler: {str(e)}")
 
@@ -48,9 +144,34 @@ def stop():
     """
     Detiene el scheduler
     """
-    global scheduler_started
+    global scheduler_started, es_lider
     
     if scheduler_started:
         scheduler.shutdown()
         scheduler_started = False
         logger.info("Scheduler detenido")
+    
+    if es_lider:
+        try:
+            from market.models import SchedulerLock
+            SchedulerLock.liberar(LOCK_NAME, PROCESS_ID)
+        except Exception as e:
+            logger.warning(f"No se pudo liberar el lock del scheduler: {str(e)}")
+        es_lider = False
+
+
+def run_now(func, job_id, args=None):
+    """
+    Encola una ejecución única e inmediata de `func` en el scheduler,
+    para correr trabajos largos fuera del request.
+    """
+    if not scheduler.running:
+        start()
+    
+    scheduler.add_job(
+        func=func,
+        trigger=DateTrigger(),
+        args=args or [],
+        id=job_id,
+        misfire_grace_time=None  # Ejecutar aunque el scheduler esté ocupado
+    )
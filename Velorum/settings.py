@@ -208,15 +208,63 @@ SIMPLE_JWT = {
 # Mercado Pago Configuration
 MERCADOPAGO_ACCESS_TOKEN = os.getenv('MERCADOPAGO_ACCESS_TOKEN', 'TEST-4465996122919556-112013-3b348094cef7d20c6e26358ae34779d1-183650403')
 MERCADOPAGO_PUBLIC_KEY = os.getenv('MERCADOPAGO_PUBLIC_KEY', 'TEST-86cf3df5-ce45-468f-bc58-782a35b1550e')
+# Cliente HTTP compartido del SDK (keep-alive): timeouts en segundos y reintentos ante 429/5xx
+MERCADOPAGO_CONNECT_TIMEOUT = float(os.getenv('MERCADOPAGO_CONNECT_TIMEOUT', '3.05'))
+MERCADOPAGO_READ_TIMEOUT = float(os.getenv('MERCADOPAGO_READ_TIMEOUT', '10'))
+MERCADOPAGO_MAX_RETRIES = int(os.getenv('MERCADOPAGO_MAX_RETRIES', '2'))
+MERCADOPAGO_POOL_SIZE = int(os.getenv('MERCADOPAGO_POOL_SIZE', '10'))
+MERCADOPAGO_API_URL = os.getenv('MERCADOPAGO_API_URL', '')  # Vacío = API real
+# Reserva de stock de un checkout de MP sin pagar: al vencer se libera el stock y se cancela el pedido
+STOCK_HOLD_MINUTES = int(os.getenv('STOCK_HOLD_MINUTES', '30'))
+STOCK_HOLD_SWEEP_SECONDS = int(os.getenv('STOCK_HOLD_SWEEP_SECONDS', '60'))
+# Pago de MP 'pending' (Rapipago, Pago Fácil, etc.): la reserva se extiende mientras el cupón está vigente
+STOCK_HOLD_PENDING_HOURS = int(os.getenv('STOCK_HOLD_PENDING_HOURS', '72'))
+# Antigüedad a partir de la cual un pedido 'pendiente' se puede cancelar en bloque (orders/cancel-stale/)
+STALE_ORDER_HOURS = int(os.getenv('STALE_ORDER_HOURS', '48'))
+# Bandeja del webhook de MP: frecuencia del worker y reintentos con backoff exponencial
+MP_INBOX_POLL_SECONDS = int(os.getenv('MP_INBOX_POLL_SECONDS', '10'))
+MP_INBOX_BACKOFF_SECONDS = int(os.getenv('MP_INBOX_BACKOFF_SECONDS', '30'))
+MP_INBOX_MAX_INTENTOS = int(os.getenv('MP_INBOX_MAX_INTENTOS', '8'))
 
 # Telegram Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+# Scraper de productos del proveedor
+SCRAPER_MAX_CONCURRENCY_PER_HOST = int(os.getenv('SCRAPER_MAX_CONCURRENCY_PER_HOST', '4'))  # Requests simultáneos por host
+SCRAPER_MAX_REQUESTS_PER_SECOND = float(os.getenv('SCRAPER_MAX_REQUESTS_PER_SECOND', '5'))  # 0 = sin límite
+SCRAPER_PREFETCH_PAGES = int(os.getenv('SCRAPER_PREFETCH_PAGES', '3'))  # Páginas pedidas por adelantado por categoría
+
+# Scheduler: vencimiento del lock de líder entre workers (el heartbeat corre cada TTL/3)
+SCHEDULER_LOCK_TTL_SECONDS = int(os.getenv('SCHEDULER_LOCK_TTL_SECONDS', '90'))
+
 # Cache Configuration
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', str(60 * 30)))  # Respuestas del catálogo público (segundos)
+# Dos niveles: LRU en memoria de cada proceso + cache compartido entre workers (ver Velorum/cache.py)
+if os.getenv('REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',  # Requiere el paquete redis
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+elif os.getenv('MEMCACHED_LOCATION'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',  # Requiere el paquete pymemcache
+        'LOCATION': os.getenv('MEMCACHED_LOCATION'),
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',  # Tabla creada con `manage.py createcachetable`
+        'LOCATION': 'velorum_cache',
+    }
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': BASE_DIR / 'cache',
-    }
+        'BACKEND': 'Velorum.cache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', '5')),  # Segundos que un valor vive en memoria del proceso
+            'LOCAL_MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1000')),
+        },
+    },
+    'shared': SHARED_CACHE,
 }
@@ -2,7 +2,8 @@ from django.test import TestCase
 from django.urls import reverse, resolve
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
-from account_admin.views import CreateUserView, ChangeRoleView, LoginView, LogoutView
+from rest_framework_simplejwt.views import TokenObtainPairView
+from account_admin.views import CreateUserView, ChangeRoleView, LogoutView
 
 User = get_user_model()
 
@@ -34,7 +35,7 @@ class URLsTest(TestCase):
         
         # Verificar que resuelve a la vista correcta
         resolver = resolve(url)
-        self.assertEqual(resolver.func.view_class, LoginView)
+        self.assertEqual(resolver.func.view_class, TokenObtainPairView)
         
     def test_logout_url_resolves(self):
         """Test que verifica que la URL logout se resuelve correctamente"""
@@ -3,7 +3,7 @@ from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from account_admin.models import User
-from account_admin.views import CreateUserView, ChangeRoleView, LoginView, LogoutView
+from account_admin.views import CreateUserView, ChangeRoleView, LogoutView
 from faker import Faker
 
 fake = Faker()
@@ -407,4 +407,33 @@ class ViewsIntegrationTest(APITestCase):
         # 7. Logout
         logout_url = reverse('logout')
         logout_response = self.client.post(logout_url, format='json')
-        self.assertEqual(logout_response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(logout_response.status_code, 200)
+
+class ListUsersPaginationTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = User.objects.create_user(username='admin_lista', password='x', role='admin')
+        for i in range(4):
+            User.objects.create_user(username=f'cliente_{i}', role='client')
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_sin_cursor_devuelve_todos(self):
+        response = self.client.get(reverse('list_users'))
+        self.assertEqual(response.data['total'], 5)
+        self.assertNotIn('next', response.data)
+
+    def test_paginacion_por_cursor(self):
+        url = reverse('list_users') + '?cursor=&page_size=2'
+        usernames = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            usernames.extend(user['username'] for user in response.data['users'])
+            url = response.data['next']
+
+        esperado = list(User.objects.order_by('-register_date', '-id').values_list('username', flat=True))
+        self.assertEqual(usernames, esperado)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('list_users') + '?cursor=basura')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
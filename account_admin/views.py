@@ -9,7 +9,9 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from Velorum.permissions import *
+from Velorum.pagination import KeysetPagination
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from market.models import Order
 
 # Create your views here.
@@ -449,6 +451,12 @@ def list_users(request):
         # Ordenar por fecha de registro (más recientes primero)
         users = users.order_by('-register_date')
         
+        # Con ?cursor se pagina por keyset (register_date, id); sin cursor, lista completa
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(users, request)
+        if page is not None:
+            users = page
+        
         # Preparar datos de respuesta
         users_data = []
         for user in users:
@@ -467,7 +475,7 @@ def list_users(request):
                 'last_login': user.last_login.isoformat() if user.last_login else None
             })
         
-        return Response({
+        respuesta = {
             'users': users_data,
             'total': len(users_data),
             'filters_applied': {
@@ -475,8 +483,15 @@ def list_users(request):
                 'active': active_filter,
                 'search': search
             }
-        }, status=status.HTTP_200_OK)
+        }
+        if page is not None:
+            respuesta['next'] = paginator.get_next_link()
+            respuesta['previous'] = paginator.get_previous_link()
+        
+        return Response(respuesta, status=status.HTTP_200_OK)
         
+    except NotFound as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response(
             {'error': 'Error al obtener lista de usuarios', 'detail': str(e)}, 
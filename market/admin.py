@@ -8,6 +8,9 @@ admin.site.register(OrderDetail)
 admin.site.register(Pay)
 admin.site.register(Category)
 admin.site.register(Shipment)
+admin.site.register(SyncJob)
+admin.site.register(ReservaStock)
+admin.site.register(NotificacionMP)
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -0,0 +1,63 @@
+"""
+Cache de respuestas del catálogo público (listado y detalle de productos)
+
+Las claves incluyen una "versión de catálogo" que se incrementa cada vez que
+cambia algo visible en el catálogo (sync, precios, visibilidad, stock,
+categorías). Al cambiar la versión, las respuestas viejas dejan de usarse
+y vencen solas por TTL.
+"""
+
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 30)
+
+
+def get_catalog_version():
+    """Versión actual del catálogo (la inicializa si no existe)"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalida todas las respuestas cacheadas del catálogo"""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # La clave no existía (cache vacío o reiniciado)
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def is_cacheable(request):
+    """
+    Solo se cachea lo que ven anónimos y clientes: admin y operadores
+    ven productos desactivados y siempre consultan la BD.
+    """
+    user = request.user
+    return not (user and user.is_authenticated and getattr(user, 'role', None) in ['admin', 'operator'])
+
+
+def cache_key(scope, request, **extra):
+    """
+    Clave de cache para una respuesta del catálogo, a partir de los query params
+    normalizados (ordenados, sin valores vacíos) y del host (las URLs de
+    paginación son absolutas).
+    """
+    params = sorted(
+        (clave, valor.strip())
+        for clave, valores in request.query_params.lists()
+        for valor in valores
+        if valor.strip()
+    )
+    partes = [request.get_host(), scope] + [f"{k}={v}" for k, v in sorted(extra.items())] + [f"{k}={v}" for k, v in params]
+    digest = hashlib.md5('&'.join(partes).encode('utf-8')).hexdigest()
+    return f"catalog:v{get_catalog_version()}:{scope}:{digest}"
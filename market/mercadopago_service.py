@@ -3,7 +3,12 @@ import mercadopago
 from django.conf import settings
 from django.core.cache import cache
 from decimal import Decimal
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import os
+import requests
+import threading
 
 FRONT_URL = os.getenv("FRONT_URL")
 
@@ -19,6 +24,89 @@ if not BACK_URL:
 
 BACK_URL = BACK_URL.rstrip("/")
 
+# URL base que usa el SDK (se reemplaza por MERCADOPAGO_API_URL, p. ej. el servidor fake de los tests)
+MP_API_URL = "https://api.mercadopago.com"
+
+
+class PooledHttpClient(HttpClient):
+    """
+    HttpClient del SDK con una sesión HTTP compartida.
+
+    El cliente por defecto del SDK abre una requests.Session (conexión TCP +
+    handshake TLS) en cada llamada. Acá la sesión vive lo que el proceso, con
+    keep-alive y un pool de conexiones, timeouts propios y la política de
+    reintentos montada una sola vez en el adapter.
+    """
+
+    def __init__(self, base_url='', timeout=(3.05, 10), max_retries=2, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Reintentos ante fallas de conexión y 429/5xx; los POST solo se
+        # reintentan si no llegaron a enviarse (no duplicar preferencias)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        if self.base_url and url.startswith(MP_API_URL):
+            url = self.base_url + url[len(MP_API_URL):]
+        # Timeout (conexión, lectura) propio en lugar del de RequestOptions (60s)
+        kwargs['timeout'] = self.timeout
+        api_result = self.session.request(method, url, **kwargs)
+        return {
+            "status": api_result.status_code,
+            "response": api_result.json()
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_sdk = None
+_sdk_config = None
+_sdk_lock = threading.Lock()
+
+
+def _config_cliente():
+    return (
+        settings.MERCADOPAGO_ACCESS_TOKEN,
+        getattr(settings, 'MERCADOPAGO_API_URL', ''),
+        (getattr(settings, 'MERCADOPAGO_CONNECT_TIMEOUT', 3.05), getattr(settings, 'MERCADOPAGO_READ_TIMEOUT', 10)),
+        getattr(settings, 'MERCADOPAGO_MAX_RETRIES', 2),
+        getattr(settings, 'MERCADOPAGO_POOL_SIZE', 10),
+    )
+
+
+def get_sdk():
+    """
+    SDK de Mercado Pago compartido por el proceso (se recrea si cambia la configuración)
+    
+    Returns:
+        mercadopago.SDK con PooledHttpClient
+    """
+    global _sdk, _sdk_config
+    config = _config_cliente()
+    with _sdk_lock:
+        if _sdk is None or _sdk_config != config:
+            access_token, base_url, timeout, max_retries, pool_size = config
+            if _sdk is not None:
+                _sdk.http_client.close()
+            http_client = PooledHttpClient(base_url, timeout, max_retries, pool_size)
+            _sdk = mercadopago.SDK(access_token, http_client=http_client)
+            _sdk_config = config
+        return _sdk
+
+
 def create_preference(order_data, request=None):
     """
     Crea una preferencia de pago en Mercado Pago
@@ -34,8 +122,8 @@ def create_preference(order_data, request=None):
     Returns:
         dict con preference_id e init_point
     """
-    # Inicializar SDK de Mercado Pago
-    sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
+    # SDK compartido (conexiones reutilizadas entre llamadas)
+    sdk = get_sdk()
     
     # Preparar items para MP
     items = []
@@ -106,7 +194,7 @@ def process_payment_notification(payment_id):
     Returns:
         dict con información del pago
     """
-    sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
+    sdk = get_sdk()
     
     # Obtener información del pago
     payment_info = sdk.payment().get(payment_id)
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-17 20:35
+
+from django.db import migrations, models
+from django.db.models import Case, F, Q, Value, When
+
+
+def calcular_en_stock(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    Product.objects.update(
+        en_stock=Case(
+            When(Q(stock_ilimitado=True) | Q(stock_proveedor__gt=F('stock_vendido')), then=Value(True)),
+            default=Value(False),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_order_codigo_descuento_usado_order_dni_invitado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='en_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(calcular_en_stock, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['en_stock', 'desactivado', 'categoria', 'precio'], name='product_disp_cat_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['en_stock', 'desactivado', 'categoria', '-id'], name='product_disp_cat_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['en_stock', 'desactivado', 'precio'], name='product_disp_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['en_stock', 'desactivado', '-id'], name='product_disp_id_idx'),
+        ),
+    ]
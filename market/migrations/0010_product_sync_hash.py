@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_product_en_stock_product_product_disp_cat_precio_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sync_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0011_syncjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('propietario', models.CharField(blank=True, default='', max_length=200)),
+                ('expira', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Scheduler Lock',
+                'verbose_name_plural': 'Scheduler Locks',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0012_schedulerlock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='desactivado_por_sync',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sync_generacion',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-17 20:50
+
+from django.db import migrations, models
+import re
+import unicodedata
+
+
+def normalizar_texto(texto):
+    """
+    Copia de market.search.normalizar_texto al momento de esta migración
+    (las migraciones no importan código de la app, que puede cambiar)
+    """
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', texto.lower()).split())
+
+
+def calcular_busqueda(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    productos = []
+    for producto in Product.objects.only('id', 'nombre', 'descripcion').iterator(chunk_size=500):
+        producto.busqueda_nombre = normalizar_texto(producto.nombre)
+        producto.busqueda_descripcion = normalizar_texto(producto.descripcion)
+        productos.append(producto)
+    Product.objects.bulk_update(productos, ['busqueda_nombre', 'busqueda_descripcion'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0013_product_sync_generacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='busqueda_descripcion',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='busqueda_nombre',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(calcular_busqueda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 20:52
+
+from django.db import migrations, models
+import re
+import unicodedata
+
+
+def normalizar_texto(texto):
+    """
+    Copia de market.search.normalizar_texto al momento de esta migración
+    (las migraciones no importan código de la app, que puede cambiar)
+    """
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', texto.lower()).split())
+
+# Hasta el próximo sync (que trae la subcategoría real), deducir la marca del nombre
+# como lo hacía el filtro anterior. Las compuestas primero: "Casio G-Shock" es G-SHOCK.
+MARCAS = [
+    'G-SHOCK', 'PATEK PHILIPPE', 'RICHARD MILLE', 'AUDEMARS PIGUET', 'TAG HEUER',
+    'ROLEX', 'HUBLOT', 'CASIO', 'TOMI', 'BINBOND', 'CHENXI',
+]
+
+
+def deducir_marca(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    productos = []
+    for producto in Product.objects.only('id', 'nombre').iterator(chunk_size=500):
+        nombre = producto.nombre.upper()
+        marca = next((m for m in MARCAS if m in nombre), '')
+        if marca:
+            producto.marca = marca
+            producto.busqueda_nombre = normalizar_texto(f"{producto.nombre} {marca}")
+            productos.append(producto)
+    Product.objects.bulk_update(productos, ['marca', 'busqueda_nombre'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0014_product_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='marca',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(deducir_marca, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['en_stock', 'desactivado', 'marca'], name='product_disp_marca_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 20:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0016_reservastock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionMP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('topic', models.CharField(max_length=50)),
+                ('recurso_id', models.CharField(db_index=True, max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('procesada', 'Procesada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, default='', max_length=32)),
+                ('tomada', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('recibida', models.DateTimeField(auto_now_add=True)),
+                ('procesada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Notificación MP',
+                'verbose_name_plural': 'Notificaciones MP',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='notif_mp_estado_prox_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-17 21:07
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def _suma(modelo, filtro, campo, output_field):
+    """Subquery con la suma de `campo` de las filas relacionadas al pedido"""
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(**{filtro: OuterRef('pk')})
+            .order_by().values(filtro).annotate(total=Sum(campo)).values('total')[:1],
+            output_field=output_field,
+        ),
+        0,
+        output_field=output_field,
+    )
+
+
+def calcular_totales(apps, schema_editor):
+    # Un UPDATE por campo sobre todos los pedidos; total no se toca (ya incluye envío y descuento)
+    Order = apps.get_model('market', 'Order')
+    OrderDetail = apps.get_model('market', 'OrderDetail')
+    UsoCodigoDescuento = apps.get_model('market', 'UsoCodigoDescuento')
+    decimal = DecimalField(max_digits=10, decimal_places=2)
+    Order.objects.update(
+        subtotal=_suma(OrderDetail, 'pedido', 'subtotal', decimal),
+        cantidad_items=_suma(OrderDetail, 'pedido', 'cantidad', IntegerField()),
+        descuento=_suma(UsoCodigoDescuento, 'orden', 'monto_descuento', decimal),
+    )
+    porcentaje = UsoCodigoDescuento.objects.filter(orden=OuterRef('pk')).order_by('-fecha_uso')
+    Order.objects.filter(codigos_usados__isnull=False).update(
+        porcentaje_descuento=Subquery(porcentaje.values('codigo__porcentaje_descuento')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0017_notificacionmp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='cantidad_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='porcentaje_descuento',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
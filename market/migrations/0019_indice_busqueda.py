@@ -0,0 +1,89 @@
+"""
+Índice de búsqueda de productos según la BD (ver market/search.py)
+
+- PostgreSQL: columna tsvector generada con índice GIN y, si se puede crear
+  la extensión, índice de trigramas (pg_trgm) sobre el nombre.
+- MySQL: índices FULLTEXT (InnoDB) sobre nombre + descripción y sobre el nombre.
+- SQLite: tabla FTS5 de contenido externo, mantenida con triggers.
+
+El SQL está copiado acá a propósito: la migración no depende de market.search.
+"""
+
+from django.db import migrations, transaction
+
+TABLA = 'market_product'
+FTS_TABLE = 'market_product_fts'
+PG_VECTOR_COLUMN = 'busqueda_vector'
+COLUMNAS = 'busqueda_nombre, busqueda_descripcion'
+
+
+def _sqlite():
+    nuevas = 'new.busqueda_nombre, new.busqueda_descripcion'
+    viejas = 'old.busqueda_nombre, old.busqueda_descripcion'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{COLUMNAS}, content='{TABLA}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLA} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNAS}) VALUES (new.id, {nuevas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLA} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNAS}) VALUES ('delete', old.id, {viejas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {COLUMNAS} ON {TABLA} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNAS}) VALUES ('delete', old.id, {viejas}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNAS}) VALUES (new.id, {nuevas}); END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def crear_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in _sqlite():
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"ALTER TABLE {TABLA} ADD COLUMN IF NOT EXISTS {PG_VECTOR_COLUMN} tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(busqueda_nombre, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(busqueda_descripcion, '')), 'B')) STORED"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS product_busqueda_vector_idx ON {TABLA} USING gin ({PG_VECTOR_COLUMN})"
+        )
+        try:
+            # Savepoint: sin permiso para crear pg_trgm la búsqueda funciona igual, sin tolerancia a errores de tipeo
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                schema_editor.execute(
+                    f"CREATE INDEX IF NOT EXISTS product_busqueda_nombre_trgm_idx "
+                    f"ON {TABLA} USING gin (busqueda_nombre gin_trgm_ops)"
+                )
+        except Exception:
+            pass
+    elif vendor == 'mysql':
+        schema_editor.execute(f"CREATE FULLTEXT INDEX product_busqueda_ft_idx ON {TABLA} ({COLUMNAS})")
+        schema_editor.execute(f"CREATE FULLTEXT INDEX product_busqueda_nombre_ft_idx ON {TABLA} (busqueda_nombre)")
+
+
+def borrar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sufijo in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{sufijo}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS product_busqueda_nombre_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS product_busqueda_vector_idx")
+        schema_editor.execute(f"ALTER TABLE {TABLA} DROP COLUMN IF EXISTS {PG_VECTOR_COLUMN}")
+    elif vendor == 'mysql':
+        schema_editor.execute(f"DROP INDEX product_busqueda_nombre_ft_idx ON {TABLA}")
+        schema_editor.execute(f"DROP INDEX product_busqueda_ft_idx ON {TABLA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0018_totales_pedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
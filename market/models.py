@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Prefetch, Q, Sum, Value, When
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from account_admin.models import User
+from .search import normalizar_texto
+from decimal import Decimal
 
 # Create your models here.
 class Category(models.Model):
@@ -16,11 +19,41 @@ class Category(models.Model):
         verbose_name = "Category"  
         verbose_name_plural = "Categories"  
 
+# Condición de stock disponible, reutilizable en filtros y en UPDATEs masivos
+CONDICION_EN_STOCK = Q(stock_ilimitado=True) | Q(stock_proveedor__gt=F('stock_vendido'))
+
+# Campos de los que depende Product.en_stock
+CAMPOS_STOCK = {'stock_proveedor', 'stock_vendido', 'stock_ilimitado'}
+
+def _decimal(valor):
+    """Los defaults numéricos (0.00) quedan como float hasta que se relee de la BD"""
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor))
+
+# Campos de los que depende el texto indexado para búsqueda (ver market/search.py)
+CAMPOS_BUSQUEDA = {'nombre', 'marca', 'descripcion'}
+
+
+class ProductQuerySet(models.QuerySet):
+    def disponibles(self):
+        """Productos con stock disponible (usa la columna indexada en_stock)"""
+        return self.filter(en_stock=True)
+
+    def actualizar_en_stock(self):
+        """
+        Recalcula en_stock en un solo UPDATE.
+        Usar después de modificar stock con .update() o F(), que no pasan por save().
+        """
+        return self.update(
+            en_stock=Case(When(CONDICION_EN_STOCK, then=Value(True)), default=Value(False))
+        )
+
+
 class Product(models.Model):
     # Información básica
     nombre = models.CharField(max_length=250)
     descripcion = models.TextField()
     slug = models.SlugField(max_length=300, unique=True, blank=True)
+    marca = models.CharField(max_length=100, blank=True, default='')  # Subcategoría del proveedor (G-SHOCK, ROLEX...)
     
     # Precios
     precio = models.DecimalField(max_digits=10, decimal_places=2)
@@ -36,6 +69,8 @@ class Product(models.Model):
     stock_proveedor = models.PositiveIntegerField(default=0)  # Stock del proveedor
     stock_vendido = models.PositiveIntegerField(default=0)  # Stock que ya vendiste
     stock_ilimitado = models.BooleanField(default=False)  # Si el proveedor tiene stock infinito
+    # Materializado de CONDICION_EN_STOCK para que el listado pueda usar índices
+    en_stock = models.BooleanField(default=False, editable=False)
     
     # Categoría e imágenes
     categoria = models.ForeignKey(Category, on_delete=models.CASCADE)
@@ -46,9 +81,18 @@ class Product(models.Model):
     external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
     external_url = models.URLField(max_length=500, null=True, blank=True)
     last_sync = models.DateTimeField(null=True, blank=True)
+    sync_hash = models.CharField(max_length=64, blank=True, default='', editable=False)  # Huella del contenido del proveedor
+    sync_generacion = models.PositiveBigIntegerField(default=0, db_index=True, editable=False)  # Última corrida de sync que lo vio
     
     # Control
     desactivado = models.BooleanField(default=False)
+    desactivado_por_sync = models.BooleanField(default=False, editable=False)  # Lo ocultó el sync (no el admin)
+    
+    # Búsqueda: texto normalizado (minúsculas, sin acentos) que indexa market/search.py
+    busqueda_nombre = models.TextField(blank=True, default='', editable=False)
+    busqueda_descripcion = models.TextField(blank=True, default='', editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     @property
     def stock_disponible(self):
@@ -69,6 +113,16 @@ class Product(models.Model):
             return self.imagenes[0]
         return None
 
+    def calcular_en_stock(self):
+        """Recalcula en_stock en memoria (bulk_create/bulk_update no llaman a save())"""
+        self.en_stock = self.stock_ilimitado or self.stock_proveedor > self.stock_vendido
+        return self.en_stock
+
+    def calcular_busqueda(self):
+        """Recalcula en memoria el texto indexado para búsqueda"""
+        self.busqueda_nombre = normalizar_texto(f"{self.nombre} {self.marca}")
+        self.busqueda_descripcion = normalizar_texto(self.descripcion)
+
     def save(self, *args, **kwargs):
         # Auto-generar slug si no existe
         if not self.slug:
@@ -80,6 +134,19 @@ class Product(models.Model):
                 slug = f"{base_slug}-{counter}"
                 counter += 1
             self.slug = slug
+
+        # Mantener sincronizadas las columnas derivadas (disponibilidad y búsqueda)
+        self.calcular_en_stock()
+        self.calcular_busqueda()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            derivados = set()
+            if CAMPOS_STOCK.intersection(update_fields):
+                derivados.add('en_stock')
+            if CAMPOS_BUSQUEDA.intersection(update_fields):
+                derivados.update(['busqueda_nombre', 'busqueda_descripcion'])
+            if derivados:
+                kwargs['update_fields'] = set(update_fields) | derivados
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -91,6 +158,12 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['external_id']),
             models.Index(fields=['slug']),
+            # Formas reales del listado público: disponibilidad + categoría + orden
+            models.Index(fields=['en_stock', 'desactivado', 'categoria', 'precio'], name='product_disp_cat_precio_idx'),
+            models.Index(fields=['en_stock', 'desactivado', 'categoria', '-id'], name='product_disp_cat_id_idx'),
+            models.Index(fields=['en_stock', 'desactivado', 'precio'], name='product_disp_precio_idx'),
+            models.Index(fields=['en_stock', 'desactivado', '-id'], name='product_disp_id_idx'),
+            models.Index(fields=['en_stock', 'desactivado', 'marca'], name='product_disp_marca_idx'),
         ]  
 
 class Order(models.Model):
@@ -123,25 +196,59 @@ class Order(models.Model):
     zona_envio = models.CharField(max_length=100, blank=True, default='')
     metodo_pago = models.CharField(max_length=50, blank=True, default='')
     codigo_descuento_usado = models.CharField(max_length=50, blank=True, default='')
+    
+    # Totales desnormalizados: los mantiene OrderDetail.save()/delete() en la misma transacción
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))  # Suma de subtotales de los detalles
+    cantidad_items = models.PositiveIntegerField(default=0)  # Suma de cantidades de los detalles
+    # Descuento aplicado al comprar (copia: el código puede cambiar o borrarse después)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    porcentaje_descuento = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.00'))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado leído de la BD: save() detecta la cancelación sin volver a consultar
+        instancia._estado_original = instancia.__dict__.get('estado')
+        return instancia
+
+    def calcular_total(self):
+        """Total a partir de los totales desnormalizados (sin leer los detalles)"""
+        return _decimal(self.subtotal) - _decimal(self.descuento) + _decimal(self.costo_envio)
 
     def total_update(self):
-        subtotal = sum(detalle.subtotal for detalle in self.detalles.all())
-        self.total = subtotal + self.costo_envio
-        self.save()
+        self.total = self.calcular_total()
+        self.save(update_fields=['total'])
+
+    def recalcular_totales(self):
+        """
+        Recalcula subtotal y cantidad_items desde los detalles (una query).
+        Solo hace falta si los detalles se tocaron con operaciones en bloque.
+        """
+        agregados = self.detalles.aggregate(subtotal=Sum('subtotal'), cantidad=Sum('cantidad'))
+        self.subtotal = agregados['subtotal'] or Decimal('0.00')
+        self.cantidad_items = agregados['cantidad'] or 0
+        self.total = self.calcular_total()
+        self.save(update_fields=['subtotal', 'cantidad_items', 'total'])
 
     def save(self, *args, **kwargs):
-        if self.pk:  # Solo si el pedido ya existe
-            pedido_anterior = Order.objects.get(pk=self.pk)
-            if pedido_anterior.estado != 'cancelado' and self.estado == 'cancelado':
-                # Si el pedido se cancela, devolver stock vendido
-                for detalle in self.detalles.all():
-                    detalle.producto.stock_vendido -= detalle.cantidad
-                    # Asegurar que no sea negativo
-                    if detalle.producto.stock_vendido < 0:
-                        detalle.producto.stock_vendido = 0
-                    detalle.producto.save()
-
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        cancelando = (
+            not self._state.adding
+            and self.estado == 'cancelado'
+            and getattr(self, '_estado_original', None) != 'cancelado'
+            and (update_fields is None or 'estado' in update_fields)
+        )
+        # Solo un save gana la transición a cancelado (UPDATE condicional, sin leer el estado anterior)
+        if cancelando:
+            from .stock import liberar_pedidos
+            with transaction.atomic():
+                if Order.objects.filter(pk=self.pk).exclude(estado='cancelado').update(estado='cancelado'):
+                    # Si el pedido se cancela, devolver stock vendido (un UPDATE para todos los productos)
+                    liberar_pedidos([self.pk])
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self._estado_original = self.estado
 
     def __str__(self):
         username = self.usuario.username if self.usuario else "None"
@@ -157,9 +264,50 @@ class OrderDetail(models.Model):
     cantidad = models.PositiveIntegerField()
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores guardados: save()/delete() ajustan los totales del pedido por diferencia
+        instancia._guardado = (instancia.__dict__.get('subtotal'), instancia.__dict__.get('cantidad'))
+        return instancia
+
+    def _actualizar_pedido(self, subtotal, cantidad):
+        """Suma (o resta) al pedido con un UPDATE con F(), sin leer sus detalles"""
+        if not subtotal and not cantidad:
+            return
+        Order.objects.filter(pk=self.pedido_id).update(
+            subtotal=F('subtotal') + subtotal,
+            cantidad_items=F('cantidad_items') + cantidad,
+            total=F('total') + subtotal,
+        )
+        # Mantener al día el pedido en memoria si ya estaba cargado
+        if OrderDetail.pedido.is_cached(self):
+            self.pedido.subtotal = _decimal(self.pedido.subtotal) + subtotal
+            self.pedido.cantidad_items += cantidad
+            self.pedido.total = _decimal(self.pedido.total) + subtotal
+
+    def _valores_guardados(self):
+        if self._state.adding:
+            return Decimal('0.00'), 0
+        guardado = getattr(self, '_guardado', None)
+        if guardado is None or None in guardado:
+            guardado = OrderDetail.objects.values_list('subtotal', 'cantidad').get(pk=self.pk)
+        return guardado
+
     def save(self, *args, **kwargs):
         self.subtotal = self.producto.precio * self.cantidad
-        super().save(*args, **kwargs)
+        subtotal_anterior, cantidad_anterior = self._valores_guardados()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._actualizar_pedido(_decimal(self.subtotal) - subtotal_anterior, self.cantidad - cantidad_anterior)
+        self._guardado = (_decimal(self.subtotal), self.cantidad)
+
+    def delete(self, *args, **kwargs):
+        subtotal, cantidad = self._valores_guardados()
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            self._actualizar_pedido(-subtotal, -cantidad)
+        return resultado
 
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre} (Pedido {self.pedido.id})"
@@ -168,6 +316,42 @@ class OrderDetail(models.Model):
         verbose_name = "Order Detail"  
         verbose_name_plural = "Order Details"
 
+class ReservaStock(models.Model):
+    """
+    Unidades de un pedido de Mercado Pago apartadas hasta `expira`.
+
+    El stock ya está sumado en Product.stock_vendido mientras la reserva está
+    activa. Si el pago se aprueba la reserva pasa a confirmada (venta); si
+    vence sin pagar, el barrido del scheduler devuelve el stock y cancela el
+    pedido (ver market/stock.py).
+    """
+    ACTIVA = 'activa'
+    CONFIRMADA = 'confirmada'
+    LIBERADA = 'liberada'
+    ESTADOS = [
+        (ACTIVA, 'Activa'),
+        (CONFIRMADA, 'Confirmada'),
+        (LIBERADA, 'Liberada'),
+    ]
+
+    pedido = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservas')
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ACTIVA)
+    expira = models.DateTimeField()
+    creada = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reserva {self.cantidad} x {self.producto_id} - Pedido {self.pedido_id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+        indexes = [
+            # Barrido de reservas vencidas
+            models.Index(fields=['estado', 'expira'], name='reserva_estado_expira_idx'),
+        ]
+
 class Pay(models.Model):
     ESTADOS = [
         ('pendiente', 'Pendiente'),
@@ -216,7 +400,7 @@ class Pay(models.Model):
         # Actualizar estado del pedido si aún estaba pendiente
         if self.pedido.estado in ['pendiente', 'en_revision']:
             self.pedido.estado = 'pagado'
-            self.pedido.save()
+            self.pedido.save(update_fields=['estado'])
 
     def fail(self):
         if self.estado not in ['pendiente', 'en_revision']:
@@ -253,27 +437,116 @@ class Shipment(models.Model):
         verbose_name = "Shipment"  
         verbose_name_plural = "Shipments"
     
+class CartQuerySet(models.QuerySet):
+    def con_items(self):
+        """Precarga los items con producto y categoría en una sola query (JOIN)"""
+        return self.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('producto__categoria').order_by('id'))
+        )
+
+
 class Cart(models.Model):
     """Modelo para representar el carrito de compras de un usuario"""
     usuario = models.OneToOneField(User, on_delete=models.CASCADE)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Carrito de {self.usuario.username}"
     
+    def totales(self):
+        """
+        Total y cantidad de items del carrito.
+        Con los items precargados (Cart.objects.con_items()) es una sola pasada
+        en memoria; si no, una sola query de agregación.
+
+        Returns:
+            tuple: (total, cantidad_items)
+        """
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            total, cantidad = Decimal('0.00'), 0
+            for item in self.items.all():
+                total += item.subtotal()
+                cantidad += item.cantidad
+            return total, cantidad
+        agregados = self.items.aggregate(
+            total=Sum(F('cantidad') * F('producto__precio')),
+            cantidad=Sum('cantidad'),
+        )
+        return agregados['total'] or Decimal('0.00'), agregados['cantidad'] or 0
+    
     def total(self):
         """Calcula el total del carrito"""
-        return sum(item.subtotal() for item in self.items.all())
+        return self.totales()[0]
     
     def cantidad_items(self):
         """Obtiene la cantidad total de items en el carrito"""
-        return sum(item.cantidad for item in self.items.all())
+        return self.totales()[1]
     
     def limpiar(self):
         """Elimina todos los items del carrito"""
         self.items.all().delete()
     
+    def agregar_lote(self, cantidades, reemplazar=False):
+        """
+        Agrega varios productos al carrito en una transacción, todos o ninguno:
+        se leen en bloque los items del carrito y los productos para validar
+        el stock de todas las líneas, un UPDATE en bloque actualiza los items existentes y un
+        INSERT en bloque crea los nuevos. No usa upsert (ON CONFLICT con
+        columnas destino no existe en MySQL): el lock del carrito alcanza.
+        
+        Args:
+            cantidades: dict producto_id -> cantidad a agregar (> 0)
+            reemplazar: Si es True la cantidad pisa la del carrito; si no, se suma
+        
+        Returns:
+            list: Líneas sin stock ({producto_id, nombre, solicitado, disponible}).
+                  Vacía si se guardó todo.
+        """
+        with transaction.atomic():
+            # Dos lotes sobre el mismo carrito se serializan: la cantidad leída no queda vieja
+            list(Cart.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+            existentes = {
+                item.producto_id: item
+                for item in CartItem.objects.filter(carrito=self, producto_id__in=list(cantidades)).only('producto_id', 'cantidad')
+            }
+            # Los productos desactivados no están en el catálogo: se informan como inexistentes
+            productos = Product.objects.filter(desactivado=False).only(
+                'nombre', 'stock_proveedor', 'stock_vendido', 'stock_ilimitado'
+            ).in_bulk(list(cantidades))
+            
+            faltantes = []
+            nuevos = []
+            actualizados = []
+            for producto_id, cantidad in cantidades.items():
+                producto = productos.get(producto_id)
+                item = existentes.get(producto_id)
+                if item is not None and not reemplazar:
+                    cantidad += item.cantidad
+                disponible = producto.stock_disponible if producto else 0
+                if cantidad > disponible:
+                    faltantes.append({
+                        'producto_id': producto_id,
+                        'nombre': producto.nombre if producto else f'#{producto_id}',
+                        'solicitado': cantidad,
+                        'disponible': disponible,
+                    })
+                elif item is not None:
+                    item.cantidad = cantidad
+                    actualizados.append(item)
+                else:
+                    nuevos.append(CartItem(carrito=self, producto_id=producto_id, cantidad=cantidad))
+            if faltantes:
+                return faltantes
+            
+            if actualizados:
+                CartItem.objects.bulk_update(actualizados, ['cantidad'])
+            if nuevos:
+                CartItem.objects.bulk_create(nuevos)
+        return []
+    
     class Meta:
         verbose_name = "Carrito"
         verbose_name_plural = "Carritos"
@@ -379,17 +652,21 @@ class CodigoDescuento(models.Model):
         return True, "Código válido"
     
     def registrar_uso(self, orden, usuario=None, monto_descuento=0):
-        """Registra el uso del código"""
-        from decimal import Decimal
-        self.usos_actuales += 1
-        self.save(update_fields=['usos_actuales'])
-        
-        UsoCodigoDescuento.objects.create(
-            codigo=self,
-            orden=orden,
-            usuario=usuario,
-            monto_descuento=Decimal(str(monto_descuento))
-        )
+        """Registra el uso del código y guarda en la orden una copia del descuento aplicado"""
+        with transaction.atomic():
+            CodigoDescuento.objects.filter(pk=self.pk).update(usos_actuales=F('usos_actuales') + 1)
+            self.usos_actuales += 1
+            
+            UsoCodigoDescuento.objects.create(
+                codigo=self,
+                orden=orden,
+                usuario=usuario,
+                monto_descuento=Decimal(str(monto_descuento))
+            )
+            
+            orden.descuento = Decimal(str(monto_descuento))
+            orden.porcentaje_descuento = self.porcentaje_descuento
+            orden.save(update_fields=['descuento', 'porcentaje_descuento'])
     
     class Meta:
         verbose_name = "Código de Descuento"
@@ -412,3 +689,120 @@ class UsoCodigoDescuento(models.Model):
         verbose_name = "Uso de Código"
         verbose_name_plural = "Usos de Códigos"
         ordering = ['-fecha_uso']
+
+
+class SyncJob(models.Model):
+    """Ejecución de la sincronización de productos externos (encolada en el scheduler)"""
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('completado', 'Completado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    creado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    # Progreso
+    categorias_completadas = models.PositiveIntegerField(default=0)
+    paginas_obtenidas = models.PositiveIntegerField(default=0)
+    filas_escritas = models.PositiveIntegerField(default=0)
+
+    # Estadísticas finales (dict devuelto por sync_external_products)
+    resultado = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Sync {self.id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Sync Job"
+        verbose_name_plural = "Sync Jobs"
+        ordering = ['-fecha_creacion']
+
+
+class NotificacionMP(models.Model):
+    """
+    Notificación de Mercado Pago recibida por el webhook, pendiente de procesar.
+
+    El webhook solo la guarda (deduplicada por `clave`) y responde; el worker
+    de market/mp_inbox.py consulta el pago en MP y aplica el resultado.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('procesada', 'Procesada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    # Id de la notificación (o x-request-id); las reentregas de MP repiten la misma clave
+    clave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    topic = models.CharField(max_length=50)
+    recurso_id = models.CharField(max_length=100, db_index=True)  # payment id en MP
+    payload = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True, default='')  # Pasada del worker que la tomó
+    tomada = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    recibida = models.DateTimeField(auto_now_add=True)
+    procesada = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"MP {self.topic} {self.recurso_id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Notificación MP"
+        verbose_name_plural = "Notificaciones MP"
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='notif_mp_estado_prox_idx'),
+        ]
+
+
+class SchedulerLock(models.Model):
+    """
+    Lock con vencimiento (lease) guardado en BD para que un solo proceso
+    (el líder) ejecute los jobs programados. Funciona igual en SQLite,
+    PostgreSQL y MySQL: tomarlo es un UPDATE condicional.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    propietario = models.CharField(max_length=200, blank=True, default='')
+    expira = models.DateTimeField()
+
+    @classmethod
+    def adquirir(cls, nombre, propietario, ttl):
+        """
+        Toma o renueva el lock si está libre, vencido o ya es nuestro.
+        Returns: bool (True si `propietario` quedó como dueño)
+        """
+        ahora = timezone.now()
+        tomado = cls.objects.filter(nombre=nombre).filter(
+            Q(propietario=propietario) | Q(expira__lt=ahora)
+        ).update(propietario=propietario, expira=ahora + ttl)
+        if tomado:
+            return True
+        try:
+            with transaction.atomic():
+                cls.objects.create(nombre=nombre, propietario=propietario, expira=ahora + ttl)
+            return True
+        except IntegrityError:
+            # Existe y lo tiene otro proceso vigente
+            return False
+
+    @classmethod
+    def liberar(cls, nombre, propietario):
+        """Suelta el lock (si es nuestro) para que otro proceso lo tome enseguida"""
+        cls.objects.filter(nombre=nombre, propietario=propietario).update(
+            propietario='', expira=timezone.now()
+        )
+
+    def __str__(self):
+        return f"{self.nombre} ({self.propietario or 'libre'})"
+
+    class Meta:
+        verbose_name = "Scheduler Lock"
+        verbose_name_plural = "Scheduler Locks"
@@ -0,0 +1,239 @@
+"""
+Bandeja de notificaciones de Mercado Pago
+
+El webhook no consulta a MP dentro del request: guarda la notificación
+(deduplicada por su id, así las reentregas de MP no se procesan dos veces),
+responde 200 y despierta al worker. El worker:
+
+- toma las notificaciones pendientes agrupadas por payment id, de modo que
+  N avisos del mismo pago se resuelven con una sola consulta a MP,
+- aplica el estado del pago al pedido (idempotente),
+- si la consulta falla, reintenta con backoff exponencial hasta
+  MP_INBOX_MAX_INTENTOS y después la deja como fallida.
+
+Corre como job del scheduler en el líder y, además, en el proceso que recibió
+el webhook si tiene el scheduler activo. Tomar un pago es un UPDATE
+condicional, así que dos workers no procesan el mismo pago a la vez.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from market.mercadopago_service import process_payment_notification
+from market.models import NotificacionMP, Order, Pay
+from market.stock import confirmar_reservas, extender_reservas
+from market.telegram import send_order_paid_notification
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Pagos distintos que se procesan por pasada
+LOTE = 50
+# Una notificación 'procesando' más vieja que esto se considera abandonada (murió el worker)
+LEASE = timedelta(minutes=5)
+
+
+def max_intentos():
+    return getattr(settings, 'MP_INBOX_MAX_INTENTOS', 8)
+
+
+def backoff(intentos):
+    """Espera antes del próximo reintento: 30s, 1m, 2m, ... hasta 1h"""
+    base = getattr(settings, 'MP_INBOX_BACKOFF_SECONDS', 30)
+    return timedelta(seconds=min(base * 2 ** (intentos - 1), 60 * 60))
+
+
+def clave_notificacion(request):
+    """
+    Clave de deduplicación: id de la notificación (webhooks) o x-request-id.
+    None si MP no mandó ninguno (IPN sin headers): se guarda igual y el
+    worker la agrupa con las demás del mismo pago.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    if data.get('id'):
+        return f"n:{data['id']}"
+    request_id = request.headers.get('X-Request-Id')
+    if request_id:
+        return f"r:{request_id}"
+    return None
+
+
+def registrar_notificacion(request):
+    """
+    Guarda la notificación del webhook (un INSERT; si ya existe no hace nada)
+
+    Returns:
+        bool: True si hay un pago para procesar
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    topic = request.query_params.get('topic') or data.get('type')
+    resource_id = request.query_params.get('id') or (data.get('data') or {}).get('id')
+
+    logger.info(f"Webhook MP - Topic: {topic}, ID: {resource_id}")
+
+    if topic != 'payment' or not resource_id:
+        return False
+
+    NotificacionMP.objects.bulk_create([
+        NotificacionMP(
+            clave=clave_notificacion(request),
+            topic=topic,
+            recurso_id=str(resource_id),
+            payload={'query': request.query_params.dict(), 'data': data},
+        )
+    ], ignore_conflicts=True)
+    return True
+
+
+def despertar_worker():
+    """Procesa la bandeja enseguida si este proceso tiene el scheduler corriendo"""
+    from Velorum import scheduler
+    from apscheduler.jobstores.base import ConflictingIdError
+
+    if not scheduler.scheduler.running:
+        # Lo levanta el job periódico del líder
+        return
+    try:
+        scheduler.run_now(procesar_bandeja, 'mp_inbox_now')
+    except ConflictingIdError:
+        # Ya hay una pasada encolada que va a ver esta notificación
+        pass
+
+
+# ---- Worker ----
+
+def _tomar(recurso_id, ahora):
+    """Marca como 'procesando' las notificaciones listas del pago; devuelve el lote o None"""
+    lote = uuid.uuid4().hex
+    tomadas = NotificacionMP.objects.filter(recurso_id=recurso_id).filter(
+        Q(estado='pendiente', proximo_intento__lte=ahora) | Q(estado='procesando', tomada__lt=ahora - LEASE)
+    ).update(estado='procesando', lote=lote, tomada=ahora)
+    return lote if tomadas else None
+
+
+def procesar_bandeja(limite=LOTE):
+    """
+    Job del worker: procesa las notificaciones pendientes (una consulta a MP por pago)
+
+    Returns:
+        dict: pagos procesados, reintentos programados y fallidos
+    """
+    close_old_connections()
+    resumen = {'procesados': 0, 'reintentos': 0, 'fallidos': 0}
+    try:
+        ahora = timezone.now()
+        recursos = (
+            NotificacionMP.objects.filter(
+                Q(estado='pendiente', proximo_intento__lte=ahora) | Q(estado='procesando', tomada__lt=ahora - LEASE)
+            )
+            .order_by('recurso_id')
+            .values_list('recurso_id', flat=True)
+            .distinct()[:limite]
+        )
+        for recurso_id in list(recursos):
+            lote = _tomar(recurso_id, ahora)
+            if lote is None:
+                # Lo tomó otro worker
+                continue
+            notificaciones = NotificacionMP.objects.filter(lote=lote)
+            try:
+                payment_info = process_payment_notification(recurso_id)
+                aplicar_pago(payment_info)
+            except Exception as e:
+                intentos = max(notificaciones.values_list('intentos', flat=True)) + 1
+                if intentos >= max_intentos():
+                    logger.error(f"Notificación MP del pago {recurso_id} descartada tras {intentos} intentos: {str(e)}")
+                    notificaciones.update(estado='fallida', intentos=intentos, error=str(e), lote='')
+                    resumen['fallidos'] += 1
+                else:
+                    logger.warning(f"Error procesando el pago MP {recurso_id} (intento {intentos}): {str(e)}")
+                    notificaciones.update(
+                        estado='pendiente', intentos=intentos, error=str(e), lote='',
+                        proximo_intento=timezone.now() + backoff(intentos),
+                    )
+                    resumen['reintentos'] += 1
+                continue
+            notificaciones.update(estado='procesada', procesada=timezone.now(), error='', lote='')
+            resumen['procesados'] += 1
+    finally:
+        close_old_connections()
+
+    if any(resumen.values()):
+        logger.info(f"Bandeja MP: {resumen}")
+    return resumen
+
+
+def aplicar_pago(payment_info):
+    """
+    Aplica el estado de un pago de MP a su pedido y a su Pay (idempotente:
+    repetirlo con el mismo estado no cambia nada ni vuelve a notificar).
+
+    Args:
+        payment_info: dict devuelto por process_payment_notification
+    """
+    order_id = payment_info.get('order_id')
+    if not order_id:
+        return
+
+    with transaction.atomic():
+        try:
+            order = Order.objects.select_for_update().get(id=order_id)
+        except Order.DoesNotExist:
+            logger.error(f"Orden {order_id} no encontrada")
+            return
+
+        estado_anterior = order.estado
+        if payment_info['status'] == 'approved':
+            order.estado = 'pagado'
+            pay_estado = 'completado'
+        elif payment_info['status'] == 'pending':
+            pay_estado = 'pendiente'
+        elif payment_info['status'] in ['rejected', 'cancelled']:
+            pay_estado = 'fallido'
+        else:
+            pay_estado = 'en_revision'
+
+        if order.estado != estado_anterior:
+            order.save(update_fields=['estado'])
+
+        if payment_info['status'] == 'approved':
+            # La reserva de stock del checkout pasa a ser venta
+            confirmar_reservas(order)
+        elif payment_info['status'] == 'pending':
+            # Cupón de pago en efectivo sin pagar todavía: que el barrido no cancele el pedido
+            extender_reservas(order)
+
+        # Crear o actualizar registro de pago
+        metadata = {
+            'payment_method_id': payment_info['payment_method_id'],
+            'status_detail': payment_info['status_detail'],
+            'mp_payment_id': payment_info['payment_id']
+        }
+        pay = Pay.objects.filter(pedido=order, external_id=str(payment_info['payment_id'])).first()
+        previous_estado = pay.estado if pay else None
+        if pay is None:
+            pay = Pay.objects.create(
+                pedido=order,
+                external_id=str(payment_info['payment_id']),
+                metodo='tarjeta',
+                monto_pagado=payment_info['transaction_amount'],
+                estado=pay_estado,
+                metadata=metadata
+            )
+        else:
+            pay.estado = pay_estado
+            pay.monto_pagado = payment_info['transaction_amount']
+            pay.metadata.update(metadata)
+            pay.save()
+
+    logger.info(f"Orden {order_id} actualizada: {payment_info['status']}, Pay {'actualizado' if previous_estado else 'creado'}")
+
+    # Notificar a Telegram solo si el estado pasó a 'completado'
+    if pay_estado == 'completado' and previous_estado != 'completado':
+        try:
+            send_order_paid_notification(order)
+        except Exception:
+            logger.exception('Error al enviar notificación a Telegram')
@@ -4,10 +4,22 @@ Módulo de scraping para sincronizar productos externos
 
 import requests
 from bs4 import BeautifulSoup
+import hashlib
+import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from urllib.parse import urlparse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
 from django.utils import timezone
 from django.utils.text import slugify
 from market.models import Product, Category
+from market.catalog_cache import bump_catalog_version
 import logging
 
 logger = logging.getLogger(__name__)
@@ -68,6 +80,99 @@ CATEGORIAS_CONFIG = {
 }
 
 
+class ScrapeIncompleto(Exception):
+    """Una página de la categoría no se pudo obtener: el listado quedó incompleto"""
+
+
+class SyncProgress:
+    """
+    Contadores de avance de una sincronización (thread-safe).
+    `on_update` recibe un snapshot cada vez que se llama a notificar();
+    con forzar=False solo si pasaron `intervalo` segundos desde el último.
+    """
+
+    def __init__(self, on_update=None, intervalo=5):
+        self._lock = threading.Lock()
+        self._on_update = on_update
+        self.intervalo = intervalo
+        self._ultima_notificacion = time.monotonic()
+        self.categorias_completadas = 0
+        self.paginas_obtenidas = 0
+        self.filas_escritas = 0
+
+    def sumar(self, categorias=0, paginas=0, filas=0):
+        with self._lock:
+            self.categorias_completadas += categorias
+            self.paginas_obtenidas += paginas
+            self.filas_escritas += filas
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'categorias_completadas': self.categorias_completadas,
+                'paginas_obtenidas': self.paginas_obtenidas,
+                'filas_escritas': self.filas_escritas,
+            }
+
+    def notificar(self, forzar=True):
+        if not self._on_update:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and ahora - self._ultima_notificacion < self.intervalo:
+                return
+            self._ultima_notificacion = ahora
+        self._on_update(self.snapshot())
+
+
+def scraper_setting(nombre, default):
+    """Lee la configuración del scraper desde settings (con default)"""
+    return getattr(settings, nombre, default)
+
+
+class HostLimiter:
+    """
+    Limita la concurrencia y el ritmo de requests hacia un mismo host,
+    para no saturar al proveedor al scrapear en paralelo.
+    """
+
+    def __init__(self, max_concurrency, max_requests_per_second):
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaforo = threading.BoundedSemaphore(self.max_concurrency)
+        self._intervalo = 1.0 / max_requests_per_second if max_requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._proximo_turno = 0.0
+
+    @contextmanager
+    def slot(self):
+        """Espera un lugar libre y respeta el intervalo mínimo entre requests"""
+        with self._semaforo:
+            if self._intervalo:
+                with self._lock:
+                    ahora = time.monotonic()
+                    turno = max(ahora, self._proximo_turno)
+                    self._proximo_turno = turno + self._intervalo
+                if turno > ahora:
+                    time.sleep(turno - ahora)
+            yield
+
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(url):
+    """Devuelve el HostLimiter compartido para el host de la URL"""
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = HostLimiter(
+                scraper_setting('SCRAPER_MAX_CONCURRENCY_PER_HOST', 4),
+                scraper_setting('SCRAPER_MAX_REQUESTS_PER_SECOND', 5),
+            )
+        return _host_limiters[host]
+
+
 def get_session_and_csrf():
     """
     Crea una sesión con cookies y extrae el token CSRF
@@ -77,7 +182,14 @@ def get_session_and_csrf():
     """
     try:
         session = requests.Session()
-        response = session.get(BASE_URL, headers=BROWSER_HEADERS, timeout=15)
+        # Pool de conexiones acorde a la concurrencia (la sesión se comparte entre hilos)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=scraper_setting('SCRAPER_MAX_CONCURRENCY_PER_HOST', 4)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        with get_host_limiter(BASE_URL).slot():
+            response = session.get(BASE_URL, headers=BROWSER_HEADERS, timeout=15)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -97,21 +209,66 @@ def get_session_and_csrf():
         return None, None
 
 
-def scrape_category(session, csrf_token, category_ids, category_name):
+def fetch_category_page(session, ajax_headers, category_ids, category_name, page):
     """
-    Scrapea todos los productos de una categoría usando paginación
+    Obtiene una página de productos de una categoría
+    
+    Returns:
+        list: Productos de la página, o None si hubo un error
+    """
+    try:
+        params = {
+            'filter_page': page,
+            'filter_order': 0,
+            'filter_categories[]': category_ids
+        }
+        
+        with get_host_limiter(ENDPOINT_AJAX).slot():
+            response = session.get(
+                ENDPOINT_AJAX,
+                params=params,
+                headers=ajax_headers,
+                timeout=15
+            )
+        
+        if response.status_code != 200:
+            logger.error(f"Error {response.status_code} en página {page} de {category_name}")
+            return None
+        
+        return response.json().get('data', [])
+        
+    except Exception as e:
+        logger.error(f"Error scrapeando página {page} de {category_name}: {str(e)}")
+        return None
+
+
+def scrape_category(session, csrf_token, category_ids, category_name, progress=None):
+    """
+    Scrapea todos los productos de una categoría usando paginación.
+    La primera página se pide sola (la mayoría de las subcategorías entra en
+    una); si vino llena, pide por adelantado las siguientes
+    SCRAPER_PREFETCH_PAGES páginas en paralelo, sin pasar la concurrencia
+    del HostLimiter del proveedor.
     
     Args:
         session: Sesión de requests con cookies
         csrf_token: Token CSRF para las peticiones AJAX
         category_ids: Lista de IDs de categoría
         category_name: Nombre de la categoría
+        progress: SyncProgress opcional (cuenta páginas obtenidas)
     
     Returns:
         list: Lista de productos (JSON)
+    
+    Raises:
+        ScrapeIncompleto: Si alguna página falló (HTTP != 200, timeout, etc.).
+            Un listado parcial no sirve para decidir qué productos desaparecieron.
     """
     productos = []
     page = 0
+    prefetch = max(1, min(
+        scraper_setting('SCRAPER_PREFETCH_PAGES', 3), get_host_limiter(ENDPOINT_AJAX).max_concurrency
+    ))
     
     ajax_headers = {
         **BROWSER_HEADERS,
@@ -119,27 +276,28 @@ def scrape_category(session, csrf_token, category_ids, category_name):
         'X-Requested-With': 'XMLHttpRequest'
     }
     
-    while True:
-        try:
-            params = {
-                'filter_page': page,
-                'filter_order': 0,
-                'filter_categories[]': category_ids
-            }
+    executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix=f'scraper-{category_name}')
+    pendientes = {}
+    siguiente = 0
+    
+    try:
+        while True:
+            # Mantener `prefetch` páginas en vuelo por delante de la actual (una sola para la primera)
+            while siguiente < page + (prefetch if page else 1):
+                pendientes[siguiente] = executor.submit(
+                    fetch_category_page, session, ajax_headers, category_ids, category_name, siguiente
+                )
+                siguiente += 1
             
-            response = session.get(
-                ENDPOINT_AJAX,
-                params=params,
-                headers=ajax_headers,
-                timeout=15
-            )
+            productos_pagina = pendientes.pop(page).result()
             
-            if response.status_code != 200:
-                logger.error(f"Error {response.status_code} en página {page} de {category_name}")
-                break
+            if productos_pagina is None:
+                raise ScrapeIncompleto(f"No se pudo obtener la página {page} de {category_name}")
             
-            data = response.json()
-            productos_pagina = data.get('data', [])
+            if progress:
+                progress.sumar(paginas=1)
+                # Avance visible mientras se recorre la categoría (como mucho cada `intervalo` segundos)
+                progress.notificar(forzar=False)
             
             if not productos_pagina:
                 logger.info(f"Categoría {category_name}: {len(productos)} productos totales")
@@ -153,106 +311,305 @@ def scrape_category(session, csrf_token, category_ids, category_name):
                 break
             
             page += 1
-            
-        except Exception as e:
-            logger.error(f"Error scrapeando página {page} de {category_name}: {str(e)}")
-            break
+    finally:
+        # Las páginas pedidas de más (después de la última) se descartan
+        executor.shutdown(wait=True, cancel_futures=True)
     
     return productos
 
 
-def process_product_data(producto_json, categoria, subcategorias_map=None):
+def scrape_subcategories(session, csrf_token, cat_config, progress=None):
+    """
+    Scrapea una categoría subcategoría por subcategoría, para saber a cuál
+    (marca) pertenece cada producto. Todas las páginas pasan por el
+    HostLimiter compartido: subcategorías y categorías en paralelo no suman
+    más requests simultáneos que SCRAPER_MAX_CONCURRENCY_PER_HOST.
+    
+    Args:
+        session: Sesión de requests con cookies
+        csrf_token: Token CSRF para las peticiones AJAX
+        cat_config: Entrada de CATEGORIAS_CONFIG
+        progress: SyncProgress opcional (cuenta páginas obtenidas)
+    
+    Returns:
+        tuple: (productos_json, subcategorias) donde subcategorias es
+               {external_id: nombre_subcategoria}
+    
+    Raises:
+        ScrapeIncompleto: Si falló alguna página de alguna subcategoría
+    """
+    productos = []
+    subcategorias = {}
+    for sub_id, sub_nombre in cat_config['subcategorias'].items():
+        productos_sub = scrape_category(
+            session, csrf_token, [sub_id], f"{cat_config['categoria_nombre']} / {sub_nombre}", progress
+        )
+        for producto_json in productos_sub:
+            # Si un producto figura en varias subcategorías, queda la primera de la config
+            external_id = str(producto_json.get('idProductos'))
+            if external_id not in subcategorias:
+                subcategorias[external_id] = sub_nombre
+        productos.extend(productos_sub)
+    return productos, subcategorias
+
+
+def parse_product_data(producto_json, categoria, marca=''):
     """
-    Procesa el JSON de un producto y lo crea/actualiza en la BD
+    Convierte el JSON de un producto del proveedor en valores de campos de Product
     
     Args:
         producto_json: Datos del producto en JSON
         categoria: Instancia de Category
-        subcategorias_map: Diccionario {external_id: nombre_subcategoria}
+        marca: Subcategoría del proveedor a la que pertenece (ver CATEGORIAS_CONFIG)
     
     Returns:
-        tuple: (producto, created)
+        dict: Campos del producto (incluye 'external_id' y 'precio_calculado')
     """
-    try:
-        external_id = str(producto_json['idProductos'])
-        nombre = producto_json['p_nombre']
-        descripcion = producto_json.get('p_descripcion', '')
-        
-        # Stock
-        stock_info = producto_json['stock'][0] if producto_json.get('stock') else {}
-        stock_proveedor = stock_info.get('s_cantidad', 0)
-        stock_ilimitado = stock_info.get('s_ilimitado', 0) == 1
-        precio_proveedor = stock_info.get('s_precio', producto_json.get('p_precio', 0))
-        
-        # Ofertas
-        en_oferta = producto_json.get('p_oferta', 0) == 1
-        precio_oferta_proveedor = producto_json.get('p_precio_oferta', 0) if en_oferta else None
-        
-        # Imágenes
-        imagenes_json = producto_json.get('imagenes', [])
-        imagenes_urls = []
-        for img in imagenes_json:
-            i_link = img.get('i_link', '')
-            # Si ya es una URL completa, usarla directamente
-            if i_link.startswith('http'):
-                imagenes_urls.append(i_link)
-            else:
-                # Si es solo el path, agregar el CDN base
-                imagenes_urls.append(f"{CDN_BASE}/{i_link}")
-        
-        # URL del producto original
-        p_link = producto_json.get('p_link', '')
-        external_url = f"{CATEGORIAS_CONFIG[categoria.nombre.lower()]['url']}/{p_link}" if p_link else None
-        
-        # Calcular precio (markup del 125%)
-        precio_calculado = 0
-        if en_oferta and precio_oferta_proveedor:
-            precio_calculado = float(precio_oferta_proveedor) * 2.20
+    external_id = str(producto_json['idProductos'])
+    nombre = producto_json['p_nombre']
+    descripcion = producto_json.get('p_descripcion', '')
+    
+    # Stock
+    stock_info = producto_json['stock'][0] if producto_json.get('stock') else {}
+    stock_proveedor = stock_info.get('s_cantidad', 0)
+    stock_ilimitado = stock_info.get('s_ilimitado', 0) == 1
+    precio_proveedor = stock_info.get('s_precio', producto_json.get('p_precio', 0))
+    
+    # Ofertas
+    en_oferta = producto_json.get('p_oferta', 0) == 1
+    precio_oferta_proveedor = producto_json.get('p_precio_oferta', 0) if en_oferta else None
+    
+    # Imágenes
+    imagenes_json = producto_json.get('imagenes', [])
+    imagenes_urls = []
+    for img in imagenes_json:
+        i_link = img.get('i_link', '')
+        # Si ya es una URL completa, usarla directamente
+        if i_link.startswith('http'):
+            imagenes_urls.append(i_link)
         else:
-            precio_calculado = float(precio_proveedor) * 2.20
-        
-        # Verificar si el producto ya existe
+            # Si es solo el path, agregar el CDN base
+            imagenes_urls.append(f"{CDN_BASE}/{i_link}")
+    
+    # URL del producto original
+    p_link = producto_json.get('p_link', '')
+    external_url = f"{CATEGORIAS_CONFIG[categoria.nombre.lower()]['url']}/{p_link}" if p_link else None
+    
+    # Calcular precio (markup del 125%)
+    if en_oferta and precio_oferta_proveedor:
+        precio_calculado = _a_decimal(float(precio_oferta_proveedor) * 2.20)
+    else:
+        precio_calculado = _a_decimal(float(precio_proveedor) * 2.20)
+    
+    return {
+        'external_id': external_id,
+        'nombre': nombre,
+        'descripcion': descripcion,
+        'marca': marca or '',
+        'precio_calculado': precio_calculado,
+        'precio_proveedor': _a_decimal(precio_proveedor),
+        'stock_proveedor': stock_proveedor,
+        'stock_ilimitado': stock_ilimitado,
+        'en_oferta': en_oferta,
+        'precio_oferta_proveedor': _a_decimal(precio_oferta_proveedor) if precio_oferta_proveedor is not None else None,
+        'imagenes': imagenes_urls,
+        'external_url': external_url,
+    }
+
+
+def _a_decimal(valor):
+    """Normaliza un precio a Decimal con 2 decimales (como lo guarda la BD)"""
+    return Decimal(str(valor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# Campos que la sincronización escribe en productos existentes
+CAMPOS_SYNC = [
+    'nombre', 'descripcion', 'marca', 'categoria', 'precio', 'precio_proveedor',
+    'stock_proveedor', 'stock_ilimitado', 'en_oferta', 'precio_oferta_proveedor',
+    'imagenes', 'external_url', 'last_sync', 'en_stock', 'sync_hash', 'sync_generacion',
+    'busqueda_nombre', 'busqueda_descripcion',
+]
+
+# Contenido del proveedor que define si un producto cambió
+CAMPOS_FINGERPRINT = [
+    'nombre', 'descripcion', 'marca', 'precio_proveedor', 'stock_proveedor', 'stock_ilimitado',
+    'en_oferta', 'precio_oferta_proveedor', 'imagenes', 'external_url',
+]
+
+
+def product_fingerprint(datos, precio_manual=False):
+    """
+    Huella SHA-256 del contenido scrapeado de un producto (ver CAMPOS_FINGERPRINT)
+
+    Args:
+        datos: Campos de Product según parse_product_data
+        precio_manual: Si el producto tiene precio manual. Entra en la huella
+                       solo cuando es True: al desactivarlo la huella cambia y
+                       el próximo sync vuelve a calcular el precio.
+    """
+    contenido = {campo: datos[campo] for campo in CAMPOS_FINGERPRINT}
+    if precio_manual:
+        contenido['precio_manual'] = True
+    serializado = json.dumps(contenido, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+# Tamaño de lote para bulk_create / bulk_update (evita el límite de variables de SQLite)
+SYNC_BATCH_SIZE = 500
+
+
+def _asignar_slugs(productos):
+    """
+    Genera slugs únicos para productos nuevos sin consultar la BD por cada uno
+    (mismo formato que Product.save: base, base-1, base-2...)
+    """
+    slugs_usados = set(Product.objects.exclude(slug='').values_list('slug', flat=True))
+    for producto in productos:
+        base_slug = slugify(producto.nombre)
+        slug = base_slug
+        counter = 1
+        while slug in slugs_usados:
+            slug = f"{base_slug}-{counter}"
+            counter += 1
+        slugs_usados.add(slug)
+        producto.slug = slug
+
+
+def upsert_category_products(productos_json, categoria, generacion=None, subcategorias=None):
+    """
+    Crea/actualiza en lote los productos scrapeados de una categoría.
+    Carga los existentes en una consulta, compara en memoria y escribe con
+    bulk_create/bulk_update dentro de una única transacción.
+    Los productos cuya huella (sync_hash) no cambió no se reescriben: solo
+    se les marca la generación (sync_generacion) de esta corrida.
+    
+    Args:
+        productos_json: Lista de productos (JSON) del proveedor
+        categoria: Instancia de Category
+        generacion: Número de corrida de sync (ver next_sync_generation)
+        subcategorias: {external_id: nombre_subcategoria} (ver scrape_subcategories)
+    
+    Returns:
+        tuple: (nuevos, actualizados, sin_cambios, external_ids, errores)
+    """
+    errores = []
+    datos_por_id = {}
+    subcategorias = subcategorias or {}
+    for producto_json in productos_json:
         try:
-            producto_existente = Product.objects.get(external_id=external_id)
-            # Si existe y tiene precio manual, mantenerlo
-            if producto_existente.precio_manual:
-                precio_final = producto_existente.precio
-            else:
-                precio_final = precio_calculado
-        except Product.DoesNotExist:
-            # Si no existe, usar el precio calculado
-            precio_final = precio_calculado
+            marca = subcategorias.get(str(producto_json.get('idProductos')), '')
+            datos = parse_product_data(producto_json, categoria, marca)
+        except Exception as e:
+            logger.error(f"Error procesando producto {producto_json.get('p_nombre', 'unknown')}: {str(e)}")
+            errores.append(f"Error procesando producto en {categoria.nombre}")
+            continue
+        # Si el proveedor repite un producto entre páginas, gana la última versión
+        datos_por_id[datos['external_id']] = datos
+    
+    if not datos_por_id:
+        return 0, 0, 0, [], errores
+    
+    # Productos existentes de la categoría, indexados por external_id (una sola consulta)
+    existentes = {
+        p.external_id: p
+        for p in Product.objects.filter(categoria=categoria, external_id__isnull=False)
+    }
+    # Productos que el proveedor movió desde otra categoría
+    faltantes = [eid for eid in datos_por_id if eid not in existentes]
+    for i in range(0, len(faltantes), SYNC_BATCH_SIZE):
+        for p in Product.objects.filter(external_id__in=faltantes[i:i + SYNC_BATCH_SIZE]):
+            existentes[p.external_id] = p
+    
+    ahora = timezone.now()
+    if generacion is None:
+        generacion = next_sync_generation()
+    a_crear = []
+    a_actualizar = []
+    ids_sin_cambios = []
+    
+    for external_id, datos in datos_por_id.items():
+        datos = dict(datos)
+        precio_calculado = datos.pop('precio_calculado')
+        producto = existentes.get(external_id)
+        datos['sync_hash'] = product_fingerprint(datos, producto.precio_manual if producto else False)
+        datos['sync_generacion'] = generacion
         
-        # Buscar o crear producto
-        producto, created = Product.objects.update_or_create(
-            external_id=external_id,
-            defaults={
-                'nombre': nombre,
-                'descripcion': descripcion,
-                'categoria': categoria,
-                'precio': precio_final,
-                'precio_proveedor': precio_proveedor,
-                'stock_proveedor': stock_proveedor,
-                'stock_ilimitado': stock_ilimitado,
-                'en_oferta': en_oferta,
-                'precio_oferta_proveedor': precio_oferta_proveedor,
-                'imagenes': imagenes_urls,
-                'external_url': external_url,
-                'last_sync': timezone.now(),
-            }
-        )
+        if producto is None:
+            producto = Product(categoria=categoria, precio=precio_calculado, last_sync=ahora, **datos)
+            producto.calcular_en_stock()
+            producto.calcular_busqueda()
+            a_crear.append(producto)
+            continue
         
-        return producto, created
+        # Sin cambios en el proveedor: no reescribir la fila
+        if producto.sync_hash == datos['sync_hash'] and producto.categoria_id == categoria.id:
+            ids_sin_cambios.append(producto.pk)
+            continue
         
-    except Exception as e:
-        logger.error(f"Error procesando producto {producto_json.get('p_nombre', 'unknown')}: {str(e)}")
-        return None, False
+        for campo, valor in datos.items():
+            setattr(producto, campo, valor)
+        producto.categoria = categoria
+        # Si tiene precio manual, mantenerlo
+        if not producto.precio_manual:
+            producto.precio = precio_calculado
+        producto.last_sync = ahora
+        producto.calcular_en_stock()
+        producto.calcular_busqueda()
+        a_actualizar.append(producto)
+    
+    with transaction.atomic():
+        if a_crear:
+            _asignar_slugs(a_crear)
+            Product.objects.bulk_create(a_crear, batch_size=SYNC_BATCH_SIZE)
+        if a_actualizar:
+            Product.objects.bulk_update(a_actualizar, CAMPOS_SYNC, batch_size=SYNC_BATCH_SIZE)
+        # Sin cambios: solo estampar la generación (UPDATE angosto, por lotes de pk)
+        for i in range(0, len(ids_sin_cambios), SYNC_BATCH_SIZE):
+            Product.objects.filter(pk__in=ids_sin_cambios[i:i + SYNC_BATCH_SIZE]).update(sync_generacion=generacion)
+    
+    for producto in a_crear:
+        logger.info(f"✅ Producto NUEVO: {producto.nombre}")
+    
+    return len(a_crear), len(a_actualizar), len(ids_sin_cambios), list(datos_por_id), errores
+
 
+def next_sync_generation():
+    """Número de la próxima corrida de sync (mayor generación estampada + 1)"""
+    ultima = Product.objects.aggregate(ultima=Max('sync_generacion'))['ultima'] or 0
+    return ultima + 1
 
-def sync_external_products():
+
+def deactivate_missing_products(generacion, categorias):
+    """
+    Desactiva en un solo UPDATE (indexado por sync_generacion) los productos
+    externos de `categorias` que esta corrida no vio, y reactiva los que el
+    sync había desactivado y volvieron a aparecer. Los productos ocultados
+    a mano por un admin no se tocan.
+    
+    Returns:
+        tuple: (desactivados, reactivados)
+    """
+    desactivados = Product.objects.filter(
+        external_id__isnull=False,
+        categoria__in=categorias,
+        sync_generacion__lt=generacion,
+        desactivado=False
+    ).update(desactivado=True, desactivado_por_sync=True)
+    
+    reactivados = Product.objects.filter(
+        sync_generacion=generacion,
+        desactivado_por_sync=True
+    ).update(desactivado=False, desactivado_por_sync=False)
+    
+    return desactivados, reactivados
+
+
+def sync_external_products(progress=None):
     """
     Función principal de sincronización
     
+    Args:
+        progress: SyncProgress opcional para reportar avance (ver market.sync_jobs)
+    
     Returns:
         dict: Estadísticas de la sincronización
     """
@@ -268,15 +625,31 @@ def sync_external_products():
             'error': 'No se pudo establecer sesión con el proveedor',
             'nuevos': 0,
             'actualizados': 0,
+            'unchanged': 0,
             'total': 0
         }
     
     productos_nuevos = 0
     productos_actualizados = 0
+    productos_sin_cambios = 0
     errores = []
-    productos_encontrados = []
+    categorias_sincronizadas = []
+    generacion = next_sync_generation()
+    
+    # Scrapear todas las categorías en paralelo (solo HTTP; la BD se escribe en este hilo,
+    # a medida que cada categoría termina, en el orden de CATEGORIAS_CONFIG)
+    executor = ThreadPoolExecutor(max_workers=len(CATEGORIAS_CONFIG), thread_name_prefix='scraper')
+    scrapes = {
+        cat_key: executor.submit(
+            scrape_subcategories,
+            session,
+            csrf_token,
+            cat_config,
+            progress
+        )
+        for cat_key, cat_config in CATEGORIAS_CONFIG.items()
+    }
     
-    # Scrapear cada categoría
     for cat_key, cat_config in CATEGORIAS_CONFIG.items():
         try:
             logger.info(f"\n📦 Procesando categoría: {cat_config['categoria_nombre']}")
@@ -287,67 +660,68 @@ def sync_external_products():
                 defaults={'descripcion': f'Categoría {cat_config["categoria_nombre"]}'}
             )
             
-            # Scrapear productos de la categoría
-            productos_json = scrape_category(
-                session,
-                csrf_token,
-                cat_config['ids'],
-                cat_config['categoria_nombre']
-            )
+            # Productos de la categoría (espera a que termine su scrape). Si falló una
+            # página lanza ScrapeIncompleto: la categoría queda fuera de categorias_sincronizadas
+            # y no se desactiva ninguno de sus productos
+            productos_json, subcategorias = scrapes[cat_key].result()
             
-            # Obtener mapa de subcategorías para esta categoría
-            subcategorias_map = cat_config.get('subcategorias', {})
+            # Crear/actualizar en lote (una transacción por categoría)
+            nuevos, actualizados, sin_cambios, _, errores_categoria = upsert_category_products(
+                productos_json,
+                categoria,
+                generacion,
+                subcategorias
+            )
+            productos_nuevos += nuevos
+            productos_actualizados += actualizados
+            productos_sin_cambios += sin_cambios
+            errores.extend(errores_categoria)
+            categorias_sincronizadas.append(categoria.id)
             
-            # Procesar cada producto
-            for prod_json in productos_json:
-                producto, created = process_product_data(prod_json, categoria, subcategorias_map)
-                
-                if producto:
-                    productos_encontrados.append(producto.external_id)
-                    
-                    if created:
-                        productos_nuevos += 1
-                        logger.info(f"✅ Producto NUEVO: {producto.nombre}")
-                    else:
-                        productos_actualizados += 1
-                        logger.debug(f"🔄 Producto actualizado: {producto.nombre}")
-                else:
-                    errores.append(f"Error procesando producto en {cat_config['categoria_nombre']}")
+            if progress:
+                progress.sumar(categorias=1, filas=nuevos + actualizados)
+                progress.notificar()
             
         except Exception as e:
             error_msg = f"Error en categoría {cat_config['categoria_nombre']}: {str(e)}"
             logger.error(error_msg)
             errores.append(error_msg)
     
-    # Marcar como no disponibles los productos que ya no existen
-    productos_desaparecidos = Product.objects.filter(
-        external_id__isnull=False
-    ).exclude(
-        external_id__in=productos_encontrados
-    )
+    executor.shutdown(wait=True)
     
-    count_desaparecidos = productos_desaparecidos.count()
+    # Desactivar los productos que ya no existen (solo en categorías sincronizadas sin error)
+    # y reactivar los que reaparecieron
+    count_desaparecidos, count_reactivados = deactivate_missing_products(generacion, categorias_sincronizadas)
     if count_desaparecidos > 0:
-        productos_desaparecidos.update(desactivado=True)
         logger.info(f"⚠️ {count_desaparecidos} productos marcados como desactivados (ya no existen en proveedor)")
+    if count_reactivados > 0:
+        logger.info(f"♻️ {count_reactivados} productos reactivados (volvieron al proveedor)")
+    
+    # Las escrituras masivas no disparan señales: invalidar el cache del catálogo a mano
+    if productos_nuevos or productos_actualizados or count_desaparecidos or count_reactivados:
+        bump_catalog_version()
     
     # Estadísticas finales
-    total = productos_nuevos + productos_actualizados
+    total = productos_nuevos + productos_actualizados + productos_sin_cambios
     
     logger.info("\n" + "=" * 60)
     logger.info("SINCRONIZACIÓN COMPLETADA")
     logger.info("=" * 60)
     logger.info(f"✅ Productos nuevos: {productos_nuevos}")
     logger.info(f"🔄 Productos actualizados: {productos_actualizados}")
+    logger.info(f"⏸️ Productos sin cambios: {productos_sin_cambios}")
     logger.info(f"📦 Total procesados: {total}")
     logger.info(f"⚠️ Productos desactivados: {count_desaparecidos}")
+    logger.info(f"♻️ Productos reactivados: {count_reactivados}")
     logger.info(f"❌ Errores: {len(errores)}")
     
     return {
         'success': True,
         'nuevos': productos_nuevos,
         'actualizados': productos_actualizados,
+        'unchanged': productos_sin_cambios,
         'total': total,
         'desactivados': count_desaparecidos,
+        'reactivados': count_reactivados,
         'errores': errores
     }
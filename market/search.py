@@ -0,0 +1,207 @@
+"""
+Búsqueda de productos por texto
+
+Product guarda su texto normalizado (minúsculas, sin acentos) en
+busqueda_nombre / busqueda_descripcion, calculado en save() y en el sync.
+Sobre esas columnas se mantiene un índice invertido según la BD, creado por
+la migración 0019_indice_busqueda:
+
+- PostgreSQL: columna tsvector generada (nombre con peso A, descripción B)
+  con índice GIN, más un índice de trigramas (pg_trgm) sobre el nombre para
+  tolerar errores de tipeo.
+- MySQL: índices FULLTEXT (InnoDB) sobre nombre + descripción y sobre el
+  nombre, consultados en BOOLEAN MODE por prefijo. InnoDB no indexa palabras
+  más cortas que innodb_ft_min_token_size (3 por defecto) ni sus stopwords:
+  los términos cortos se filtran con LIKE sobre el resultado del índice, y
+  una búsqueda solo con términos cortos usa LIKE.
+- SQLite: tabla FTS5 de contenido externo, mantenida con triggers. Si un
+  ALTER posterior reconstruye la tabla y se pierden los triggers,
+  reparar_indice_sqlite() (post_migrate) los recrea.
+- Otra BD (o si falta el índice): LIKE sobre el texto normalizado, sin índice.
+"""
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'market_product_fts'
+PG_VECTOR_COLUMN = 'busqueda_vector'
+# Peso de cada columna en bm25 (SQLite): el nombre pesa más que la descripción
+FTS_PESOS = (10.0, 1.0)
+MYSQL_FULLTEXT_INDEX = 'product_busqueda_ft_idx'
+# Largo mínimo de palabra que indexa InnoDB (innodb_ft_min_token_size)
+MYSQL_MIN_TOKEN = 3
+
+# Backend de búsqueda disponible por alias de BD (se detecta una vez por proceso)
+_backends = {}
+
+
+def normalizar_texto(texto):
+    """
+    Minúsculas, sin acentos y solo letras/números separados por un espacio
+    ("Reloj G-SHOCK Acción" → "reloj g shock accion")
+    """
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', texto.lower()).split())
+
+
+# ---- Reparación del índice (SQLite) ----
+
+def _sql_sqlite(tabla):
+    columnas = 'busqueda_nombre, busqueda_descripcion'
+    nuevas = 'new.busqueda_nombre, new.busqueda_descripcion'
+    viejas = 'old.busqueda_nombre, old.busqueda_descripcion'
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {tabla} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columnas}) VALUES (new.id, {nuevas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {tabla} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columnas}) VALUES ('delete', old.id, {viejas}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columnas} ON {tabla} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columnas}) VALUES ('delete', old.id, {viejas}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columnas}) VALUES (new.id, {nuevas}); END",
+    ]
+
+
+def reparar_indice_sqlite(using='default'):
+    """
+    SQLite reconstruye la tabla de productos en algunos ALTER de migraciones
+    posteriores y con ella pierde los triggers de la tabla FTS5 (creada por la
+    migración 0019). Si faltan, los recrea y reindexa. No hace nada en otras BD.
+    """
+    from market.models import Product
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tabla = Product._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+        if not cursor.fetchone():
+            return
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f'{FTS_TABLE}_a_'],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        logger.warning("Triggers del índice de búsqueda perdidos (tabla reconstruida): se recrean")
+        for sql in _sql_sqlite(tabla):
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _backends.pop(using, None)
+
+
+def _detectar_backend(using, tabla):
+    if using in _backends:
+        return _backends[using]
+
+    connection = connections[using]
+    backend = 'like'
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+                if cursor.fetchone():
+                    backend = 'sqlite'
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                    [tabla, PG_VECTOR_COLUMN],
+                )
+                if cursor.fetchone():
+                    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                    backend = 'postgresql_trgm' if cursor.fetchone() else 'postgresql'
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                    [tabla, MYSQL_FULLTEXT_INDEX],
+                )
+                if cursor.fetchone():
+                    backend = 'mysql'
+    except Exception as e:
+        logger.warning(f"No se pudo detectar el índice de búsqueda: {str(e)}")
+    _backends[using] = backend
+    return backend
+
+
+# ---- Consulta ----
+
+def buscar(queryset, texto):
+    """
+    Filtra productos por texto (todas las palabras, por prefijo) y anota
+    `relevancia` (mayor = más relevante).
+
+    Args:
+        queryset: QuerySet de Product
+        texto: Texto ingresado por el usuario
+
+    Returns:
+        QuerySet filtrado y anotado
+    """
+    terminos = normalizar_texto(texto).split()
+    if not terminos:
+        return queryset
+
+    tabla = queryset.model._meta.db_table
+    backend = _detectar_backend(queryset.db, tabla)
+
+    if backend == 'sqlite':
+        consulta = ' '.join(f'"{termino}"*' for termino in terminos)
+        pesos = ', '.join(str(peso) for peso in FTS_PESOS)
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [consulta])
+        ).annotate(relevancia=RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {pesos}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = \"{tabla}\".\"id\"",
+            [consulta], output_field=FloatField()
+        ))
+
+    if backend in ['postgresql', 'postgresql_trgm']:
+        consulta = ' & '.join(f'{termino}:*' for termino in terminos)
+        vector = f'"{tabla}"."{PG_VECTOR_COLUMN}"'
+        coincide = f"{vector} @@ to_tsquery('simple', %s)"
+        rank = f"ts_rank_cd({vector}, to_tsquery('simple', %s))"
+        params = [consulta]
+        if backend == 'postgresql_trgm':
+            # Tolerancia a errores de tipeo: similitud de palabras contra el nombre
+            coincide = f"({coincide} OR %s <%% \"{tabla}\".\"busqueda_nombre\")"
+            rank = f"({rank} + word_similarity(%s, \"{tabla}\".\"busqueda_nombre\"))"
+            params = [consulta, ' '.join(terminos)]
+        return queryset.filter(
+            RawSQL(coincide, params, output_field=BooleanField())
+        ).annotate(relevancia=RawSQL(rank, params, output_field=FloatField()))
+
+    if backend == 'mysql':
+        largos = [termino for termino in terminos if len(termino) >= MYSQL_MIN_TOKEN]
+        if largos:
+            consulta = ' '.join(f'+{termino}*' for termino in largos)
+            quote = connections[queryset.db].ops.quote_name
+            nombre = f"{quote(tabla)}.{quote('busqueda_nombre')}"
+            columnas = f"{nombre}, {quote(tabla)}.{quote('busqueda_descripcion')}"
+            coincide = f"MATCH ({columnas}) AGAINST (%s IN BOOLEAN MODE)"
+            rank = f"(10 * MATCH ({nombre}) AGAINST (%s IN BOOLEAN MODE) + {coincide})"
+            queryset = queryset.filter(
+                RawSQL(coincide, [consulta], output_field=BooleanField())
+            ).annotate(relevancia=RawSQL(rank, [consulta, consulta], output_field=FloatField()))
+            # Palabras que el índice no tiene: LIKE, pero solo sobre las filas que ya matchearon
+            for termino in terminos:
+                if len(termino) < MYSQL_MIN_TOKEN:
+                    queryset = queryset.filter(_contiene(termino))
+            return queryset
+
+    for termino in terminos:
+        queryset = queryset.filter(_contiene(termino))
+    return queryset.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+
+def _contiene(termino):
+    return Q(busqueda_nombre__contains=termino) | Q(busqueda_descripcion__contains=termino)
@@ -2,6 +2,9 @@ from rest_framework import serializers
 from .models import *
 from account_admin.serializer import UserSerializer
 from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from decimal import Decimal
+from .stock import mensaje_faltantes, reservar_stock
 from rest_framework import parsers
 import json
 
@@ -16,12 +19,36 @@ class CodigoDescuentoSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['usos_actuales', 'fecha_creacion', 'fecha_actualizacion', 'creado_por']
 
+class SyncJobSerializer(serializers.ModelSerializer):
+    creado_por = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = SyncJob
+        fields = [
+            'id', 'estado', 'creado_por', 'fecha_creacion', 'fecha_inicio', 'fecha_fin',
+            'categorias_completadas', 'paginas_obtenidas', 'filas_escritas',
+            'resultado', 'error'
+        ]
+        read_only_fields = fields
+
+class CamposDinamicosMixin:
+    """
+    Permite elegir qué campos se serializan pasando `fields=[...]` al construir
+    el serializer (sparse fieldsets). Los campos no pedidos ni se calculan.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for nombre in set(self.fields) - set(fields):
+                self.fields.pop(nombre)
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     categoria = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
         required=True
@@ -38,7 +65,7 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = [
-            'id', 'nombre', 'descripcion', 'precio', 'stock', 'categoria',
+            'id', 'nombre', 'descripcion', 'marca', 'precio', 'stock', 'categoria',
             'imagen', 'imagen_url',
             # Campos de dropshipping
             'external_id', 'slug', 'precio_proveedor', 'precio_manual',
@@ -61,10 +88,11 @@ class ProductSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         # Esto es para mostrar detalles de la categoría en las respuestas GET
         representation = super().to_representation(instance)
-        representation['categoria'] = {
-            'id': instance.categoria.id,
-            'nombre': instance.categoria.nombre
-        }
+        if 'categoria' in representation:
+            representation['categoria'] = {
+                'id': instance.categoria.id,
+                'nombre': instance.categoria.nombre
+            }
         return representation
     
 class OrderDetailSerializer(serializers.ModelSerializer):
@@ -109,8 +137,8 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'usuario', 'usuario_detalle', 'fecha', 'estado', 'total', 'detalles', 'detalles_input', 
                   'direccion_envio', 'costo_envio', 'codigo_postal', 'zona_envio', 'metodo_pago',
                   'email_invitado', 'nombre_invitado', 'apellido_invitado', 'telefono_invitado', 'dni_invitado',
-                  'codigo_descuento_usado']
-        read_only_fields = ['id', 'fecha']
+                  'codigo_descuento_usado', 'subtotal', 'cantidad_items', 'descuento', 'porcentaje_descuento']
+        read_only_fields = ['id', 'fecha', 'subtotal', 'cantidad_items', 'descuento', 'porcentaje_descuento']
         extra_kwargs = {
             'estado': {'default': 'pendiente', 'help_text': "Estado del pedido (default: pendiente)"}
         }
@@ -147,6 +175,15 @@ class OrderSerializer(serializers.ModelSerializer):
                 representation['detalles'] = simplified_details
         return representation
     
+    def update(self, instance, validated_data):
+        """Guarda solo los campos recibidos (los totales los mantienen los detalles)"""
+        validated_data.pop('detalles_input', None)
+        for campo, valor in validated_data.items():
+            setattr(instance, campo, valor)
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+        return instance
+    
     def create(self, validated_data):
         """
         Crea una orden con sus detalles.
@@ -155,43 +192,85 @@ class OrderSerializer(serializers.ModelSerializer):
         # Extraer detalles_input antes de crear la orden
         detalles_data = validated_data.pop('detalles_input', [])
         
-        # Crear la orden
-        order = Order.objects.create(**validated_data)
-        
-        # Crear los detalles si existen
+        # Todos los productos en una sola query (watch_id puede venir como string)
+        ids = []
         for detalle_data in detalles_data:
             watch_id = detalle_data.get('watch_id')
-            cantidad = detalle_data.get('cantidad', 1)
-            precio_unitario = detalle_data.get('precio_unitario')
-            
-            # Buscar el producto
             try:
-                producto = Product.objects.get(id=watch_id)
-            except Product.DoesNotExist:
-                order.delete()
+                ids.append(int(watch_id))
+            except (TypeError, ValueError):
+                raise ValidationError(f'Producto con ID {watch_id} no encontrado')
+        productos = Product.objects.in_bulk(ids)
+        for watch_id in ids:
+            if watch_id not in productos:
                 raise ValidationError(f'Producto con ID {watch_id} no encontrado')
+        
+        try:
+            cantidades = [int(detalle_data.get('cantidad', 1)) for detalle_data in detalles_data]
+        except (TypeError, ValueError):
+            raise ValidationError('Cantidad inválida')
+        
+        # Reserva de stock, orden y detalles en una sola transacción
+        with transaction.atomic():
+            # Vender el stock de todas las líneas con un UPDATE condicional (sin carreras)
+            faltantes = reservar_stock(zip(ids, cantidades))
+            if faltantes:
+                raise ValidationError({'error': mensaje_faltantes(faltantes), 'faltantes': faltantes})
             
-            # Usar precio del frontend si existe, sino precio del producto
-            from decimal import Decimal
-            if precio_unitario is not None:
-                subtotal = Decimal(str(precio_unitario)) * cantidad
-            else:
-                subtotal = producto.precio * cantidad
+            # El subtotal sale del precio del producto (como en OrderDetail.save),
+            # no del precio_unitario que manda el frontend
+            detalles = [
+                OrderDetail(
+                    producto=productos[watch_id],
+                    cantidad=cantidad,
+                    subtotal=productos[watch_id].precio * cantidad
+                )
+                for watch_id, cantidad in zip(ids, cantidades)
+            ]
             
-            # Crear el detalle
-            detalle = OrderDetail.objects.create(
-                pedido=order,
-                producto=producto,
-                cantidad=cantidad,
-                subtotal=subtotal
-            )
+            # bulk_create no pasa por OrderDetail.save(): los totales se cargan al crear la orden
+            validated_data['subtotal'] = sum((detalle.subtotal for detalle in detalles), Decimal('0.00'))
+            validated_data['cantidad_items'] = sum(cantidades)
+            if 'total' not in validated_data:
+                validated_data['total'] = validated_data['subtotal'] + Decimal(str(validated_data.get('costo_envio', 0)))
+            order = Order.objects.create(**validated_data)
             
-            # Actualizar stock vendido
-            producto.stock_vendido += cantidad
-            producto.save()
+            for detalle in detalles:
+                detalle.pedido = order
+            OrderDetail.objects.bulk_create(detalles)
         
         return order
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Representación resumida para listados de pedidos (panel de pedidos).
+    Espera el queryset con select_related('usuario') (ver OrderViewSet):
+    cantidad_items es columna del pedido, no dispara queries por fila.
+    """
+    usuario_detalle = serializers.SerializerMethodField()
+    cliente = serializers.SerializerMethodField()
+    email = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = ['id', 'fecha', 'estado', 'total', 'metodo_pago', 'usuario_detalle', 'cliente', 'email', 'cantidad_items']
+        read_only_fields = fields
+
+    def get_usuario_detalle(self, obj):
+        if obj.usuario is None:
+            return None
+        return {'id': obj.usuario.id, 'username': obj.usuario.username}
+
+    def get_cliente(self, obj):
+        if obj.usuario:
+            return f"{obj.usuario.first_name} {obj.usuario.last_name}".strip() or obj.usuario.username
+        return f"{obj.nombre_invitado or ''} {obj.apellido_invitado or ''}".strip() or 'Invitado'
+
+    def get_email(self, obj):
+        if obj.usuario:
+            return obj.usuario.email
+        return obj.email_invitado
+
 class PaySerializer(serializers.ModelSerializer):
     pedido_detalle = serializers.SerializerMethodField(read_only=True)
     monto_pagado = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -292,6 +371,7 @@ class ShipmentSerializer(serializers.ModelSerializer):
     def get_pedido_detalle(self, obj):
         """Muestra información resumida del pedido asociado al envío"""
         pedido = obj.pedido
+        detalles = list(pedido.detalles.all())  # Usa el prefetch de la vista
         return {
             'id': pedido.id,
             'cliente': pedido.usuario.username,
@@ -302,9 +382,9 @@ class ShipmentSerializer(serializers.ModelSerializer):
                 {
                     'nombre': detalle.producto.nombre,
                     'cantidad': detalle.cantidad
-                } for detalle in pedido.detalles.all()[:5]  # Limitar a 5 productos para evitar respuestas muy grandes
+                } for detalle in detalles[:5]  # Limitar a 5 productos para evitar respuestas muy grandes
             ],
-            'total_productos': pedido.detalles.count()
+            'total_productos': len(detalles)
         }
     
     def validate(self, data):
@@ -324,7 +404,7 @@ class ShipmentSerializer(serializers.ModelSerializer):
         pedido = validated_data['pedido']
         if pedido.estado == 'pendiente':
             pedido.estado = 'procesando'
-            pedido.save()
+            pedido.save(update_fields=['estado'])
         return super().create(validated_data)
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -354,8 +434,10 @@ class CartSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['total'] = float(instance.total())
-        representation['cantidad_items'] = instance.cantidad_items()
+        # Una sola pasada sobre los items (precargados con Cart.objects.con_items())
+        total, cantidad_items = instance.totales()
+        representation['total'] = float(total)
+        representation['cantidad_items'] = cantidad_items
         return representation
 
 class ProductBriefSerializer(serializers.ModelSerializer):
@@ -0,0 +1,32 @@
+"""
+Señales del módulo market
+"""
+
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from .catalog_cache import bump_catalog_version
+from .models import Category, Product
+from .search import reparar_indice_sqlite
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidar_cache_catalogo(sender, **kwargs):
+    """
+    Cualquier cambio guardado en productos o categorías (precio, visibilidad,
+    stock, datos) invalida las respuestas cacheadas del catálogo.
+    Las escrituras masivas (.update(), bulk_*) no disparan señales: quien las
+    hace debe llamar a bump_catalog_version().
+    """
+    bump_catalog_version()
+
+
+@receiver(post_migrate)
+def reparar_indice_busqueda(sender, app_config=None, using='default', **kwargs):
+    """
+    El índice de búsqueda lo crea la migración 0019; acá solo se recrean los
+    triggers de SQLite si un ALTER posterior reconstruyó la tabla.
+    """
+    if app_config is None or app_config.label != 'market':
+        return
+    reparar_indice_sqlite(using)
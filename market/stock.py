@@ -0,0 +1,369 @@
+"""
+Reserva de stock para pedidos
+
+Vender una unidad es sumar a Product.stock_vendido. En lugar de leer el
+producto, comparar en Python y guardar (dos checkouts simultáneos leen el
+mismo stock y ambos venden), la reserva es un único UPDATE condicional:
+
+    UPDATE market_product
+       SET stock_vendido = stock_vendido + CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+     WHERE id IN (1, 7)
+       AND (stock_ilimitado OR stock_proveedor >= stock_vendido + CASE id ... END)
+
+La BD evalúa la condición sobre la fila bloqueada por el propio UPDATE, así
+que no hay ventana entre el chequeo y la escritura ni locks de tabla. Si el
+UPDATE no tocó todas las filas, alguna línea no alcanzó: se revierte el
+pedido completo y se informa qué líneas fallaron.
+
+Los checkouts de Mercado Pago además dejan una ReservaStock con vencimiento:
+si el comprador abandona el pago, liberar_reservas_vencidas() (job del
+scheduler) devuelve el stock en bloque y cancela el pedido; si el webhook
+aprueba el pago, confirmar_reservas() convierte la reserva en venta. Un pago
+en efectivo (Rapipago, Pago Fácil) queda 'pending' hasta que se paga el
+cupón: extender_reservas() mantiene la reserva mientras tanto.
+
+Cancelar pedidos (uno o miles) devuelve el stock con liberar_pedidos(): un
+SELECT agregado por producto y un UPDATE, sin recorrer detalle por detalle.
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from .catalog_cache import bump_catalog_version
+from .models import Order, OrderDetail, Product, ReservaStock
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Reservas vencidas que se liberan por transacción en cada pasada del barrido
+LOTE_LIBERACION = 500
+
+# Reintentos si el UPDATE falla pero al releer ya hay stock (otro pedido se canceló en el medio)
+REINTENTOS_RESERVA = 2
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        super().__init__(mensaje_faltantes(faltantes))
+
+
+def mensaje_faltantes(faltantes):
+    """Mensaje de error para la primera línea sin stock"""
+    if not faltantes:
+        return ''
+    faltante = faltantes[0]
+    return f"Stock insuficiente para {faltante['nombre']}. Solo hay {faltante['disponible']} unidades disponibles"
+
+
+def agrupar_lineas(lineas):
+    """
+    Suma las cantidades por producto, respetando el orden de aparición
+
+    Args:
+        lineas: Iterable de (producto_id, cantidad)
+
+    Returns:
+        OrderedDict producto_id -> cantidad
+    """
+    cantidades = OrderedDict()
+    for producto_id, cantidad in lineas:
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + int(cantidad)
+    return cantidades
+
+
+def _por_producto(cantidades):
+    return Case(
+        *[When(pk=producto_id, then=Value(cantidad)) for producto_id, cantidad in cantidades.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _lineas_faltantes(cantidades):
+    """Líneas que hoy no alcanzan a cubrirse (lectura sin lock, solo para informar)"""
+    productos = Product.objects.only(
+        'nombre', 'stock_proveedor', 'stock_vendido', 'stock_ilimitado'
+    ).in_bulk(list(cantidades))
+    faltantes = []
+    for producto_id, cantidad in cantidades.items():
+        producto = productos.get(producto_id)
+        disponible = producto.stock_disponible if producto else 0
+        if cantidad > disponible:
+            faltantes.append({
+                'producto_id': producto_id,
+                'nombre': producto.nombre if producto else f'#{producto_id}',
+                'solicitado': cantidad,
+                'disponible': disponible,
+            })
+    return faltantes
+
+
+def reservar_stock(lineas):
+    """
+    Reserva (vende) stock para todas las líneas o para ninguna.
+
+    Se puede llamar dentro de un transaction.atomic() del pedido: la reserva
+    queda en la misma transacción y se deshace si el pedido falla después.
+
+    Args:
+        lineas: Iterable de (producto_id, cantidad). Un producto repetido se suma.
+
+    Returns:
+        list: Líneas que fallaron ({producto_id, nombre, solicitado, disponible}).
+              Vacía si se reservó todo.
+    """
+    cantidades = agrupar_lineas(lineas)
+    if not cantidades:
+        return []
+
+    for _ in range(REINTENTOS_RESERVA):
+        try:
+            with transaction.atomic():
+                cantidad = _por_producto(cantidades)
+                actualizados = Product.objects.filter(pk__in=list(cantidades)).filter(
+                    Q(stock_ilimitado=True) | Q(stock_proveedor__gte=F('stock_vendido') + cantidad)
+                ).update(stock_vendido=F('stock_vendido') + cantidad)
+                if actualizados != len(cantidades):
+                    raise StockInsuficiente([])
+                Product.objects.filter(pk__in=list(cantidades)).actualizar_en_stock()
+        except StockInsuficiente:
+            faltantes = _lineas_faltantes(cantidades)
+            if faltantes:
+                return faltantes
+            continue
+        # update() no pasa por save(): invalidar el catálogo a mano cuando se confirme
+        transaction.on_commit(bump_catalog_version)
+        return []
+
+    # Al releer alcanzaba pero el UPDATE siguió fallando: informar todas las líneas
+    return [
+        {'producto_id': producto_id, 'nombre': f'#{producto_id}', 'solicitado': cantidad, 'disponible': 0}
+        for producto_id, cantidad in cantidades.items()
+    ]
+
+
+def liberar_stock(lineas):
+    """
+    Devuelve stock vendido en un solo UPDATE (sin bajar de 0).
+
+    Args:
+        lineas: Iterable de (producto_id, cantidad). Un producto repetido se suma.
+
+    Returns:
+        int: Cantidad de productos actualizados
+    """
+    cantidades = agrupar_lineas(lineas)
+    if not cantidades:
+        return 0
+
+    cantidad = _por_producto(cantidades)
+    with transaction.atomic():
+        actualizados = Product.objects.filter(pk__in=list(cantidades)).update(
+            stock_vendido=Case(
+                When(stock_vendido__gte=cantidad, then=F('stock_vendido') - cantidad),
+                default=Value(0),
+            )
+        )
+        Product.objects.filter(pk__in=list(cantidades)).actualizar_en_stock()
+    transaction.on_commit(bump_catalog_version)
+    return actualizados
+
+
+def liberar_pedidos(pedido_ids):
+    """
+    Devuelve el stock de todos los detalles de los pedidos y marca sus
+    reservas activas como liberadas (para que el barrido no las libere otra vez).
+
+    No cambia el estado de los pedidos: llamar solo para pedidos que esta
+    misma transacción pasó a cancelado.
+
+    Args:
+        pedido_ids: Ids de los pedidos
+
+    Returns:
+        int: Cantidad de productos actualizados
+    """
+    pedido_ids = list(pedido_ids)
+    if not pedido_ids:
+        return 0
+
+    lineas = (
+        OrderDetail.objects.filter(pedido_id__in=pedido_ids)
+        .order_by().values('producto_id').annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+    with transaction.atomic():
+        actualizados = liberar_stock(lineas)
+        ReservaStock.objects.filter(pedido_id__in=pedido_ids, estado=ReservaStock.ACTIVA).update(
+            estado=ReservaStock.LIBERADA
+        )
+    return actualizados
+
+
+def cancelar_pedidos(pedidos, lote=LOTE_LIBERACION):
+    """
+    Cancela en bloque los pedidos del queryset que todavía no estén cancelados
+    y devuelve su stock. Por lote: un SELECT con lock, un UPDATE de pedidos y
+    uno de productos. Los pedidos bloqueados por otra transacción se saltean.
+
+    Args:
+        pedidos: QuerySet de Order a cancelar
+        lote: Pedidos por transacción
+
+    Returns:
+        dict: pedidos cancelados y productos con stock devuelto
+    """
+    resumen = {'pedidos_cancelados': 0, 'productos_actualizados': 0}
+
+    while True:
+        with transaction.atomic():
+            ids = list(
+                pedidos.exclude(estado='cancelado')
+                .select_for_update(skip_locked=True, of=('self',))
+                .order_by('id').values_list('id', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            # update() y no save(): el stock se devuelve acá una sola vez por lote
+            Order.objects.filter(id__in=ids).update(estado='cancelado')
+            resumen['productos_actualizados'] += liberar_pedidos(ids)
+            resumen['pedidos_cancelados'] += len(ids)
+
+        if len(ids) < lote:
+            break
+
+    if resumen['pedidos_cancelados']:
+        logger.info(f"Pedidos cancelados en bloque: {resumen}")
+    return resumen
+
+
+# ---- Reservas con vencimiento (checkout de Mercado Pago) ----
+
+def crear_reservas(pedido, minutos=None):
+    """
+    Registra como reserva con vencimiento el stock ya vendido a `pedido`
+    (llamar en la misma transacción que creó el pedido).
+
+    Args:
+        pedido: Order con sus detalles creados
+        minutos: Duración de la reserva (default settings.STOCK_HOLD_MINUTES)
+
+    Returns:
+        list: ReservaStock creadas
+    """
+    if minutos is None:
+        minutos = getattr(settings, 'STOCK_HOLD_MINUTES', 30)
+    expira = timezone.now() + timedelta(minutes=minutos)
+    lineas = pedido.detalles.values('producto_id').annotate(total=Sum('cantidad')).order_by('producto_id')
+    return ReservaStock.objects.bulk_create([
+        ReservaStock(pedido=pedido, producto_id=linea['producto_id'], cantidad=linea['total'], expira=expira)
+        for linea in lineas
+    ])
+
+
+def extender_reservas(pedido, horas=None):
+    """
+    Pago pendiente de acreditación: extiende el vencimiento de las reservas
+    activas del pedido (nunca lo acorta).
+
+    Args:
+        pedido: Order con un pago 'pending'
+        horas: Vigencia desde ahora (default settings.STOCK_HOLD_PENDING_HOURS)
+
+    Returns:
+        int: Reservas extendidas
+    """
+    if horas is None:
+        horas = getattr(settings, 'STOCK_HOLD_PENDING_HOURS', 72)
+    expira = timezone.now() + timedelta(hours=horas)
+    return ReservaStock.objects.filter(
+        pedido=pedido, estado=ReservaStock.ACTIVA, expira__lt=expira
+    ).update(expira=expira)
+
+
+def confirmar_reservas(pedido):
+    """
+    Pago aprobado: las reservas activas del pedido pasan a ser ventas.
+
+    Si ya se habían liberado por vencimiento (el pago llegó tarde) se vuelve
+    a vender el stock; si no alcanza, el pedido queda pagado igual y se
+    registra el faltante para que lo resuelva un operador.
+
+    Args:
+        pedido: Order aprobado
+
+    Returns:
+        list: Líneas sin stock (vacía si todo quedó vendido)
+    """
+    with transaction.atomic():
+        confirmadas = ReservaStock.objects.filter(pedido=pedido, estado=ReservaStock.ACTIVA).update(
+            estado=ReservaStock.CONFIRMADA
+        )
+        liberadas = ReservaStock.objects.select_for_update().filter(pedido=pedido, estado=ReservaStock.LIBERADA)
+        lineas = list(liberadas.values_list('producto_id', 'cantidad'))
+        if not lineas:
+            return []
+
+        faltantes = reservar_stock(lineas)
+        if faltantes:
+            logger.error(f"Pedido {pedido.pk} pagado después de vencer su reserva y sin stock: {faltantes}")
+            return faltantes
+        liberadas.update(estado=ReservaStock.CONFIRMADA)
+        logger.info(f"Pedido {pedido.pk}: reserva vencida vuelta a vender ({confirmadas} ya estaban activas)")
+        return []
+
+
+def liberar_reservas_vencidas(ahora=None):
+    """
+    Job del scheduler: devuelve en bloque el stock de las reservas vencidas
+    y cancela sus pedidos si siguen pendientes de pago.
+
+    Si el pedido avanzó por otra vía (pago manual aprobado, etc.) la reserva
+    se confirma en lugar de liberarse.
+
+    Args:
+        ahora: Momento de referencia (default: timezone.now())
+
+    Returns:
+        dict: reservas liberadas, confirmadas y pedidos cancelados
+    """
+    ahora = ahora or timezone.now()
+    resumen = {'liberadas': 0, 'confirmadas': 0, 'pedidos_cancelados': 0}
+
+    while True:
+        with transaction.atomic():
+            vencidas = list(
+                ReservaStock.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(estado=ReservaStock.ACTIVA, expira__lte=ahora)
+                .values('id', 'producto_id', 'cantidad', 'pedido_id', 'pedido__estado')
+                .order_by('expira', 'id')[:LOTE_LIBERACION]
+            )
+            if not vencidas:
+                break
+
+            a_liberar = [r for r in vencidas if r['pedido__estado'] == 'pendiente']
+            a_confirmar = [r['id'] for r in vencidas if r['pedido__estado'] != 'pendiente']
+
+            if a_liberar:
+                liberar_stock((r['producto_id'], r['cantidad']) for r in a_liberar)
+                ReservaStock.objects.filter(id__in=[r['id'] for r in a_liberar]).update(estado=ReservaStock.LIBERADA)
+                # update() y no save(): Order.save() devolvería el stock otra vez
+                resumen['pedidos_cancelados'] += Order.objects.filter(
+                    id__in={r['pedido_id'] for r in a_liberar}, estado='pendiente'
+                ).update(estado='cancelado')
+            if a_confirmar:
+                ReservaStock.objects.filter(id__in=a_confirmar).update(estado=ReservaStock.CONFIRMADA)
+
+            resumen['liberadas'] += len(a_liberar)
+            resumen['confirmadas'] += len(a_confirmar)
+
+        if len(vencidas) < LOTE_LIBERACION:
+            break
+
+    if resumen['liberadas'] or resumen['confirmadas']:
+        logger.info(f"Reservas de stock vencidas: {resumen}")
+    return resumen
@@ -0,0 +1,143 @@
+"""
+Ejecución de la sincronización de productos fuera del request (vía APScheduler)
+
+La sincronización manual (encolada desde el request, en el worker que lo
+recibió) y la programada (en el proceso líder) comparten un lease en BD
+(SchedulerLock 'sync_productos'): solo corre una a la vez. Cada una queda
+registrada como SyncJob; el lease lo tiene el job en curso y lo renueva con
+cada avance, así que si el worker muere vence y la próxima sync lo toma.
+"""
+
+from datetime import timedelta
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from market.models import SchedulerLock, SyncJob
+from market.scraper import SyncProgress, sync_external_products
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Lease compartido por la sincronización manual y la programada
+SYNC_LOCK_NAME = 'sync_productos'
+# Se renueva con cada avance; sin avances durante este tiempo el job se considera abandonado
+SYNC_LOCK_TTL = timedelta(minutes=10)
+# Un job "abierto" más viejo que esto se considera abandonado (p. ej. murió el worker)
+SYNC_JOB_TIMEOUT = timedelta(hours=1)
+
+
+class SyncEnCurso(Exception):
+    """Otra sincronización tiene el lease"""
+
+
+def _propietario(job_id):
+    return f"sync_job_{job_id}"
+
+
+def renovar_lease(job_id):
+    """
+    Renueva el lease del job (o lo toma si venció)
+
+    Returns:
+        bool: True si el job sigue siendo el dueño
+    """
+    return SchedulerLock.adquirir(SYNC_LOCK_NAME, _propietario(job_id), SYNC_LOCK_TTL)
+
+
+def get_active_job():
+    """Devuelve el job pendiente o en curso (no abandonado), si existe"""
+    lock = SchedulerLock.objects.filter(nombre=SYNC_LOCK_NAME, expira__gte=timezone.now()).first()
+    if lock and lock.propietario.startswith('sync_job_'):
+        job = SyncJob.objects.filter(pk=lock.propietario[len('sync_job_'):]).first()
+        if job:
+            return job
+    return SyncJob.objects.filter(
+        estado__in=['pendiente', 'en_curso'],
+        fecha_creacion__gte=timezone.now() - SYNC_JOB_TIMEOUT
+    ).first()
+
+
+def crear_job(usuario=None):
+    """
+    Crea un SyncJob con el lease de sincronización tomado (en una transacción:
+    dos requests simultáneos no pueden quedarse ambos con un job activo).
+
+    Returns:
+        SyncJob | None: None si otra sincronización tiene el lease
+    """
+    try:
+        with transaction.atomic():
+            job = SyncJob.objects.create(creado_por=usuario)
+            if not renovar_lease(job.id):
+                raise SyncEnCurso()
+            return job
+    except SyncEnCurso:
+        return None
+
+
+def enqueue_sync(usuario=None):
+    """
+    Crea un SyncJob y lo encola en el scheduler.
+    Si ya hay una sincronización activa, devuelve esa en lugar de encolar otra.
+
+    Returns:
+        tuple: (job, created)
+    """
+    from Velorum import scheduler
+
+    job = crear_job(usuario)
+    if job is None:
+        return get_active_job(), False
+
+    scheduler.run_now(run_sync_job, f'sync_job_{job.id}', args=[job.id])
+    logger.info(f"Sincronización {job.id} encolada")
+    return job, True
+
+
+def run_scheduled_sync():
+    """Job programado del líder: corre la sincronización si no hay otra en curso"""
+    close_old_connections()
+    job = crear_job()
+    if job is None:
+        logger.info("Sincronización programada omitida: ya hay una en curso")
+        return None
+    return run_sync_job(job.id)
+
+
+def run_sync_job(job_id):
+    """Ejecuta un SyncJob (corre en un hilo del scheduler)"""
+    close_old_connections()
+    try:
+        if not renovar_lease(job_id):
+            # El lease venció antes de arrancar y lo tomó otra sincronización
+            SyncJob.objects.filter(pk=job_id).update(
+                estado='fallido', error='Otra sincronización está en curso', fecha_fin=timezone.now()
+            )
+            return None
+
+        SyncJob.objects.filter(pk=job_id).update(estado='en_curso', fecha_inicio=timezone.now())
+
+        def guardar_avance(avance):
+            SyncJob.objects.filter(pk=job_id).update(**avance)
+            renovar_lease(job_id)
+
+        progress = SyncProgress(on_update=guardar_avance)
+        resultado = sync_external_products(progress=progress)
+
+        SyncJob.objects.filter(pk=job_id).update(
+            estado='completado' if resultado.get('success') else 'fallido',
+            resultado=resultado,
+            error=resultado.get('error', ''),
+            fecha_fin=timezone.now(),
+            **progress.snapshot()
+        )
+        return resultado
+    except Exception as e:
+        logger.error(f"Error en sincronización {job_id}: {str(e)}")
+        SyncJob.objects.filter(pk=job_id).update(
+            estado='fallido',
+            error=str(e),
+            fecha_fin=timezone.now()
+        )
+    finally:
+        SchedulerLock.liberar(SYNC_LOCK_NAME, _propietario(job_id))
+        close_old_connections()
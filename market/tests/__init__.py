@@ -1,4 +1,12 @@
 from .test_models import *
 from .test_serializers import *
 from .test_views import *
-from .test_urls import *
\ No newline at end of file
+from .test_urls import *
+from .test_scraper import *
+from .test_cache import *
+from .test_query_counts import *
+from .test_pagination import *
+from .test_search import *
+from .test_stock import *
+from .test_mp_inbox import *
+from .test_mercadopago_service import *
\ No newline at end of file
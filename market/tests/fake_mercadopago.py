@@ -0,0 +1,99 @@
+"""
+Servidor HTTP local que imita los endpoints de Mercado Pago que usa
+market/mercadopago_service.py, para testear el cliente real (SDK + pool de
+conexiones) sin salir a internet.
+
+Uso:
+    with FakeMercadoPago() as mp, override_settings(MERCADOPAGO_API_URL=mp.url):
+        mp.pagos['123'] = {...}
+        process_payment_notification('123')
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1: la conexión queda abierta entre requests (keep-alive)
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.fake.conexiones += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, status, cuerpo):
+        datos = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _registrar(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        cuerpo = self.rfile.read(largo) if largo else b''
+        fake = self.server.fake
+        fake.requests.append({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'body': json.loads(cuerpo) if cuerpo else None,
+        })
+        if fake.fallos:
+            fake.fallos -= 1
+            self._responder(503, {'message': 'Servicio no disponible'})
+            return False
+        return True
+
+    def do_POST(self):
+        if not self._registrar():
+            return
+        if self.path.startswith('/checkout/preferences'):
+            fake = self.server.fake
+            preference_id = f"pref-{len(fake.requests)}"
+            self._responder(201, {
+                'id': preference_id,
+                'init_point': f"{fake.url}/checkout?pref_id={preference_id}",
+                'sandbox_init_point': f"{fake.url}/sandbox?pref_id={preference_id}",
+            })
+        else:
+            self._responder(404, {'message': 'not found'})
+
+    def do_GET(self):
+        if not self._registrar():
+            return
+        if self.path.startswith('/v1/payments/'):
+            payment_id = self.path.split('?')[0].rsplit('/', 1)[-1]
+            pago = self.server.fake.pagos.get(payment_id)
+            if pago is None:
+                self._responder(404, {'message': 'Payment not found'})
+            else:
+                self._responder(200, pago)
+        else:
+            self._responder(404, {'message': 'not found'})
+
+
+class FakeMercadoPago:
+    def __init__(self):
+        self.requests = []
+        self.pagos = {}
+        self.conexiones = 0
+        self.fallos = 0  # Próximas respuestas que devuelven 503
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
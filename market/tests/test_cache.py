@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from unittest import mock
+from Velorum.cache import TieredCache
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'}
+
+
+@override_settings(CACHES={'default': LOCMEM, 'shared': LOCMEM})
+class TestTieredCache(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.cache = TieredCache('', {'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 5, 'LOCAL_MAX_ENTRIES': 2}})
+
+    def test_lectura_local_y_compartida(self):
+        caches['shared'].set('clave', 'valor')
+        self.assertEqual(self.cache.get('clave'), 'valor')  # Viene del nivel compartido
+        self.assertEqual(self.cache.get('clave'), 'valor')  # Ahora del local
+        self.assertIsNone(self.cache.get('otra'))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits_shared'], 1)
+        self.assertEqual(stats['hits_local'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_set_escribe_en_ambos_niveles(self):
+        self.cache.set('clave', {'a': 1})
+        self.assertEqual(caches['shared'].get('clave'), {'a': 1})
+        self.assertEqual(self.cache.get('clave'), {'a': 1})
+        self.assertEqual(self.cache.stats()['hits_local'], 1)
+
+    def test_valor_local_vence_por_ttl(self):
+        with mock.patch('Velorum.cache.time.monotonic', return_value=100):
+            self.cache.set('clave', 'viejo')
+        caches['shared'].set('clave', 'nuevo')  # Lo escribió otro proceso
+        with mock.patch('Velorum.cache.time.monotonic', return_value=103):
+            self.assertEqual(self.cache.get('clave'), 'viejo')
+        with mock.patch('Velorum.cache.time.monotonic', return_value=106):
+            self.assertEqual(self.cache.get('clave'), 'nuevo')
+
+    def test_lru_descarta_la_entrada_menos_usada(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.stats()['local_entries'], 2)
+
+        self.cache.reset_stats()
+        self.cache.get('b')  # Salió del nivel local, sigue en el compartido
+        self.assertEqual(self.cache.stats()['hits_shared'], 1)
+
+    def test_incr_y_delete(self):
+        self.cache.set('version', 1, timeout=None)
+        self.assertEqual(self.cache.incr('version'), 2)
+        self.assertEqual(self.cache.get('version'), 2)
+        self.assertEqual(caches['shared'].get('version'), 2)
+
+        self.cache.delete('version')
+        self.assertIsNone(self.cache.get('version'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('version')
+
+    def test_add_respeta_el_nivel_compartido(self):
+        caches['shared'].set('clave', 'existente')
+        self.assertFalse(self.cache.add('clave', 'nuevo'))
+        self.assertEqual(self.cache.get('clave'), 'existente')
+
+
+class TestCacheStatsView(APITestCase):
+    def test_stats_del_cache_por_defecto(self):
+        admin = get_user_model().objects.create_user(username='admin_cache', password='x', role='admin', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        cache.set('clave', 1)
+        cache.get('clave')
+
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.data['hits_local'], 1)
+        self.assertEqual(response.data['shared_backend'], 'DatabaseCache')
+
+    def test_requiere_admin(self):
+        self.assertIn(self.client.get(reverse('cache-stats')).status_code, [401, 403])
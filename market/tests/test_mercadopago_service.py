@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase, override_settings
+from market.mercadopago_service import PooledHttpClient, create_preference, get_sdk, process_payment_notification
+from market.tests.fake_mercadopago import FakeMercadoPago
+
+
+def pedido_mp(order_id=1):
+    return {
+        'order_id': order_id,
+        'items': [{'name': 'Reloj', 'quantity': 1, 'price': 100}],
+        'payer_email': 'cliente@example.com',
+        'total': 100,
+    }
+
+
+class TestClienteMercadoPago(SimpleTestCase):
+    def setUp(self):
+        self.mp = FakeMercadoPago().__enter__()
+        self.addCleanup(self.mp.__exit__, None, None, None)
+        configuracion = override_settings(MERCADOPAGO_API_URL=self.mp.url, MERCADOPAGO_MAX_RETRIES=2)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.addCleanup(lambda: get_sdk().http_client.close())
+
+    def test_sdk_compartido(self):
+        self.assertIs(get_sdk(), get_sdk())
+        self.assertIsInstance(get_sdk().http_client, PooledHttpClient)
+        with override_settings(MERCADOPAGO_READ_TIMEOUT=1):
+            self.assertEqual(get_sdk().http_client.timeout[1], 1)
+
+    def test_reutiliza_la_conexion(self):
+        self.mp.pagos['123'] = {
+            'id': 123, 'status': 'approved', 'status_detail': 'accredited', 'external_reference': '7',
+            'transaction_amount': 100, 'payment_method_id': 'visa',
+        }
+        preferencia = create_preference(pedido_mp(7))
+        self.assertTrue(preferencia['init_point'].startswith(self.mp.url))
+        pago = process_payment_notification('123')
+        create_preference(pedido_mp(8))
+
+        self.assertEqual((pago['status'], pago['order_id']), ('approved', '7'))
+        self.assertEqual(len(self.mp.requests), 3)
+        self.assertEqual(self.mp.conexiones, 1)
+        self.assertEqual(self.mp.requests[0]['body']['external_reference'], '7')
+        self.assertTrue(self.mp.requests[0]['headers']['Authorization'].startswith('Bearer '))
+
+    def test_reintenta_ante_errores_del_servidor(self):
+        self.mp.pagos['5'] = {
+            'id': 5, 'status': 'pending', 'status_detail': 'pending_contingency', 'external_reference': '1',
+            'transaction_amount': 100, 'payment_method_id': 'visa',
+        }
+        self.mp.fallos = 2
+        self.assertEqual(process_payment_notification('5')['status'], 'pending')
+        self.assertEqual(len(self.mp.requests), 3)
+
+    def test_error_de_mercado_pago(self):
+        self.mp.fallos = 3
+        with self.assertRaisesMessage(Exception, 'Error de Mercado Pago: Servicio no disponible'):
+            create_preference(pedido_mp())
@@ -1,5 +1,7 @@
+from datetime import timedelta
 from django.test import TestCase
-from market.models import Category, Product, Order, OrderDetail, Pay, Shipment, Cart, CartItem
+from decimal import Decimal
+from market.models import Category, Product, Order, OrderDetail, Pay, Shipment, Cart, CartItem, SchedulerLock, CodigoDescuento
 from account_admin.models import User
 from faker import Faker
 
@@ -109,4 +111,137 @@ class TestModels(TestCase):
         self.assertEqual(self.order_detail.subtotal, self.product.precio * 5)
 
     def test_cartitem_subtotal(self):
-        self.assertEqual(self.cart_item.subtotal(), self.product.precio * self.cart_item.cantidad)
\ No newline at end of file
+        self.assertEqual(self.cart_item.subtotal(), self.product.precio * self.cart_item.cantidad)
+
+class TestProductEnStock(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.product = Product.objects.create(
+            nombre=fake.word(),
+            descripcion=fake.text(),
+            precio=100,
+            stock_proveedor=3,
+            categoria=self.category
+        )
+
+    def test_en_stock_calculado_al_guardar(self):
+        self.assertTrue(self.product.en_stock)
+        self.product.stock_vendido = 3
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.en_stock)
+
+    def test_en_stock_con_update_fields(self):
+        self.product.stock_vendido = 3
+        self.product.save(update_fields=['stock_vendido'])
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.en_stock)
+
+    def test_en_stock_ilimitado(self):
+        self.product.stock_proveedor = 0
+        self.product.stock_ilimitado = True
+        self.product.save()
+        self.assertTrue(Product.objects.disponibles().filter(pk=self.product.pk).exists())
+
+    def test_actualizar_en_stock_masivo(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_vendido=3)
+        Product.objects.filter(pk=self.product.pk).actualizar_en_stock()
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.en_stock)
+
+
+class TestSchedulerLock(TestCase):
+    def test_un_solo_lider(self):
+        ttl = timedelta(seconds=60)
+        self.assertTrue(SchedulerLock.adquirir('scheduler', 'proceso-a', ttl))
+        self.assertFalse(SchedulerLock.adquirir('scheduler', 'proceso-b', ttl))
+        # El líder puede renovar
+        self.assertTrue(SchedulerLock.adquirir('scheduler', 'proceso-a', ttl))
+
+    def test_failover_al_vencer_el_lease(self):
+        self.assertTrue(SchedulerLock.adquirir('scheduler', 'proceso-a', timedelta(seconds=-1)))
+        self.assertTrue(SchedulerLock.adquirir('scheduler', 'proceso-b', timedelta(seconds=60)))
+        self.assertFalse(SchedulerLock.adquirir('scheduler', 'proceso-a', timedelta(seconds=60)))
+
+    def test_liberar(self):
+        ttl = timedelta(seconds=60)
+        SchedulerLock.adquirir('scheduler', 'proceso-a', ttl)
+        SchedulerLock.liberar('scheduler', 'proceso-a')
+        self.assertTrue(SchedulerLock.adquirir('scheduler', 'proceso-b', ttl))
+
+
+class TestTotalesPedido(TestCase):
+    def setUp(self):
+        categoria = Category.objects.create(nombre='relojes', descripcion='')
+        self.a = Product.objects.create(nombre='A', descripcion='d', precio=100, stock_proveedor=10, categoria=categoria)
+        self.b = Product.objects.create(nombre='B', descripcion='d', precio=30, stock_proveedor=10, categoria=categoria)
+        self.pedido = Order.objects.create(costo_envio=Decimal('10.00'))
+        self.pedido.total_update()
+
+    def releer(self):
+        return Order.objects.values_list('subtotal', 'cantidad_items', 'total').get(pk=self.pedido.pk)
+
+    def test_detalles_actualizan_totales(self):
+        detalle = OrderDetail.objects.create(pedido=self.pedido, producto=self.a, cantidad=2)
+        OrderDetail.objects.create(pedido=self.pedido, producto=self.b, cantidad=1)
+        self.assertEqual(self.releer(), (Decimal('230.00'), 3, Decimal('240.00')))
+        # El pedido en memoria queda al día sin releerlo
+        self.assertEqual((self.pedido.subtotal, self.pedido.cantidad_items), (Decimal('230.00'), 3))
+
+        detalle = OrderDetail.objects.get(pk=detalle.pk)
+        detalle.cantidad = 1
+        detalle.save()
+        self.assertEqual(self.releer(), (Decimal('130.00'), 2, Decimal('140.00')))
+
+        detalle.delete()
+        self.assertEqual(self.releer(), (Decimal('30.00'), 1, Decimal('40.00')))
+
+    def test_cambio_de_detalle_sin_leer_el_pedido(self):
+        detalle = OrderDetail.objects.create(pedido=self.pedido, producto=self.a, cantidad=1)
+        detalle = OrderDetail.objects.get(pk=detalle.pk)
+        detalle.cantidad = 3
+        # SELECT del producto + savepoint, UPDATE del detalle, UPDATE del pedido, release
+        with self.assertNumQueries(5):
+            detalle.save()
+        self.assertEqual(self.releer(), (Decimal('300.00'), 3, Decimal('310.00')))
+
+    def test_total_update_descuenta_el_descuento(self):
+        OrderDetail.objects.create(pedido=self.pedido, producto=self.a, cantidad=2)
+        codigo = CodigoDescuento.objects.create(codigo='PROMO', porcentaje_descuento=Decimal('10.00'))
+        codigo.registrar_uso(self.pedido, monto_descuento=20)
+        self.pedido.total_update()
+        pedido = Order.objects.get(pk=self.pedido.pk)
+        self.assertEqual((pedido.descuento, pedido.porcentaje_descuento), (Decimal('20.00'), Decimal('10.00')))
+        self.assertEqual(pedido.total, Decimal('190.00'))
+        codigo.refresh_from_db()
+        self.assertEqual(codigo.usos_actuales, 1)
+
+    def test_cambio_de_estado_sin_prelectura(self):
+        pedido = Order.objects.get(pk=self.pedido.pk)
+        pedido.estado = 'pagado'
+        with self.assertNumQueries(1):
+            pedido.save(update_fields=['estado'])
+
+    def test_cancelar_devuelve_stock_una_sola_vez(self):
+        OrderDetail.objects.create(pedido=self.pedido, producto=self.a, cantidad=2)
+        Product.objects.filter(pk=self.a.pk).update(stock_vendido=2)
+        primero = Order.objects.get(pk=self.pedido.pk)
+        segundo = Order.objects.get(pk=self.pedido.pk)
+        for pedido in (primero, segundo):
+            pedido.estado = 'cancelado'
+            pedido.save(update_fields=['estado'])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock_vendido, 0)
+        self.assertEqual(Order.objects.get(pk=self.pedido.pk).estado, 'cancelado')
+
+    def test_scheduler_no_arranca_en_comandos_de_gestion(self):
+        from unittest import mock
+        from Velorum.apps import es_comando_de_gestion
+        for argv, esperado in [
+            (['manage.py', 'migrate'], True),
+            (['manage.py', 'createcachetable'], True),
+            (['manage.py', 'runserver'], False),
+            (['/venv/bin/gunicorn', 'Velorum.wsgi'], False),
+        ]:
+            with mock.patch('sys.argv', argv):
+                self.assertEqual(es_comando_de_gestion(), esperado, argv)
@@ -0,0 +1,109 @@
+from datetime import timedelta
+from unittest.mock import patch
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from market.models import *
+from market.mp_inbox import backoff, procesar_bandeja
+
+
+def pago_mp(order_id, status='approved', payment_id=123):
+    return {
+        'status': status, 'status_detail': 'accredited', 'order_id': str(order_id),
+        'transaction_amount': 200, 'payment_method_id': 'visa', 'payment_id': payment_id,
+    }
+
+
+@patch('market.mp_inbox.send_order_paid_notification')
+@patch('market.mp_inbox.process_payment_notification')
+class TestBandejaMP(APITestCase):
+    def setUp(self):
+        self.pedido = Order.objects.create(estado='pendiente', total=200)
+        self.url = reverse('mp-webhook')
+
+    def notificar(self, payment_id=123, notificacion_id=None):
+        datos = {'type': 'payment', 'data': {'id': str(payment_id)}}
+        if notificacion_id:
+            datos['id'] = notificacion_id
+        response = self.client.post(self.url, datos, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_webhook_no_consulta_a_mp(self, process_payment_notification, send_order_paid_notification):
+        self.notificar()
+        process_payment_notification.assert_not_called()
+        notificacion = NotificacionMP.objects.get()
+        self.assertEqual((notificacion.topic, notificacion.recurso_id, notificacion.estado), ('payment', '123', 'pendiente'))
+
+    def test_otros_topics_se_ignoran(self, process_payment_notification, send_order_paid_notification):
+        self.client.post(self.url + '?topic=merchant_order&id=9')
+        self.assertFalse(NotificacionMP.objects.exists())
+
+    def test_reentregas_se_deduplican(self, process_payment_notification, send_order_paid_notification):
+        self.notificar(notificacion_id=555)
+        self.notificar(notificacion_id=555)
+        self.client.post(self.url + '?topic=payment&id=123', HTTP_X_REQUEST_ID='abc')
+        self.client.post(self.url + '?topic=payment&id=123', HTTP_X_REQUEST_ID='abc')
+        self.assertEqual(NotificacionMP.objects.count(), 2)
+
+    def test_agrupa_notificaciones_del_mismo_pago(self, process_payment_notification, send_order_paid_notification):
+        process_payment_notification.return_value = pago_mp(self.pedido.id)
+        for notificacion_id in [1, 2, 3]:
+            self.notificar(notificacion_id=notificacion_id)
+
+        self.assertEqual(procesar_bandeja(), {'procesados': 1, 'reintentos': 0, 'fallidos': 0})
+        process_payment_notification.assert_called_once_with('123')
+        self.assertEqual(NotificacionMP.objects.filter(estado='procesada').count(), 3)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, 'pagado')
+        self.assertEqual(Pay.objects.get(pedido=self.pedido).estado, 'completado')
+        send_order_paid_notification.assert_called_once()
+
+        # Una reentrega posterior no vuelve a notificar el pago
+        self.notificar(notificacion_id=4)
+        procesar_bandeja()
+        self.assertEqual(Pay.objects.filter(pedido=self.pedido).count(), 1)
+        send_order_paid_notification.assert_called_once()
+
+    def test_reintento_con_backoff(self, process_payment_notification, send_order_paid_notification):
+        process_payment_notification.side_effect = Exception('timeout')
+        self.notificar()
+
+        self.assertEqual(procesar_bandeja()['reintentos'], 1)
+        notificacion = NotificacionMP.objects.get()
+        self.assertEqual((notificacion.estado, notificacion.intentos, notificacion.error), ('pendiente', 1, 'timeout'))
+        self.assertGreater(notificacion.proximo_intento, timezone.now())
+
+        # Antes de que venza el backoff no se reintenta
+        procesar_bandeja()
+        self.assertEqual(process_payment_notification.call_count, 1)
+
+        NotificacionMP.objects.update(proximo_intento=timezone.now())
+        process_payment_notification.side_effect = None
+        process_payment_notification.return_value = pago_mp(self.pedido.id)
+        self.assertEqual(procesar_bandeja()['procesados'], 1)
+        self.assertEqual(NotificacionMP.objects.get().estado, 'procesada')
+
+    @override_settings(MP_INBOX_MAX_INTENTOS=2)
+    def test_fallida_tras_max_intentos(self, process_payment_notification, send_order_paid_notification):
+        process_payment_notification.side_effect = Exception('timeout')
+        self.notificar()
+        procesar_bandeja()
+        NotificacionMP.objects.update(proximo_intento=timezone.now())
+        self.assertEqual(procesar_bandeja()['fallidos'], 1)
+        self.assertEqual(NotificacionMP.objects.get().estado, 'fallida')
+
+    def test_retoma_notificaciones_abandonadas(self, process_payment_notification, send_order_paid_notification):
+        process_payment_notification.return_value = pago_mp(self.pedido.id)
+        self.notificar()
+        NotificacionMP.objects.update(estado='procesando', tomada=timezone.now())
+        self.assertEqual(procesar_bandeja()['procesados'], 0)
+
+        NotificacionMP.objects.update(tomada=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(procesar_bandeja()['procesados'], 1)
+
+    def test_backoff_exponencial(self, process_payment_notification, send_order_paid_notification):
+        self.assertEqual(backoff(1), timedelta(seconds=30))
+        self.assertEqual(backoff(3), timedelta(seconds=120))
+        self.assertEqual(backoff(20), timedelta(hours=1))
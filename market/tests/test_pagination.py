@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from faker import Faker
+from rest_framework.test import APITestCase
+from market.models import *
+
+fake = Faker()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestKeysetPagination(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        # Precios repetidos para ejercitar el desempate por id
+        self.productos = [
+            Product.objects.create(
+                nombre=f'Reloj {i}', descripcion='d', precio=100 * (i // 3 + 1),
+                stock_proveedor=5, categoria=self.categoria
+            )
+            for i in range(10)
+        ]
+
+    def recorrer(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(fila['id'] for fila in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_recorre_todo_sin_repetir_con_precios_empatados(self):
+        ids = self.recorrer(reverse('product-list') + '?cursor=&page_size=4&orden=precio_desc')
+        esperado = [p.id for p in sorted(self.productos, key=lambda p: (-p.precio, -p.id))]
+        self.assertEqual(ids, esperado)
+
+    def test_inserciones_no_desplazan_paginas(self):
+        url = reverse('product-list') + '?cursor=&page_size=4'
+        primera = self.client.get(url).data
+        Product.objects.create(nombre='Nuevo', descripcion='d', precio=50, stock_proveedor=5, categoria=self.categoria)
+        segunda = self.client.get(primera['next']).data
+
+        ids_primera = [fila['id'] for fila in primera['results']]
+        ids_segunda = [fila['id'] for fila in segunda['results']]
+        self.assertEqual(ids_segunda, sorted([p.id for p in self.productos], reverse=True)[4:8])
+        self.assertFalse(set(ids_primera) & set(ids_segunda))
+
+    def test_pagina_anterior(self):
+        url = reverse('product-list') + '?cursor=&page_size=3&orden=precio_asc'
+        primera = self.client.get(url).data
+        self.assertIsNone(primera['previous'])
+        segunda = self.client.get(primera['next']).data
+        volver = self.client.get(segunda['previous']).data
+        self.assertEqual(volver['results'], primera['results'])
+        self.assertIsNotNone(volver['next'])
+
+    def test_cursor_y_listado_por_pagina_no_comparten_cache(self):
+        cliente = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=cliente)
+        url = reverse('product-list')
+        for orden in (['?cursor=', ''], ['', '?cursor=']):
+            cache.clear()
+            respuestas = {sufijo: self.client.get(url + sufijo).data for sufijo in orden}
+            self.assertEqual(list(respuestas['?cursor=']), ['next', 'previous', 'results'])
+            self.assertEqual(respuestas['']['count'], 10)
+
+    def test_orden_no_paginable_con_cursor(self):
+        # La relevancia de la búsqueda es una anotación: con cursor se rechaza en lugar de reordenar
+        response = self.client.get(reverse('product-list') + '?cursor=&q=reloj')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertEqual(self.client.get(reverse('product-list') + '?q=reloj').status_code, 200)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('product-list') + '?cursor=basura')
+        self.assertEqual(response.status_code, 404)
+
+    def test_sin_cursor_mantiene_paginacion_por_numero(self):
+        response = self.client.get(reverse('product-list') + '?page=2&page_size=4')
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_pedidos(self):
+        admin = User.objects.create_user(username=fake.unique.user_name(), password='x', role='admin')
+        self.client.force_authenticate(user=admin)
+        pedidos = [Order.objects.create(usuario=admin) for _ in range(5)]
+
+        # Sin cursor: lista completa, como antes
+        self.assertEqual(len(self.client.get(reverse('order-list')).data), 5)
+
+        ids = self.recorrer(reverse('order-list') + '?cursor=&page_size=2')
+        self.assertEqual(ids, [p.id for p in reversed(pedidos)])
@@ -0,0 +1,263 @@
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from rest_framework.test import APITestCase
+from market.models import *
+
+fake = Faker()
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-query-counts'}
+
+
+class TestListQueryCounts(APITestCase):
+    """
+    Las vistas de listado deben ejecutar una cantidad fija de queries,
+    sin importar cuántas filas devuelven (regresión de N+1).
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username=fake.unique.user_name(), password='x', role='admin', is_staff=True
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.carrito = Cart.objects.create(usuario=self.admin)
+
+    def crear_filas(self, cantidad):
+        """Crea `cantidad` productos (cada uno con su categoría), pedidos, pagos, envíos, items y favoritos"""
+        for _ in range(cantidad):
+            categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+            producto = Product.objects.create(
+                nombre=fake.word(), descripcion='d', precio=100, stock_proveedor=10, categoria=categoria
+            )
+            cliente = User.objects.create_user(username=fake.unique.user_name())
+            pedido = Order.objects.create(usuario=cliente, total=100)
+            OrderDetail.objects.create(pedido=pedido, producto=producto, cantidad=1, subtotal=100)
+            Pay.objects.create(pedido=pedido, metodo='transferencia', monto_pagado=100)
+            Shipment.objects.create(pedido=pedido, direccion_envio='Calle 1', empresa_envio='Correo')
+            CartItem.objects.create(carrito=self.carrito, producto=producto, cantidad=1)
+            Favorite.objects.create(user=self.admin, product=producto)
+
+    def contar_queries(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(contexto.captured_queries)
+
+    def assertQueriesConstantes(self, url_name):
+        url = reverse(url_name)
+        self.crear_filas(2)
+        con_pocas = self.contar_queries(url)
+        self.crear_filas(5)
+        con_muchas = self.contar_queries(url)
+        self.assertEqual(con_pocas, con_muchas, f"{url_name}: {con_pocas} queries con 2 filas, {con_muchas} con 7")
+
+    def test_categorias(self):
+        self.assertQueriesConstantes('category-list')
+
+    def test_productos(self):
+        self.assertQueriesConstantes('product-list')
+
+    @override_settings(CACHES={'default': LOCMEM, 'shared': LOCMEM})
+    def test_productos_cliente(self):
+        # Camino de los clientes: cache del catálogo y serializer compacto (admin no pasa por ahí)
+        cliente = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=cliente)
+        url = reverse('product-list')
+
+        def contar():
+            cache.clear()  # Medir la consulta a la BD, no el hit de cache
+            return self.contar_queries(url)
+
+        self.crear_filas(2)
+        con_pocas = contar()
+        self.crear_filas(5)
+        self.assertEqual(con_pocas, contar())
+        # La segunda lectura sale del cache
+        self.assertEqual(self.contar_queries(url), 0)
+
+    def test_pedidos(self):
+        self.assertQueriesConstantes('order-list')
+
+    def test_mis_pedidos(self):
+        url = reverse('order-my-orders')
+        self.crear_filas(7)
+        productos = list(Product.objects.all())
+
+        def crear_pedidos(cantidad):
+            for producto in productos[:cantidad]:
+                pedido = Order.objects.create(usuario=self.admin)
+                for otro in productos[:cantidad]:
+                    OrderDetail.objects.create(pedido=pedido, producto=otro, cantidad=1, subtotal=100)
+
+        crear_pedidos(2)
+        con_pocos = self.contar_queries(url)
+        crear_pedidos(5)
+        self.assertEqual(con_pocos, self.contar_queries(url))
+
+    def test_pagos(self):
+        self.assertQueriesConstantes('pay-list')
+
+    def test_envios(self):
+        self.assertQueriesConstantes('shipment-list')
+
+    def test_carrito(self):
+        self.assertQueriesConstantes('cart-list')
+
+    def test_items_del_carrito(self):
+        self.assertQueriesConstantes('cartitem-list')
+
+    def test_favoritos(self):
+        self.assertQueriesConstantes('favorites-list')
+
+    def test_codigos_descuento(self):
+        self.assertQueriesConstantes('codigo-descuento-list')
+
+
+class TestCheckoutQueryCounts(APITestCase):
+    """El checkout debe escribir en lote: las queries no dependen de la cantidad de items"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=self.user)
+        self.categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.carrito = Cart.objects.create(usuario=self.user)
+
+    def crear_productos(self, cantidad):
+        return [
+            Product.objects.create(nombre=fake.word(), descripcion='d', precio=100, stock_proveedor=10, categoria=self.categoria)
+            for _ in range(cantidad)
+        ]
+
+    def contar_checkout(self, cantidad):
+        for producto in self.crear_productos(cantidad):
+            CartItem.objects.create(carrito=self.carrito, producto=producto, cantidad=2)
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(reverse('cart-checkout'))
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(contexto.captured_queries)
+
+    def test_checkout(self):
+        con_uno = self.contar_checkout(1)
+        con_diez = self.contar_checkout(10)
+        self.assertEqual(con_uno, con_diez)
+        self.assertLessEqual(con_diez, 12)
+        pedido = Order.objects.latest('id')
+        self.assertEqual(pedido.detalles.count(), 10)
+        self.assertEqual(pedido.total, 10 * 2 * 100)
+
+    def contar_preferencia(self, cantidad):
+        productos = self.crear_productos(cantidad)
+        datos = {
+            'customer_data': {'email': 'cliente@example.com'},
+            'shipping_data': {},
+            # watch_id como string, igual que algunos clientes del frontend
+            'cart_items': [{'watch_id': str(p.id), 'quantity': 1, 'price': 100} for p in productos],
+            'total': 100 * cantidad,
+        }
+        with patch('market.views.create_preference') as create_preference:
+            create_preference.return_value = {'preference_id': 'pref', 'init_point': 'http://mp'}
+            with CaptureQueriesContext(connection) as contexto:
+                response = self.client.post(reverse('mp-create-preference'), datos, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(contexto.captured_queries)
+
+    def test_preferencia_mp(self):
+        self.assertEqual(self.contar_preferencia(1), self.contar_preferencia(10))
+        self.assertEqual(Product.objects.filter(stock_vendido=1).count(), 11)
+
+
+class TestCarritoQueryCounts(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=self.user)
+        self.carrito = Cart.objects.create(usuario=self.user)
+        for precio in (100, 250, 40):
+            categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+            producto = Product.objects.create(
+                nombre=fake.word(), descripcion='d', precio=precio, stock_proveedor=10, categoria=categoria
+            )
+            CartItem.objects.create(carrito=self.carrito, producto=producto, cantidad=2)
+
+    def test_carrito_en_dos_queries(self):
+        # Carrito + items con producto y categoría (JOIN); los totales no consultan
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cart-list'))
+        self.assertEqual(response.data['total'], 780.0)
+        self.assertEqual(response.data['cantidad_items'], 6)
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertTrue(all(item['categoria_nombre'] for item in response.data['items']))
+
+    def test_totales_sin_precarga_en_una_query(self):
+        carrito = Cart.objects.get(pk=self.carrito.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(carrito.totales(), (Decimal('780.00'), 6))
+        self.assertEqual(Cart.objects.create(usuario=User.objects.create_user(username='vacio')).totales(), (Decimal('0.00'), 0))
+
+
+class TestCarritoEnLote(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=self.user)
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+        self.productos = [
+            Product.objects.create(nombre=f'Reloj {i}', descripcion='d', precio=100, stock_proveedor=5, categoria=self.categoria)
+            for i in range(4)
+        ]
+        self.url = reverse('cart-add-items')
+
+    def cantidades(self):
+        return dict(CartItem.objects.filter(carrito__usuario=self.user).values_list('producto_id', 'cantidad'))
+
+    def test_merge_suma_y_crea_en_queries_fijas(self):
+        a, b, c, d = self.productos
+        carrito = Cart.objects.create(usuario=self.user)
+        CartItem.objects.create(carrito=carrito, producto=a, cantidad=2)
+        items = [{'producto': p.id, 'cantidad': 1} for p in (a, b, c, d)] + [{'producto': b.id, 'cantidad': 1}]
+
+        # Carrito, lock, items y productos, UPDATE + INSERT en bloque (con savepoint) y el carrito
+        # de la respuesta. El número exacto es de SQLite (savepoints, RETURNING, FOR UPDATE):
+        # en MySQL puede variar, lo que importa es que no crece con la cantidad de líneas
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.cantidades(), {a.id: 3, b.id: 2, c.id: 1, d.id: 1})
+        self.assertEqual(response.data['carrito']['cantidad_items'], 7)
+
+    def test_reemplazar(self):
+        a = self.productos[0]
+        CartItem.objects.create(carrito=Cart.objects.create(usuario=self.user), producto=a, cantidad=2)
+        response = self.client.post(self.url, {'items': [{'producto': a.id, 'cantidad': 4}], 'reemplazar': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cantidades(), {a.id: 4})
+
+    def test_sin_stock_no_guarda_nada(self):
+        a, b = self.productos[:2]
+        CartItem.objects.create(carrito=Cart.objects.create(usuario=self.user), producto=b, cantidad=4)
+        items = [{'producto': a.id, 'cantidad': 1}, {'producto': b.id, 'cantidad': 2}, {'producto': 999, 'cantidad': 1}]
+        response = self.client.post(self.url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([f['producto_id'] for f in response.data['faltantes']], [b.id, 999])
+        self.assertEqual(response.data['faltantes'][0]['solicitado'], 6)
+        self.assertEqual(self.cantidades(), {b.id: 4})
+
+    def test_producto_desactivado_es_como_inexistente(self):
+        # Igual que add_to_cart (404): un producto fuera del catálogo no se puede agregar
+        a, oculto = self.productos[:2]
+        Product.objects.filter(pk=oculto.pk).update(desactivado=True)
+        items = [{'producto': a.id, 'cantidad': 1}, {'producto': oculto.id, 'cantidad': 1}]
+        response = self.client.post(self.url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['faltantes'], [
+            {'producto_id': oculto.id, 'nombre': f'#{oculto.id}', 'solicitado': 1, 'disponible': 0}
+        ])
+        self.assertEqual(self.cantidades(), {})
+
+    def test_items_invalidos(self):
+        for body in ({}, {'items': []}, {'items': [{'cantidad': 1}]}, {'items': [{'producto': self.productos[0].id, 'cantidad': 0}]}):
+            self.assertEqual(self.client.post(self.url, body, format='json').status_code, 400, body)
+        self.assertFalse(CartItem.objects.exists())
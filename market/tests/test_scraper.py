@@ -0,0 +1,253 @@
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from market.models import Category, Product
+from market.scraper import (
+    ScrapeIncompleto, deactivate_missing_products, next_sync_generation, scrape_category, scrape_subcategories,
+    sync_external_products, upsert_category_products
+)
+
+
+def producto_json(id_producto, nombre='Reloj', precio=1000, cantidad=5, **extra):
+    data = {
+        'idProductos': id_producto,
+        'p_nombre': nombre,
+        'p_descripcion': 'Descripción',
+        'p_precio': precio,
+        'p_link': f'reloj-{id_producto}',
+        'stock': [{'s_cantidad': cantidad, 's_ilimitado': 0, 's_precio': precio}],
+        'imagenes': [{'i_link': f'img/{id_producto}.jpg'}],
+    }
+    data.update(extra)
+    return data
+
+
+class TestUpsertCategoryProducts(TestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='Relojes')
+
+    def test_crea_productos_nuevos(self):
+        nuevos, actualizados, _, ids, errores = upsert_category_products(
+            [producto_json(1, 'Casio'), producto_json(2, 'Casio')], self.categoria
+        )
+        self.assertEqual((nuevos, actualizados), (2, 0))
+        self.assertEqual(sorted(ids), ['1', '2'])
+        self.assertEqual(errores, [])
+        slugs = set(Product.objects.values_list('slug', flat=True))
+        self.assertEqual(slugs, {'casio', 'casio-1'})
+        producto = Product.objects.get(external_id='1')
+        self.assertEqual(producto.precio, Decimal('2200.00'))
+        self.assertTrue(producto.en_stock)
+
+    def test_actualiza_y_respeta_precio_manual(self):
+        upsert_category_products([producto_json(1), producto_json(2)], self.categoria)
+        Product.objects.filter(external_id='1').update(precio=Decimal('999.00'), precio_manual=True)
+
+        nuevos, actualizados, _, _, _ = upsert_category_products(
+            [producto_json(1, precio=2000, cantidad=0), producto_json(2, precio=2000)], self.categoria
+        )
+        self.assertEqual((nuevos, actualizados), (0, 2))
+        manual = Product.objects.get(external_id='1')
+        self.assertEqual(manual.precio, Decimal('999.00'))
+        self.assertEqual(manual.precio_proveedor, Decimal('2000.00'))
+        self.assertFalse(manual.en_stock)
+        self.assertEqual(Product.objects.get(external_id='2').precio, Decimal('4400.00'))
+
+    def test_desactivar_precio_manual_vuelve_a_calcular_el_precio(self):
+        upsert_category_products([producto_json(1)], self.categoria)
+        Product.objects.filter(external_id='1').update(precio=Decimal('999.00'), precio_manual=True)
+        # Activarlo cambia la huella: se reescribe una vez, manteniendo el precio manual
+        self.assertEqual(upsert_category_products([producto_json(1)], self.categoria)[1], 1)
+        self.assertEqual(upsert_category_products([producto_json(1)], self.categoria)[1:3], (0, 1))
+        self.assertEqual(Product.objects.get(external_id='1').precio, Decimal('999.00'))
+
+        # Sin cambios en el proveedor, pero el precio manual se desactivó
+        Product.objects.filter(external_id='1').update(precio_manual=False)
+        _, actualizados, _, _, _ = upsert_category_products([producto_json(1)], self.categoria)
+        self.assertEqual(actualizados, 1)
+        self.assertEqual(Product.objects.get(external_id='1').precio, Decimal('2200.00'))
+
+    def test_no_reescribe_productos_sin_cambios(self):
+        upsert_category_products([producto_json(1), producto_json(2)], self.categoria)
+        last_sync = Product.objects.get(external_id='1').last_sync
+
+        nuevos, actualizados, sin_cambios, ids, _ = upsert_category_products(
+            [producto_json(1), producto_json(2, cantidad=1)], self.categoria
+        )
+        self.assertEqual((nuevos, actualizados, sin_cambios), (0, 1, 1))
+        self.assertEqual(sorted(ids), ['1', '2'])
+        self.assertEqual(Product.objects.get(external_id='1').last_sync, last_sync)
+        self.assertEqual(Product.objects.get(external_id='2').stock_proveedor, 1)
+
+    def test_producto_invalido_se_reporta(self):
+        nuevos, _, _, _, errores = upsert_category_products(
+            [producto_json(1), {'p_nombre': 'roto'}], self.categoria
+        )
+        self.assertEqual(nuevos, 1)
+        self.assertEqual(len(errores), 1)
+
+
+class TestDeactivateMissingProducts(TestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='Relojes')
+        upsert_category_products([producto_json(1), producto_json(2), producto_json(3)], self.categoria)
+        # Ocultado a mano por un admin
+        Product.objects.filter(external_id='3').update(desactivado=True)
+
+    def test_desactiva_los_que_no_aparecen(self):
+        generacion = next_sync_generation()
+        upsert_category_products([producto_json(1)], self.categoria, generacion)
+        desactivados, reactivados = deactivate_missing_products(generacion, [self.categoria.id])
+        self.assertEqual((desactivados, reactivados), (1, 0))
+        producto = Product.objects.get(external_id='2')
+        self.assertTrue(producto.desactivado)
+        self.assertTrue(producto.desactivado_por_sync)
+        self.assertFalse(Product.objects.get(external_id='1').desactivado)
+
+    def test_reactiva_los_que_reaparecen(self):
+        generacion = next_sync_generation()
+        upsert_category_products([producto_json(1)], self.categoria, generacion)
+        deactivate_missing_products(generacion, [self.categoria.id])
+
+        generacion = next_sync_generation()
+        upsert_category_products([producto_json(1), producto_json(2), producto_json(3)], self.categoria, generacion)
+        desactivados, reactivados = deactivate_missing_products(generacion, [self.categoria.id])
+        self.assertEqual((desactivados, reactivados), (0, 1))
+        self.assertFalse(Product.objects.get(external_id='2').desactivado)
+        # El ocultado por el admin sigue oculto
+        self.assertTrue(Product.objects.get(external_id='3').desactivado)
+
+    def test_ignora_categorias_no_sincronizadas(self):
+        generacion = next_sync_generation()
+        desactivados, _ = deactivate_missing_products(generacion, [])
+        self.assertEqual(desactivados, 0)
+
+
+class TestMarcaDelProveedor(TestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='Relojes')
+
+    def test_guarda_la_subcategoria_como_marca(self):
+        upsert_category_products(
+            [producto_json(1, 'Reloj Casio'), producto_json(2, 'Reloj')], self.categoria,
+            subcategorias={'1': 'G-SHOCK'}
+        )
+        self.assertEqual(Product.objects.get(external_id='1').marca, 'G-SHOCK')
+        self.assertIn('g shock', Product.objects.get(external_id='1').busqueda_nombre)
+        self.assertEqual(Product.objects.get(external_id='2').marca, '')
+
+    def test_cambio_de_marca_actualiza_el_producto(self):
+        upsert_category_products([producto_json(1)], self.categoria, subcategorias={'1': 'TOMI'})
+        _, actualizados, sin_cambios, _, _ = upsert_category_products(
+            [producto_json(1)], self.categoria, subcategorias={'1': 'CHENXI'}
+        )
+        self.assertEqual((actualizados, sin_cambios), (1, 0))
+        self.assertEqual(Product.objects.get(external_id='1').marca, 'CHENXI')
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return {'data': self._data}
+
+
+class FakeSession:
+    """Sesión falsa: devuelve `paginas[n]` para filter_page=n (vacío después); las de `fallan` dan 500"""
+    def __init__(self, paginas, fallan=()):
+        self.paginas = paginas
+        self.fallan = fallan
+        self.pedidas = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        page = params['filter_page']
+        self.pedidas.append(page)
+        if page in self.fallan:
+            return FakeResponse([], status_code=500)
+        return FakeResponse(self.paginas[page] if page < len(self.paginas) else [])
+
+
+@override_settings(SCRAPER_PREFETCH_PAGES=3, SCRAPER_MAX_REQUESTS_PER_SECOND=0)
+class TestScrapeCategory(TestCase):
+    def test_junta_paginas_en_orden(self):
+        paginas = [
+            [producto_json(i) for i in range(0, 12)],
+            [producto_json(i) for i in range(12, 24)],
+            [producto_json(i) for i in range(24, 29)],
+        ]
+        session = FakeSession(paginas)
+        productos = scrape_category(session, 'token', [1], 'Relojes')
+        self.assertEqual([p['idProductos'] for p in productos], list(range(29)))
+        # Nunca pide más allá de la ventana de prefetch
+        self.assertLessEqual(max(session.pedidas), 2 + 2)
+
+    def test_una_sola_pagina_no_pide_de_mas(self):
+        # Caso típico de una subcategoría: sin prefetch hasta saber que hay más páginas
+        session = FakeSession([[producto_json(i) for i in range(5)]])
+        self.assertEqual(len(scrape_category(session, 'token', [1], 'Relojes')), 5)
+        self.assertEqual(session.pedidas, [0])
+
+    def test_error_http_corta_la_paginacion(self):
+        session = FakeSession([[producto_json(i) for i in range(12)]], fallan=[0])
+        with self.assertRaises(ScrapeIncompleto):
+            scrape_category(session, 'token', [1], 'Relojes')
+
+    def test_error_en_una_pagina_intermedia(self):
+        paginas = [[producto_json(i) for i in range(0, 12)], [producto_json(i) for i in range(12, 24)]]
+        with self.assertRaises(ScrapeIncompleto):
+            scrape_category(FakeSession(paginas, fallan=[1]), 'token', [1], 'Relojes')
+
+
+@override_settings(SCRAPER_PREFETCH_PAGES=1, SCRAPER_MAX_REQUESTS_PER_SECOND=0)
+class TestSyncConPaginasFallidas(TestCase):
+    CONFIG = {
+        'relojes': {'url': 'http://proveedor/relojes', 'ids': [1], 'categoria_nombre': 'Relojes', 'subcategorias': {1: 'Relojes'}}
+    }
+
+    def sincronizar(self, session):
+        with patch('market.scraper.CATEGORIAS_CONFIG', self.CONFIG), \
+                patch('market.scraper.get_session_and_csrf', return_value=(session, 'token')):
+            return sync_external_products()
+
+    def test_no_desactiva_productos_de_paginas_no_obtenidas(self):
+        paginas = [[producto_json(i) for i in range(0, 12)], [producto_json(i) for i in range(12, 20)]]
+        self.sincronizar(FakeSession(paginas))
+        self.assertEqual(Product.objects.filter(desactivado=False).count(), 20)
+
+        # La página 1 da 500: sus productos no aparecen, pero no es que hayan desaparecido
+        resultado = self.sincronizar(FakeSession(paginas, fallan=[1]))
+        self.assertEqual(resultado['desactivados'], 0)
+        self.assertEqual(len(resultado['errores']), 1)
+        self.assertIn('Relojes', resultado['errores'][0])
+        self.assertFalse(Product.objects.filter(desactivado=True).exists())
+
+        # Con el listado completo sí se desactivan los que faltan
+        resultado = self.sincronizar(FakeSession(paginas[:1]))
+        self.assertEqual((resultado['desactivados'], resultado['errores']), (8, []))
+
+
+class FakeSessionPorSubcategoria:
+    """Sesión falsa: una única página de productos por subcategoría"""
+    def __init__(self, productos_por_subcategoria):
+        self.productos = productos_por_subcategoria
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        sub_id = params['filter_categories[]'][0]
+        return FakeResponse(self.productos.get(sub_id, []) if params['filter_page'] == 0 else [])
+
+
+@override_settings(SCRAPER_PREFETCH_PAGES=1, SCRAPER_MAX_REQUESTS_PER_SECOND=0)
+class TestScrapeSubcategories(TestCase):
+    def test_mapea_cada_producto_a_su_subcategoria(self):
+        session = FakeSessionPorSubcategoria({
+            10: [producto_json(1), producto_json(2)],
+            20: [producto_json(2), producto_json(3)],
+        })
+        config = {'categoria_nombre': 'Relojes', 'subcategorias': {10: 'ROLEX', 20: 'Otros Relojes'}}
+        productos, subcategorias = scrape_subcategories(session, 'token', config)
+
+        self.assertEqual(len(productos), 4)
+        # El producto repetido queda en la primera subcategoría de la config
+        self.assertEqual(subcategorias, {'1': 'ROLEX', '2': 'ROLEX', '3': 'Otros Relojes'})
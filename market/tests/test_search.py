@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from faker import Faker
+from rest_framework.test import APITestCase
+from market.models import Category, Product
+from market.scraper import upsert_category_products
+from market.search import FTS_TABLE, buscar, normalizar_texto, reparar_indice_sqlite
+from market.tests.test_scraper import producto_json
+
+fake = Faker()
+
+
+class TestBuscarProductos(TestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+
+    def crear(self, nombre, descripcion='Reloj pulsera'):
+        return Product.objects.create(
+            nombre=nombre, descripcion=descripcion, precio=100, stock_proveedor=5, categoria=self.categoria
+        )
+
+    def ids(self, texto):
+        return [p.id for p in buscar(Product.objects.all(), texto).order_by('-relevancia', '-id')]
+
+    def test_normalizar_texto(self):
+        self.assertEqual(normalizar_texto('Reloj G-SHOCK Acción Ñandú'), 'reloj g shock accion nandu')
+        self.assertEqual(normalizar_texto(None), '')
+
+    def test_acentos_y_prefijos(self):
+        reloj = self.crear('Reloj Acción Casio')
+        self.crear('Smartwatch deportivo')
+        self.assertEqual(self.ids('accion'), [reloj.id])
+        self.assertEqual(self.ids('ACCIÓN cas'), [reloj.id])
+        self.assertEqual(self.ids('casio rolex'), [])
+
+    def test_nombre_pesa_mas_que_descripcion(self):
+        en_descripcion = self.crear('Reloj clásico', descripcion='Similar a un Rolex')
+        en_nombre = self.crear('Rolex Submariner')
+        self.assertEqual(self.ids('rolex'), [en_nombre.id, en_descripcion.id])
+
+    def test_indice_se_mantiene_al_guardar_y_borrar(self):
+        producto = self.crear('Reloj Tomi')
+        producto.nombre = 'Reloj Binbond'
+        producto.save(update_fields=['nombre'])
+        self.assertEqual(self.ids('tomi'), [])
+        self.assertEqual(self.ids('binbond'), [producto.id])
+
+        producto.delete()
+        self.assertEqual(self.ids('binbond'), [])
+
+    def test_indice_se_mantiene_en_el_sync(self):
+        upsert_category_products([producto_json(1, nombre='Reloj Chenxi Acero')], self.categoria)
+        self.assertEqual(len(self.ids('chenxi')), 1)
+
+        upsert_category_products([producto_json(1, nombre='Reloj Hublot Acero')], self.categoria)
+        self.assertEqual(self.ids('chenxi'), [])
+        self.assertEqual(len(self.ids('hublot')), 1)
+
+    def test_reparar_triggers_perdidos(self):
+        # Lo que pasa cuando un ALTER de SQLite reconstruye la tabla de productos
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {FTS_TABLE}_ai")
+        sin_indexar = self.crear('Reloj Orient')
+        self.assertEqual(self.ids('orient'), [])
+
+        reparar_indice_sqlite()
+        self.assertEqual(self.ids('orient'), [sin_indexar.id])
+        self.assertEqual(self.ids('seiko'), [])
+        con_trigger = self.crear('Reloj Seiko')
+        self.assertEqual(self.ids('seiko'), [con_trigger.id])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestBusquedaEnListado(APITestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.reloj = Product.objects.create(
+            nombre='Reloj Acción', descripcion='d', precio=100, stock_proveedor=5, categoria=categoria
+        )
+        Product.objects.create(nombre='Otro', descripcion='d', precio=100, stock_proveedor=5, categoria=categoria)
+
+    def test_q_usa_el_indice(self):
+        response = self.client.get(reverse('product-list') + '?q=accion')
+        self.assertEqual([fila['id'] for fila in response.data['results']], [self.reloj.id])
+
+    def test_q_con_cursor(self):
+        # Con un orden por columna la búsqueda se puede paginar por cursor (por relevancia no: 400)
+        response = self.client.get(reverse('product-list') + '?q=reloj&cursor=&orden=precio_asc')
+        self.assertEqual([fila['id'] for fila in response.data['results']], [self.reloj.id])
@@ -0,0 +1,363 @@
+from datetime import timedelta
+from unittest.mock import patch
+from django.urls import reverse
+from django.utils import timezone
+from faker import Faker
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from market.models import *
+from market.mp_inbox import procesar_bandeja
+from market.stock import (
+    agrupar_lineas, cancelar_pedidos, confirmar_reservas, crear_reservas, extender_reservas, liberar_reservas_vencidas,
+    reservar_stock,
+)
+
+fake = Faker()
+
+
+class TestReservarStock(TestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+
+    def crear(self, stock_proveedor=5, stock_vendido=0, **kwargs):
+        return Product.objects.create(
+            nombre=fake.word(), descripcion='d', precio=100, categoria=self.categoria,
+            stock_proveedor=stock_proveedor, stock_vendido=stock_vendido, **kwargs
+        )
+
+    def test_reserva_todas_las_lineas(self):
+        a = self.crear(stock_proveedor=5)
+        b = self.crear(stock_proveedor=2)
+        self.assertEqual(reservar_stock([(a.id, 3), (b.id, 2)]), [])
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock_vendido, a.en_stock), (3, True))
+        self.assertEqual((b.stock_vendido, b.en_stock), (2, False))
+
+    def test_si_una_linea_falla_no_se_reserva_ninguna(self):
+        a = self.crear(stock_proveedor=5)
+        b = self.crear(stock_proveedor=2, stock_vendido=1)
+        faltantes = reservar_stock([(a.id, 1), (b.id, 2)])
+        self.assertEqual(faltantes, [{'producto_id': b.id, 'nombre': b.nombre, 'solicitado': 2, 'disponible': 1}])
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock_vendido, b.stock_vendido), (0, 1))
+
+    def test_lineas_repetidas_se_suman(self):
+        a = self.crear(stock_proveedor=3)
+        self.assertEqual(agrupar_lineas([(a.id, 2), (a.id, 2)]), {a.id: 4})
+        self.assertEqual(len(reservar_stock([(a.id, 2), (a.id, 2)])), 1)
+        self.assertEqual(reservar_stock([(a.id, 2), (a.id, 1)]), [])
+
+    def test_stock_ilimitado(self):
+        a = self.crear(stock_proveedor=0, stock_ilimitado=True)
+        self.assertEqual(reservar_stock([(a.id, 50)]), [])
+        a.refresh_from_db()
+        self.assertEqual(a.stock_vendido, 50)
+
+    def test_decide_la_bd_y_no_la_instancia_en_memoria(self):
+        a = self.crear(stock_proveedor=2)
+        # Otro checkout vendió el stock después de que leímos el producto
+        Product.objects.filter(pk=a.pk).update(stock_vendido=2)
+        self.assertEqual(a.stock_disponible, 2)
+        self.assertEqual(reservar_stock([(a.id, 1)])[0]['disponible'], 0)
+
+    def test_una_sola_escritura_por_reserva(self):
+        productos = [self.crear(stock_proveedor=10) for _ in range(5)]
+        # UPDATE de stock_vendido + UPDATE de en_stock (dentro de su savepoint)
+        with self.assertNumQueries(4):
+            reservar_stock([(p.id, 1) for p in productos])
+
+
+class TestCheckoutReserva(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=self.user)
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+        self.carrito = Cart.objects.create(usuario=self.user)
+
+    def crear(self, stock_proveedor):
+        return Product.objects.create(
+            nombre=fake.word(), descripcion='d', precio=100, stock_proveedor=stock_proveedor, categoria=self.categoria
+        )
+
+    def test_checkout_sin_stock_no_crea_pedido(self):
+        a = self.crear(5)
+        b = self.crear(1)
+        CartItem.objects.create(carrito=self.carrito, producto=a, cantidad=2)
+        CartItem.objects.create(carrito=self.carrito, producto=b, cantidad=3)
+
+        response = self.client.post(reverse('cart-checkout'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Stock insuficiente', response.data['error'])
+        self.assertEqual([f['producto_id'] for f in response.data['faltantes']], [b.id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.carrito.items.count(), 2)
+        a.refresh_from_db()
+        self.assertEqual(a.stock_vendido, 0)
+
+    def test_checkout_vende_stock(self):
+        a = self.crear(5)
+        CartItem.objects.create(carrito=self.carrito, producto=a, cantidad=5)
+
+        response = self.client.post(reverse('cart-checkout'))
+        self.assertEqual(response.status_code, 201)
+        a.refresh_from_db()
+        self.assertEqual((a.stock_vendido, a.en_stock), (5, False))
+        self.assertEqual(self.carrito.items.count(), 0)
+
+    def datos_preferencia(self, producto, cantidad):
+        return {
+            'customer_data': {'email': 'cliente@example.com', 'nombre': 'Ana', 'apellido': 'Paz'},
+            'shipping_data': {'calle': 'Calle', 'numero': '1', 'ciudad': 'Córdoba', 'provincia': 'Córdoba'},
+            'cart_items': [{'watch_id': producto.id, 'quantity': cantidad, 'price': 100, 'name': producto.nombre}],
+            'total': 100 * cantidad,
+        }
+
+    @patch('market.views.create_preference')
+    def test_preferencia_mp_sin_stock(self, create_preference):
+        a = self.crear(1)
+        response = self.client.post(reverse('mp-create-preference'), self.datos_preferencia(a, 2), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        create_preference.assert_not_called()
+
+    @patch('market.views.create_preference')
+    def test_preferencia_mp_vende_stock(self, create_preference):
+        create_preference.return_value = {'preference_id': 'pref', 'init_point': 'http://mp'}
+        a = self.crear(2)
+        response = self.client.post(reverse('mp-create-preference'), self.datos_preferencia(a, 2), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        a.refresh_from_db()
+        self.assertEqual(a.stock_vendido, 2)
+
+
+class TestReservasConVencimiento(APITestCase):
+    def setUp(self):
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+        self.producto = Product.objects.create(
+            nombre='Reloj', descripcion='d', precio=100, stock_proveedor=5, categoria=self.categoria
+        )
+
+    def crear_pedido(self, cantidad=2):
+        pedido = Order.objects.create(estado='pendiente', total=100 * cantidad)
+        OrderDetail.objects.create(pedido=pedido, producto=self.producto, cantidad=cantidad, subtotal=100 * cantidad)
+        self.assertEqual(reservar_stock([(self.producto.id, cantidad)]), [])
+        crear_reservas(pedido)
+        return pedido
+
+    def vencer(self, pedido):
+        ReservaStock.objects.filter(pedido=pedido).update(expira=timezone.now() - timedelta(minutes=1))
+
+    def stock_vendido(self):
+        self.producto.refresh_from_db()
+        return self.producto.stock_vendido
+
+    @patch('market.views.create_preference')
+    def test_checkout_mp_crea_reserva(self, create_preference):
+        create_preference.return_value = {'preference_id': 'pref', 'init_point': 'http://mp'}
+        datos = {
+            'customer_data': {'email': 'cliente@example.com'},
+            'shipping_data': {},
+            'cart_items': [{'watch_id': self.producto.id, 'quantity': 2, 'price': 100}],
+            'total': 200,
+        }
+        response = self.client.post(reverse('mp-create-preference'), datos, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        reserva = ReservaStock.objects.get(pedido_id=response.data['order_id'])
+        self.assertEqual((reserva.producto_id, reserva.cantidad, reserva.estado), (self.producto.id, 2, ReservaStock.ACTIVA))
+        self.assertGreater(reserva.expira, timezone.now())
+
+    def test_barrido_libera_vencidas_y_cancela_el_pedido(self):
+        vencido = self.crear_pedido(2)
+        vigente = self.crear_pedido(1)
+        self.vencer(vencido)
+        self.assertEqual(self.stock_vendido(), 3)
+
+        resumen = liberar_reservas_vencidas()
+        self.assertEqual(resumen, {'liberadas': 1, 'confirmadas': 0, 'pedidos_cancelados': 1})
+        self.assertEqual(self.stock_vendido(), 1)
+        vencido.refresh_from_db()
+        vigente.refresh_from_db()
+        self.assertEqual((vencido.estado, vigente.estado), ('cancelado', 'pendiente'))
+        self.assertEqual(vencido.reservas.get().estado, ReservaStock.LIBERADA)
+
+        # Una segunda pasada no vuelve a liberar nada
+        self.assertEqual(liberar_reservas_vencidas()['liberadas'], 0)
+        self.assertEqual(self.stock_vendido(), 1)
+
+    def test_barrido_confirma_si_el_pedido_avanzo(self):
+        pedido = self.crear_pedido(2)
+        Order.objects.filter(pk=pedido.pk).update(estado='pagado')
+        self.vencer(pedido)
+        self.assertEqual(liberar_reservas_vencidas()['confirmadas'], 1)
+        self.assertEqual(self.stock_vendido(), 2)
+        self.assertEqual(pedido.reservas.get().estado, ReservaStock.CONFIRMADA)
+
+    def test_confirmar_reserva_activa(self):
+        pedido = self.crear_pedido(2)
+        self.assertEqual(confirmar_reservas(pedido), [])
+        self.assertEqual(pedido.reservas.get().estado, ReservaStock.CONFIRMADA)
+        self.assertEqual(self.stock_vendido(), 2)
+        self.vencer(pedido)
+        self.assertEqual(liberar_reservas_vencidas()['liberadas'], 0)
+
+    def test_pago_tardio_vuelve_a_vender(self):
+        pedido = self.crear_pedido(2)
+        self.vencer(pedido)
+        liberar_reservas_vencidas()
+        self.assertEqual(self.stock_vendido(), 0)
+
+        self.assertEqual(confirmar_reservas(pedido), [])
+        self.assertEqual(self.stock_vendido(), 2)
+        self.assertEqual(pedido.reservas.get().estado, ReservaStock.CONFIRMADA)
+
+    def test_cancelar_pedido_no_libera_dos_veces(self):
+        pedido = self.crear_pedido(2)
+        pedido.estado = 'cancelado'
+        pedido.save()
+        self.assertEqual(self.stock_vendido(), 0)
+        self.vencer(pedido)
+        self.assertEqual(liberar_reservas_vencidas()['liberadas'], 0)
+        self.assertEqual(pedido.reservas.get().estado, ReservaStock.LIBERADA)
+
+    @patch('market.mp_inbox.send_order_paid_notification')
+    @patch('market.mp_inbox.process_payment_notification')
+    def test_pago_pendiente_extiende_la_reserva(self, process_payment_notification, send_order_paid_notification):
+        # Cupón de Rapipago generado: el pago queda 'pending' hasta que el comprador lo paga
+        pedido = self.crear_pedido(2)
+        process_payment_notification.return_value = {
+            'status': 'pending', 'status_detail': 'pending_waiting_payment', 'order_id': str(pedido.id),
+            'transaction_amount': 200, 'payment_method_id': 'rapipago', 'payment_id': 123,
+        }
+        self.client.post(reverse('mp-webhook') + '?topic=payment&id=123')
+        procesar_bandeja()
+        reserva = pedido.reservas.get()
+        self.assertGreater(reserva.expira, timezone.now() + timedelta(hours=71))
+
+        # Pasada la reserva original de 30 minutos el barrido no cancela el pedido
+        self.assertEqual(liberar_reservas_vencidas(timezone.now() + timedelta(hours=1))['liberadas'], 0)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.estado, 'pendiente')
+        self.assertEqual(self.stock_vendido(), 2)
+
+        # Si el cupón vence sin pagarse, sí
+        self.assertEqual(liberar_reservas_vencidas(timezone.now() + timedelta(hours=73))['liberadas'], 1)
+        self.assertEqual(self.stock_vendido(), 0)
+
+    def test_extender_no_acorta_la_reserva(self):
+        pedido = self.crear_pedido(2)
+        self.assertEqual(extender_reservas(pedido, horas=48), 1)
+        self.assertEqual(extender_reservas(pedido, horas=1), 0)
+        self.assertGreater(pedido.reservas.get().expira, timezone.now() + timedelta(hours=47))
+
+    @patch('market.mp_inbox.send_order_paid_notification')
+    @patch('market.mp_inbox.process_payment_notification')
+    def test_webhook_aprobado_confirma(self, process_payment_notification, send_order_paid_notification):
+        pedido = self.crear_pedido(2)
+        process_payment_notification.return_value = {
+            'status': 'approved', 'status_detail': 'accredited', 'order_id': str(pedido.id),
+            'transaction_amount': 200, 'payment_method_id': 'visa', 'payment_id': 123,
+        }
+        response = self.client.post(reverse('mp-webhook') + '?topic=payment&id=123')
+        self.assertEqual(response.status_code, 200)
+        procesar_bandeja()
+        self.assertEqual(pedido.reservas.get().estado, ReservaStock.CONFIRMADA)
+
+
+class TestCancelacionEnBloque(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username=fake.unique.user_name(), role='admin')
+        self.categoria = Category.objects.create(nombre='relojes', descripcion='')
+        self.a = Product.objects.create(nombre='A', descripcion='d', precio=100, stock_proveedor=10, categoria=self.categoria)
+        self.b = Product.objects.create(nombre='B', descripcion='d', precio=50, stock_proveedor=10, categoria=self.categoria)
+
+    def crear_pedido(self, lineas, horas=0, estado='pendiente'):
+        pedido = Order.objects.create(estado=estado)
+        for producto, cantidad in lineas:
+            OrderDetail.objects.create(pedido=pedido, producto=producto, cantidad=cantidad)
+        self.assertEqual(reservar_stock([(producto.id, cantidad) for producto, cantidad in lineas]), [])
+        Order.objects.filter(pk=pedido.pk).update(fecha=timezone.now() - timedelta(hours=horas))
+        return pedido
+
+    def vendidos(self):
+        return tuple(Product.objects.filter(pk__in=[self.a.pk, self.b.pk]).order_by('pk').values_list('stock_vendido', flat=True))
+
+    def test_cancelar_pedidos_en_queries_fijas(self):
+        pedidos = [self.crear_pedido([(self.a, 1), (self.b, 2)]) for _ in range(3)]
+        self.assertEqual(self.vendidos(), (3, 6))
+        # SELECT con lock, UPDATE de pedidos, SELECT agregado, UPDATE de stock, en_stock y reservas
+        # (más savepoints), sin importar cuántos pedidos y detalles haya
+        with self.assertNumQueries(12):
+            resumen = cancelar_pedidos(Order.objects.filter(pk__in=[p.pk for p in pedidos]))
+        self.assertEqual(resumen, {'pedidos_cancelados': 3, 'productos_actualizados': 2})
+        self.assertEqual(self.vendidos(), (0, 0))
+        # Repetirlo no devuelve stock otra vez
+        self.assertEqual(cancelar_pedidos(Order.objects.all())['pedidos_cancelados'], 0)
+
+    def test_cancelar_un_pedido_devuelve_stock(self):
+        pedido = self.crear_pedido([(self.a, 2), (self.a, 1), (self.b, 1)])
+        pedido = Order.objects.get(pk=pedido.pk)
+        pedido.estado = 'cancelado'
+        pedido.save(update_fields=['estado'])
+        self.assertEqual(self.vendidos(), (0, 0))
+
+    def test_endpoint_cancela_solo_pendientes_viejos(self):
+        viejo = self.crear_pedido([(self.a, 2)], horas=72)
+        nuevo = self.crear_pedido([(self.a, 1)], horas=1)
+        pagado = self.crear_pedido([(self.b, 1)], horas=72, estado='pagado')
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(reverse('order-cancel-stale'), {'horas': 24}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pedidos_cancelados'], 1)
+        estados = dict(Order.objects.values_list('pk', 'estado'))
+        self.assertEqual((estados[viejo.pk], estados[nuevo.pk], estados[pagado.pk]), ('cancelado', 'pendiente', 'pagado'))
+        self.assertEqual(self.vendidos(), (1, 1))
+
+    def test_endpoint_respeta_reservas_vigentes(self):
+        # Cupón de pago en efectivo todavía vigente: no es un pedido abandonado
+        en_espera = self.crear_pedido([(self.a, 2)], horas=72)
+        crear_reservas(en_espera)
+        extender_reservas(en_espera, horas=24)
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(reverse('order-cancel-stale'), {'horas': 24}, format='json')
+        self.assertEqual(response.data['pedidos_cancelados'], 0)
+        en_espera.refresh_from_db()
+        self.assertEqual(en_espera.estado, 'pendiente')
+
+    def test_endpoint_solo_staff(self):
+        cliente = User.objects.create_user(username=fake.unique.user_name(), role='client')
+        self.client.force_authenticate(user=cliente)
+        self.assertEqual(self.client.post(reverse('order-cancel-stale')).status_code, 403)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.post(reverse('order-cancel-stale'), {'horas': 'x'}).status_code, 400)
+
+    def test_force_delete_devuelve_stock(self):
+        pedido = self.crear_pedido([(self.a, 3)])
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('order-force-delete', args=[pedido.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.filter(pk=pedido.pk).exists())
+        self.assertEqual(self.vendidos(), (0, 0))
+
+    @patch('market.views.cancelar_pedidos', return_value={'pedidos_cancelados': 0, 'productos_actualizados': 0})
+    def test_force_delete_no_depende_de_skip_locked(self, cancelar_pedidos):
+        # cancelar_pedidos saltea pedidos bloqueados (p. ej. por el webhook de MP): simula
+        # que lo salteó. force_delete espera el lock y devuelve el stock por su cuenta
+        pedido = self.crear_pedido([(self.a, 3)])
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('order-force-delete', args=[pedido.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.vendidos(), (0, 0))
+
+    def test_force_delete_de_pedido_cancelado_no_devuelve_dos_veces(self):
+        cancelado = self.crear_pedido([(self.a, 3)])
+        cancelar_pedidos(Order.objects.filter(pk=cancelado.pk))
+        self.crear_pedido([(self.a, 2)])
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('order-force-delete', args=[cancelado.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.filter(pk=cancelado.pk).exists())
+        self.assertEqual(self.vendidos(), (2, 0))
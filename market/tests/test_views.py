@@ -4,7 +4,12 @@ from rest_framework import status
 from market.models import *
 from account_admin.models import User
 from faker import Faker
-from unittest.mock import put
+from market.views import ProductViewSet
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 fake = Faker()
 
@@ -1385,4 +1390,280 @@ class TestViews(APITestCase):
         
         # Verificar que el envío se actualizó
         shipment.refresh_from_db()
-        self.assertEqual(shipment.estado, 'preparando')
\ No newline at end of file
+        self.assertEqual(shipment.estado, 'preparando')
+
+
+class TestSyncJobViews(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username=fake.unique.user_name(),
+            email=fake.unique.email(),
+            password='testpass123',
+            role='admin'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    @mock.patch('Velorum.scheduler.run_now')
+    def test_sync_encola_job(self, run_now):
+        response = self.client.post(reverse('manual-sync-products'))
+        self.assertEqual(response.status_code, 202)
+        job = SyncJob.objects.get(id=response.data['job_id'])
+        self.assertEqual(job.estado, 'pendiente')
+        self.assertEqual(job.creado_por, self.admin)
+        run_now.assert_called_once()
+
+        # Mientras haya uno activo, no se encola otro
+        response = self.client.post(reverse('manual-sync-products'))
+        self.assertEqual(response.data['job_id'], job.id)
+        self.assertTrue(response.data['ya_en_curso'])
+        run_now.assert_called_once()
+
+    def test_sync_requiere_staff(self):
+        cliente = User.objects.create_user(username=fake.unique.user_name(), password='x', role='client')
+        self.client.force_authenticate(user=cliente)
+        response = self.client.post(reverse('manual-sync-products'))
+        self.assertEqual(response.status_code, 403)
+
+    @mock.patch('market.sync_jobs.sync_external_products')
+    def test_run_sync_job_guarda_progreso_y_resultado(self, sync):
+        from market.sync_jobs import run_sync_job
+
+        def fake_sync(progress=None):
+            progress.sumar(categorias=1, paginas=4, filas=7)
+            progress.notificar()
+            return {'success': True, 'nuevos': 2, 'actualizados': 5, 'unchanged': 3, 'total': 10}
+        sync.side_effect = fake_sync
+
+        job = SyncJob.objects.create(creado_por=self.admin)
+        run_sync_job(job.id)
+
+        response = self.client.get(reverse('sync-job-status', kwargs={'job_id': job.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['estado'], 'completado')
+        self.assertEqual(response.data['paginas_obtenidas'], 4)
+        self.assertEqual(response.data['filas_escritas'], 7)
+        self.assertEqual(response.data['resultado']['unchanged'], 3)
+
+    @mock.patch('market.sync_jobs.sync_external_products')
+    @mock.patch('Velorum.scheduler.run_now')
+    def test_sync_programada_y_manual_no_se_superponen(self, run_now, sync):
+        from market.sync_jobs import SYNC_LOCK_NAME, run_scheduled_sync
+
+        def fake_sync(progress=None):
+            # Mientras corre la programada, la manual devuelve ese mismo job
+            response = self.client.post(reverse('manual-sync-products'))
+            self.assertTrue(response.data['ya_en_curso'])
+            self.assertEqual(response.data['job_id'], SyncJob.objects.get().id)
+            return {'success': True}
+        sync.side_effect = fake_sync
+
+        run_scheduled_sync()
+        run_now.assert_not_called()
+        job = SyncJob.objects.get()
+        self.assertEqual((job.estado, job.creado_por), ('completado', None))
+        # Al terminar suelta el lease: la próxima sincronización puede arrancar
+        self.assertEqual(SchedulerLock.objects.get(nombre=SYNC_LOCK_NAME).propietario, '')
+        self.assertNotEqual(self.client.post(reverse('manual-sync-products')).data['job_id'], job.id)
+
+    def test_avance_por_pagina(self):
+        from market.scraper import SyncProgress
+        avances = []
+        progress = SyncProgress(on_update=avances.append, intervalo=0)
+        progress.sumar(paginas=1)
+        progress.notificar(forzar=False)
+        self.assertEqual(avances[-1]['paginas_obtenidas'], 1)
+
+        progress = SyncProgress(on_update=avances.append, intervalo=60)
+        progress.notificar(forzar=False)
+        self.assertEqual(len(avances), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCatalogCache(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.product = Product.objects.create(
+            nombre='Reloj', descripcion='d', precio=100, stock_proveedor=5, categoria=self.category
+        )
+
+    def test_listado_cacheado_e_invalidado_al_guardar(self):
+        url = reverse('product-list')
+        self.assertEqual(self.client.get(url).data['count'], 1)
+
+        # Escritura sin señales: la respuesta cacheada se sigue sirviendo
+        Product.objects.filter(pk=self.product.pk).update(nombre='Otro')
+        self.assertEqual(self.client.get(url).data['results'][0]['nombre'], 'Reloj')
+
+        # save() invalida la versión del catálogo
+        self.product.refresh_from_db()
+        self.product.precio = 200
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['nombre'], 'Otro')
+        self.assertEqual(response.data['results'][0]['precio'], '200.00')
+
+    def test_params_normalizados(self):
+        url = reverse('product-list')
+        self.client.get(url + '?orden=precio_asc&categoria=')
+        with self.assertNumQueries(0):
+            self.client.get(url + '?orden=precio_asc')
+
+    def test_staff_no_usa_cache(self):
+        admin = User.objects.create_user(username=fake.unique.user_name(), password='x', role='admin')
+        self.client.force_authenticate(user=admin)
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        self.client.get(url)
+        Product.objects.filter(pk=self.product.pk).update(nombre='Editado')
+        self.assertEqual(self.client.get(url).data['nombre'], 'Editado')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestProductListFields(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.product = Product.objects.create(
+            nombre='Reloj', descripcion='Descripción larga', precio=100, stock_proveedor=5,
+            categoria=self.category, imagenes=['a.jpg', 'b.jpg']
+        )
+
+    def test_listado_compacto_para_clientes(self):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('product-list'))
+        fila = response.data['results'][0]
+        self.assertEqual(set(fila), set(ProductViewSet.CAMPOS_LISTADO))
+        self.assertEqual(fila['imagen_principal'], 'a.jpg')
+        self.assertEqual(fila['categoria'], {'id': self.category.id, 'nombre': self.category.nombre})
+        self.assertNotIn('descripcion', contexto.captured_queries[-1]['sql'])
+
+    def test_fields_limita_columnas_y_campos(self):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('product-list') + '?fields=id,precio,inexistente')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'precio'})
+        self.assertNotIn('market_category', contexto.captured_queries[-1]['sql'])
+
+    def test_detalle_completo(self):
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.data['descripcion'], 'Descripción larga')
+        self.assertIn('stock_disponible', response.data)
+
+    def test_staff_recibe_listado_completo(self):
+        admin = User.objects.create_user(username=fake.unique.user_name(), password='x', role='admin')
+        self.client.force_authenticate(user=admin)
+        fila = self.client.get(reverse('product-list')).data['results'][0]
+        self.assertIn('descripcion', fila)
+        self.assertIn('stock_vendido', fila)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestFiltroMarca(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        crear = lambda nombre, marca: Product.objects.create(
+            nombre=nombre, descripcion='d', precio=100, stock_proveedor=5, categoria=categoria, marca=marca
+        )
+        self.casio = crear('Reloj Casio Vintage', 'CASIO')
+        self.casio_premium = crear('Reloj Edifice', 'CASIO PREMIUM')
+        self.gshock = crear('Casio G-Shock DW5600', 'G-SHOCK')
+
+    def test_filtra_por_columna_marca(self):
+        response = self.client.get(reverse('product-list') + '?categoria=casio')
+        ids = {fila['id'] for fila in response.data['results']}
+        # Incluye la subcategoría premium y no depende del nombre
+        self.assertEqual(ids, {self.casio.id, self.casio_premium.id})
+
+    def test_marca_en_la_busqueda(self):
+        response = self.client.get(reverse('product-list') + '?q=edifice casio')
+        self.assertEqual([fila['id'] for fila in response.data['results']], [self.casio_premium.id])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestFacets(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.relojes = Category.objects.create(nombre='Relojes', descripcion='')
+        self.premium = Category.objects.create(nombre='Premium', descripcion='')
+        crear = lambda nombre, categoria, marca, precio, en_oferta=False: Product.objects.create(
+            nombre=nombre, descripcion='d', precio=precio, stock_proveedor=5,
+            categoria=categoria, marca=marca, en_oferta=en_oferta
+        )
+        crear('Reloj Casio', self.relojes, 'CASIO', 30000)
+        crear('Reloj Edifice', self.premium, 'CASIO PREMIUM', 120000, en_oferta=True)
+        crear('Rolex Submariner', self.premium, 'ROLEX', 600000)
+        crear('Reloj genérico', self.relojes, 'Otros Relojes', 60000)
+
+    def test_conteos_en_una_query(self):
+        url = reverse('product-facets')
+        with self.assertNumQueries(1):
+            data = self.client.get(url).data
+
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(
+            [(c['nombre'], c['count']) for c in data['categorias']],
+            [('Premium', 2), ('Relojes', 2)]
+        )
+        self.assertEqual(data['marcas'], [{'marca': 'ROLEX', 'count': 1}, {'marca': 'CASIO', 'count': 2}])
+        self.assertEqual([r['count'] for r in data['precios']], [1, 1, 1, 0, 1])
+        self.assertIsNone(data['precios'][-1]['precio_max'])
+        self.assertEqual(data['oferta'], {'en_oferta': 1, 'sin_oferta': 3})
+
+        # Cacheado por versión de catálogo
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_respeta_los_filtros_del_listado(self):
+        data = self.client.get(reverse('product-facets') + '?q=reloj&precio_min=50000').data
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['marcas'], [{'marca': 'CASIO', 'count': 1}])
+
+
+class TestOrderSummary(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username=fake.unique.user_name(), role='admin', is_staff=True)
+        self.cliente = User.objects.create_user(
+            username=fake.unique.user_name(), first_name='Ana', last_name='Paz', email='ana@example.com', role='client'
+        )
+        self.client.force_authenticate(user=self.admin)
+        categoria = Category.objects.create(nombre=fake.unique.word(), descripcion='')
+        self.producto = Product.objects.create(
+            nombre='Reloj', descripcion='d', precio=100, stock_proveedor=10, categoria=categoria
+        )
+        self.pedido = Order.objects.create(usuario=self.cliente, total=300, metodo_pago='Mercado Pago')
+        OrderDetail.objects.create(pedido=self.pedido, producto=self.producto, cantidad=2, subtotal=200)
+        OrderDetail.objects.create(pedido=self.pedido, producto=self.producto, cantidad=1, subtotal=100)
+        self.invitado = Order.objects.create(total=0, nombre_invitado='Juan', email_invitado='juan@example.com')
+
+    def test_listado_resumido(self):
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, 200)
+        filas = {fila['id']: fila for fila in response.data}
+        fila = filas[self.pedido.id]
+        self.assertEqual(set(fila), {
+            'id', 'fecha', 'estado', 'total', 'metodo_pago', 'usuario_detalle', 'cliente', 'email', 'cantidad_items'
+        })
+        self.assertEqual(fila['cantidad_items'], 3)
+        self.assertEqual(fila['cliente'], 'Ana Paz')
+        self.assertEqual(fila['email'], 'ana@example.com')
+        self.assertEqual(fila['usuario_detalle'], {'id': self.cliente.id, 'username': self.cliente.username})
+        invitado = filas[self.invitado.id]
+        self.assertEqual((invitado['cliente'], invitado['email'], invitado['cantidad_items']), ('Juan', 'juan@example.com', 0))
+
+    def test_listado_resumido_en_una_query(self):
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(reverse('order-list'))
+        self.assertEqual(len([q for q in contexto.captured_queries if 'market_order' in q['sql']]), 1)
+
+    def test_vista_completa_y_detalle(self):
+        response = self.client.get(reverse('order-list') + '?vista=completa')
+        fila = next(fila for fila in response.data if fila['id'] == self.pedido.id)
+        self.assertEqual(len(fila['detalles']), 2)
+
+        response = self.client.get(reverse('order-detail', kwargs={'pk': self.pedido.id}))
+        self.assertEqual(response.data['detalles'][0]['producto_detalle']['nombre'], 'Reloj')
@@ -18,6 +18,8 @@ urlpatterns = [
     
     # Endpoints de sincronización de productos
     path('market/sync-external/', views.manual_sync_products, name='manual-sync-products'),
+    path('market/sync-external/<int:job_id>/', views.sync_job_status, name='sync-job-status'),
+    path('market/cache-stats/', views.cache_stats, name='cache-stats'),
     path('market/products/<int:pk>/update-price/', views.update_product_price, name='update-product-price'),
     path('market/products/<int:pk>/reset-stock/', views.reset_stock_vendido, name='reset-stock-vendido'),
     path('market/products/bulk-markup/', views.bulk_update_markup, name='bulk-update-markup'),
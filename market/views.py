@@ -3,14 +3,23 @@ from rest_framework import viewsets, status
 from .serializer import *
 from .models import *
 from Velorum.permissions import *
+from Velorum.pagination import KeysetPagination
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
-from .telegram import send_order_paid_notification
-from django.db.models import F, Q
+from django.conf import settings
+from datetime import timedelta
+from . import catalog_cache
+from .search import buscar
+from .stock import (
+    StockInsuficiente, agrupar_lineas, cancelar_pedidos, crear_reservas, liberar_pedidos, mensaje_faltantes,
+    reservar_stock,
+)
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
 from decimal import Decimal
 
 # Create your views here.
@@ -69,16 +78,81 @@ class ProductViewSet(viewsets.ModelViewSet):
         page_size_query_param = 'page_size'
         max_page_size = 10000
     
-    pagination_class = ProductPagination
+    class ProductCursorPagination(KeysetPagination):
+        """Con ?cursor pagina por keyset (sin COUNT ni OFFSET); sin cursor, por número de página"""
+        page_size = 12
+    
+    ProductCursorPagination.legacy_pagination_class = ProductPagination
+    pagination_class = ProductCursorPagination
+    
+    # Marcas principales: valor de ?categoria= → subcategorías del proveedor que incluye
+    MARCAS_FILTRO = {
+        'ROLEX': ['ROLEX'],
+        'CASIO': ['CASIO', 'CASIO PREMIUM'],
+        'G-SHOCK': ['G-SHOCK'],
+        'PATEK PHILIPPE': ['PATEK PHILIPPE'],
+        'RICHARD MILLE': ['RICHARD MILLE'],
+        'HUBLOT': ['HUBLOT'],
+        'TAG HEUER': ['TAG HEUER'],
+        'AUDEMARS PIGUET': ['AUDEMARS PIGUET'],
+        'TOMI': ['TOMI'],
+        'BINBOND': ['BINBOND'],
+        'CHENXI': ['CHENXI'],
+    }
+    
+    # Límites inferiores de los rangos de precio del facet (el último rango es abierto)
+    RANGOS_PRECIO = [0, 50000, 100000, 200000, 500000]
+    
+    # Representación compacta del listado (grilla de la tienda)
+    CAMPOS_LISTADO = ['id', 'nombre', 'slug', 'precio', 'en_oferta', 'categoria', 'imagen_principal', 'disponible']
+    # Columnas que necesita cada campo del serializer; el resto se mapea a sí mismo
+    COLUMNAS_POR_CAMPO = {
+        'categoria': ['categoria', 'categoria__nombre'],
+        'imagen_url': ['imagen'],
+        'imagen_principal': ['imagenes'],
+        'stock_disponible': ['stock_proveedor', 'stock_vendido', 'stock_ilimitado'],
+        'disponible': ['stock_proveedor', 'stock_vendido', 'stock_ilimitado', 'desactivado'],
+        'precio_final': [],
+    }
+    
+    def get_campos_respuesta(self):
+        """
+        Campos a serializar en GET:
+        - ?fields=id,nombre,precio → solo esos (los desconocidos se ignoran)
+        - listado sin fields → CAMPOS_LISTADO para clientes; admin y operadores
+          reciben la representación completa (el panel edita stock y precios)
+        - detalle sin fields → representación completa
+        
+        Returns:
+            list | None: None significa todos los campos
+        """
+        if self.action not in ['list', 'retrieve']:
+            return None
+        
+        fields = self.request.query_params.get('fields')
+        if fields:
+            validos = ProductSerializer.Meta.fields
+            campos = [campo for campo in (f.strip() for f in fields.split(',')) if campo in validos]
+            if campos:
+                return campos
+        
+        user = self.request.user
+        if self.action == 'list' and not (hasattr(user, 'role') and user.role in ['admin', 'operator']):
+            return self.CAMPOS_LISTADO
+        return None
+    
+    def get_serializer(self, *args, **kwargs):
+        campos = self.get_campos_respuesta()
+        if campos is not None:
+            kwargs['fields'] = campos
+        return super().get_serializer(*args, **kwargs)
     
     def get_queryset(self):
-        queryset = Product.objects.all()
+        # La categoría viaja en la misma query (el serializer la expone en cada fila)
+        queryset = Product.objects.select_related('categoria')
 
-            # 🔴 FILTRO: ocultar productos sin stock
-        queryset = queryset.filter(
-            Q(stock_ilimitado=True) |
-            Q(stock_proveedor__gt=F('stock_vendido'))
-        )
+        # 🔴 FILTRO: ocultar productos sin stock (columna materializada e indexada)
+        queryset = queryset.disponibles()
 
         # Clientes: ocultar productos desactivados
         user = self.request.user
@@ -87,18 +161,14 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         params = self.request.query_params
 
-        # Buscar por nombre (q o nombre)
-        q = params.get("q") or params.get("nombre")
+        # Búsqueda por texto (q o nombre): índice full-text, anota `relevancia`
+        q = (params.get("q") or params.get("nombre") or "").strip()
         if q:
-            queryset = queryset.filter(nombre__icontains=q)
+            queryset = buscar(queryset, q)
 
         # Filtro por categoría o marca
         categoria = (params.get("categoria") or "todos").strip().upper()
         
-        # Marcas principales
-        marcas = ['ROLEX', 'CASIO', 'G-SHOCK', 'PATEK PHILIPPE', 'RICHARD MILLE', 
-                  'HUBLOT', 'TAG HEUER', 'AUDEMARS PIGUET', 'TOMI', 'BINBOND', 'CHENXI']
-        
         if categoria == "TODOS":
             # No filtra, muestra todo
             pass
@@ -108,9 +178,9 @@ class ProductViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(categoria_id=2)
         elif categoria == "SMARTWATCH":
             queryset = queryset.filter(categoria_id=3)
-        elif categoria in marcas:
-            # Filtrar por marca (busca en el nombre del producto)
-            queryset = queryset.filter(nombre__icontains=categoria)
+        elif categoria in self.MARCAS_FILTRO:
+            # Filtrar por marca (columna indexada que llena el sync)
+            queryset = queryset.filter(marca__in=self.MARCAS_FILTRO[categoria])
 
         # Rango de precios
         precio_min = params.get("precio_min")
@@ -136,10 +206,134 @@ class ProductViewSet(viewsets.ModelViewSet):
                 queryset = queryset.order_by("-destacado", "-id")
             else:
                 queryset = queryset.order_by("-id")
+        elif q:
+            queryset = queryset.order_by("-relevancia", "-id")
         else:
             queryset = queryset.order_by("-id")
 
+        # Cargar solo las columnas que se van a serializar
+        campos = self.get_campos_respuesta()
+        if campos is not None:
+            columnas = {'id'}
+            for campo in campos:
+                columnas.update(self.COLUMNAS_POR_CAMPO.get(campo, [campo]))
+            if 'categoria' not in columnas:
+                queryset = queryset.select_related(None)
+            queryset = queryset.only(*columnas)
+
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """Listado del catálogo, cacheado para anónimos y clientes (ver catalog_cache)"""
+        if not catalog_cache.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        
+        # ?cursor= vacío cambia la forma de la respuesta: no puede compartir clave con el listado por página
+        modo = {'modo': 'cursor'} if 'cursor' in request.query_params else {}
+        key = catalog_cache.cache_key('list', request, **modo)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, catalog_cache.catalog_cache_timeout())
+            return response
+        return Response(data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Detalle de producto, cacheado para anónimos y clientes (ver catalog_cache)"""
+        if not catalog_cache.is_cacheable(request):
+            return super().retrieve(request, *args, **kwargs)
+        
+        key = catalog_cache.cache_key('detail', request, pk=kwargs.get('pk'))
+        data = cache.get(key)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            cache.set(key, response.data, catalog_cache.catalog_cache_timeout())
+            return response
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Conteos para los filtros de la tienda (categoría, marca, rango de precio, oferta)
+        con los mismos filtros que el listado (q, categoria, precio_min, precio_max).
+        
+        GET /api/market/model/products/facets/?q=reloj
+        
+        Returns:
+            {
+                "total": 120,
+                "categorias": [{"id": 1, "nombre": "Relojes", "count": 80}, ...],
+                "marcas": [{"marca": "ROLEX", "count": 12}, ...],
+                "precios": [{"precio_min": 0, "precio_max": 50000, "count": 30}, ...],
+                "oferta": {"en_oferta": 10, "sin_oferta": 110}
+            }
+        """
+        if not catalog_cache.is_cacheable(request):
+            return Response(self._calcular_facets())
+        
+        key = catalog_cache.cache_key('facets', request)
+        data = cache.get(key)
+        if data is None:
+            data = self._calcular_facets()
+            cache.set(key, data, catalog_cache.catalog_cache_timeout())
+        return Response(data)
+    
+    def _calcular_facets(self):
+        """
+        Una sola query agrupada por (categoría, marca, rango de precio, oferta);
+        cada facet se arma sumando esas pocas filas en Python.
+        """
+        rangos = self.RANGOS_PRECIO
+        rango = Case(
+            *[When(precio__lt=limite, then=Value(i)) for i, limite in enumerate(rangos[1:])],
+            default=Value(len(rangos) - 1),
+            output_field=IntegerField()
+        )
+        grupos = (
+            self.get_queryset()
+            .select_related(None)
+            .order_by()
+            .annotate(rango=rango)
+            .values('categoria_id', 'categoria__nombre', 'marca', 'rango', 'en_oferta')
+            .annotate(cantidad=Count('id'))
+        )
+        
+        marca_a_filtro = {
+            marca: filtro for filtro, marcas in self.MARCAS_FILTRO.items() for marca in marcas
+        }
+        categorias = {}
+        marcas = dict.fromkeys(self.MARCAS_FILTRO, 0)
+        precios = [0] * len(rangos)
+        oferta = {'en_oferta': 0, 'sin_oferta': 0}
+        total = 0
+        
+        for grupo in grupos:
+            cantidad = grupo['cantidad']
+            total += cantidad
+            categoria = categorias.setdefault(
+                grupo['categoria_id'],
+                {'id': grupo['categoria_id'], 'nombre': grupo['categoria__nombre'], 'count': 0}
+            )
+            categoria['count'] += cantidad
+            if grupo['marca'] in marca_a_filtro:
+                marcas[marca_a_filtro[grupo['marca']]] += cantidad
+            precios[grupo['rango']] += cantidad
+            oferta['en_oferta' if grupo['en_oferta'] else 'sin_oferta'] += cantidad
+        
+        return {
+            'total': total,
+            'categorias': sorted(categorias.values(), key=lambda c: c['nombre']),
+            'marcas': [{'marca': marca, 'count': cantidad} for marca, cantidad in marcas.items() if cantidad],
+            'precios': [
+                {
+                    'precio_min': rangos[i],
+                    'precio_max': rangos[i + 1] if i + 1 < len(rangos) else None,
+                    'count': precios[i]
+                }
+                for i in range(len(rangos))
+            ],
+            'oferta': oferta,
+        }
         
     @action(detail=True, methods=['post'], permission_classes=[AddToCartPermission])
     def add_to_cart(self, request, pk=None):
@@ -189,11 +383,12 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
             mensaje = 'Producto agregado al carrito'
         
-        # 7. Preparar respuesta con los datos del carrito actualizado
+        # 7. Preparar respuesta con los datos del carrito actualizado (totales en una query)
+        total, cantidad_items = carrito.totales()
         datos_carrito = {
             'mensaje': mensaje,
-            'total_items': carrito.cantidad_items(),
-            'total': float(carrito.total()),
+            'total_items': cantidad_items,
+            'total': float(total),
             'producto_agregado': {
                 'id': producto.id,
                 'nombre': producto.nombre,
@@ -276,6 +471,8 @@ class ProductViewSet(viewsets.ModelViewSet):
         try:
             producto = self.get_object()
             producto.desactivado = not producto.desactivado
+            # La visibilidad pasa a ser decisión del admin: el sync no la revierte
+            producto.desactivado_por_sync = False
             producto.save()
             
             estado = 'oculto' if producto.desactivado else 'visible'
@@ -313,7 +510,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [OrderPermission]
-    pagination_class = None  # Desactivar paginación para traer todas las órdenes
+    pagination_class = KeysetPagination  # Sin ?cursor devuelve todas las órdenes (comportamiento anterior)
     
     def get_queryset(self):
         """
@@ -323,8 +520,34 @@ class OrderViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if hasattr(user, 'role') and user.role in ['admin', 'operator']:
-            return Order.objects.all()
-        return Order.objects.filter(usuario=user)
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(usuario=user)
+        
+        if self.action == 'list' and not self.vista_completa():
+            # Resumen: usuario por JOIN; cantidad_items es columna del pedido (sin detalles)
+            queryset = queryset.select_related('usuario')
+        elif self.action in ['list', 'retrieve']:
+            queryset = self._optimizar_lectura(queryset)
+        return queryset
+    
+    def vista_completa(self):
+        """El listado devuelve el resumen salvo con ?vista=completa (detalles anidados)"""
+        return self.request.query_params.get('vista') == 'completa'
+    
+    def get_serializer_class(self):
+        if self.action == 'list' and not self.vista_completa():
+            return OrderSummarySerializer
+        return super().get_serializer_class()
+    
+    def _optimizar_lectura(self, queryset):
+        """
+        Trae usuario, detalles, productos y categorías en una cantidad fija de queries.
+        Solo para lectura: en acciones que modifican detalles, el prefetch quedaría desactualizado.
+        """
+        return queryset.select_related('usuario').prefetch_related(
+            'usuario__groups', 'usuario__user_permissions', 'detalles__producto__categoria'
+        )
     
     @action(detail=False, methods=['get'], url_path='my-orders', permission_classes=[IsAuthenticated])
     def my_orders(self, request):
@@ -333,7 +556,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         vea solo sus propios pedidos.
         """
         user = request.user
-        orders = Order.objects.filter(usuario=user).order_by('-fecha')
+        orders = self._optimizar_lectura(Order.objects.filter(usuario=user).order_by('-fecha'))
         serializer = self.get_serializer(orders, many=True)
         return Response(serializer.data)
 
@@ -371,7 +594,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             # Manejar cada detalle de la orden
             self._process_order_details(updated_instance, detalles_data)
             
-        # Recalcular total
+        # Los detalles ya ajustaron subtotal y total; recalcular por si cambió el envío
         if hasattr(updated_instance, 'total_update'):
             updated_instance.total_update()
     
@@ -392,6 +615,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                     # Actualizar detalle existente
                     try:
                         detalle = OrderDetail.objects.get(id=detalle_id, pedido=order)
+                        detalle.pedido = order
                         
                         # Si la cantidad cambia, ajustar el stock
                         if detalle.cantidad != cantidad:
@@ -447,12 +671,10 @@ class OrderViewSet(viewsets.ModelViewSet):
             producto.stock += detail.cantidad
             producto.save()
             
-            # Eliminar el detalle
+            # Eliminar el detalle (descuenta subtotal y cantidad del pedido en la misma transacción)
+            detail.pedido = order
             detail.delete()
             
-            # Actualizar el total
-            order.total_update()
-            
             return Response(
                 {'status': 'Detalle eliminado', 'total_actualizado': float(order.total)}, 
                 status=status.HTTP_200_OK
@@ -483,7 +705,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         # Cambiar estado
         order.estado = 'cancelado'
-        order.save()
+        order.save(update_fields=['estado'])
         
         return Response({"message": "Orden cancelada correctamente"})
     
@@ -504,20 +726,45 @@ class OrderViewSet(viewsets.ModelViewSet):
         if getattr(request.user, 'role', None) not in ['admin', 'operator']:
             return Response({'error': 'No autorizado'}, status=status.HTTP_403_FORBIDDEN)
         order = self.get_object()
-        # 1) Cerrar pagos abiertos (pendiente/en_revision) como fallido
-        abiertos = Pay.objects.filter(pedido=order, estado__in=['pendiente', 'en_revision'])
-        for p in abiertos:
-            p.fail()
-        # 2) Restaurar stock si el pedido no estaba cancelado aún
-        if order.estado != 'cancelado':
-            for det in order.detalles.all():
-                prod = det.producto
-                prod.stock += det.cantidad
-                prod.save()
-        # 3) Eliminar pagos y pedido
-        Pay.objects.filter(pedido=order).delete()
-        order.delete()
+        with transaction.atomic():
+            # Lock bloqueante (no skip_locked): si el webhook de MP está aplicando un pago
+            # se espera a que termine, y el estado leído acá es el definitivo
+            order = Order.objects.select_for_update().get(pk=order.pk)
+            # 1) Cerrar pagos abiertos (pendiente/en_revision) como fallido
+            abiertos = Pay.objects.filter(pedido=order, estado__in=['pendiente', 'en_revision'])
+            for p in abiertos:
+                p.fail()
+            # 2) Restaurar stock si el pedido no estaba cancelado aún (un UPDATE por producto
+            #    agregado; update() y no save(): Order.save() lo devolvería otra vez)
+            if order.estado != 'cancelado':
+                Order.objects.filter(pk=order.pk).update(estado='cancelado')
+                liberar_pedidos([order.pk])
+            # 3) Eliminar pagos y pedido
+            Pay.objects.filter(pedido=order).delete()
+            order.delete()
         return Response({'status': 'pedido eliminado'}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='cancel-stale', permission_classes=[IsAdminOrOperator])
+    def cancel_stale(self, request):
+        """
+        Cancela en bloque los pedidos 'pendiente' más viejos que `horas`
+        (default settings.STALE_ORDER_HOURS) y devuelve su stock. Los que
+        tienen una reserva vigente (p. ej. cupón de pago en efectivo sin
+        acreditar) no se tocan: los cancela el barrido cuando vence.
+        """
+        try:
+            horas = int(request.data.get('horas', getattr(settings, 'STALE_ORDER_HOURS', 48)))
+        except (TypeError, ValueError):
+            return Response({'error': 'horas debe ser un número entero'}, status=status.HTTP_400_BAD_REQUEST)
+        if horas < 1:
+            return Response({'error': 'horas debe ser mayor a 0'}, status=status.HTTP_400_BAD_REQUEST)
+
+        limite = timezone.now() - timedelta(hours=horas)
+        pedidos = Order.objects.filter(estado='pendiente', fecha__lt=limite).exclude(
+            reservas__estado=ReservaStock.ACTIVA, reservas__expira__gt=timezone.now()
+        )
+        resumen = cancelar_pedidos(pedidos)
+        return Response({'status': 'pedidos cancelados', 'horas': horas, **resumen}, status=status.HTTP_200_OK)
     
 class CartViewSet(viewsets.ModelViewSet):
     """
@@ -527,16 +774,66 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer  # Necesitarás crear este serializer
     permission_classes = [IsAuthenticated]  # Solo usuarios autenticados
     
+    # Máximo de líneas por llamada a add-items
+    MAX_ITEMS_LOTE = 100
+    
     def get_queryset(self):
         """Retorna solo el carrito del usuario actual"""
-        return Cart.objects.filter(usuario=self.request.user)
+        return Cart.objects.filter(usuario=self.request.user).con_items()
     
     def list(self, request):
         """Obtener detalles del carrito actual del usuario"""
-        carrito, created = Cart.objects.get_or_create(usuario=request.user)
+        # Carrito + una query con items, productos y categorías; los totales salen de esos items
+        carrito, created = Cart.objects.con_items().get_or_create(usuario=request.user)
         serializer = self.get_serializer(carrito)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], url_path='add-items')
+    def add_items(self, request):
+        """
+        Agrega varios productos al carrito en una sola llamada (p. ej. el carrito
+        de invitado al iniciar sesión). Todo o nada: si alguna línea no tiene
+        stock no se guarda ninguna.
+        
+        Body: {"items": [{"producto": id, "cantidad": n}, ...], "reemplazar": false}
+        Un producto repetido se suma. Con reemplazar=true la cantidad pisa la del carrito.
+        """
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Debe enviar una lista de items'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.MAX_ITEMS_LOTE:
+            return Response(
+                {'error': f'No se pueden agregar más de {self.MAX_ITEMS_LOTE} items por vez'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            cantidades = agrupar_lineas(
+                (int(item['producto']), int(item.get('cantidad', 1))) for item in items
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return Response(
+                {'error': 'Cada item debe tener producto y cantidad numéricos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if any(cantidad <= 0 for cantidad in cantidades.values()):
+            return Response({'error': 'La cantidad debe ser mayor a cero'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        carrito, created = Cart.objects.get_or_create(usuario=request.user)
+        reemplazar = request.data.get('reemplazar') in [True, 'true', '1', 1]
+        faltantes = carrito.agregar_lote(cantidades, reemplazar=reemplazar)
+        if faltantes:
+            return Response(
+                {'error': mensaje_faltantes(faltantes), 'faltantes': faltantes},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        carrito = Cart.objects.con_items().get(pk=carrito.pk)
+        return Response({
+            'mensaje': 'Carrito actualizado',
+            'carrito': self.get_serializer(carrito).data,
+        }, status=status.HTTP_200_OK)
+    
     @action(detail=False, methods=['post'])
     def clear(self, request):
         """Vaciar el carrito"""
@@ -548,60 +845,55 @@ class CartViewSet(viewsets.ModelViewSet):
     def checkout(self, request):
         """Convertir carrito en pedido"""
         carrito, created = Cart.objects.get_or_create(usuario=request.user)
+        # Items con sus productos en una sola query; se reusan para todo el checkout
+        items = list(carrito.items.select_related('producto'))
         
         # Verificar que el carrito no esté vacío
-        if carrito.items.count() == 0:
+        if not items:
             return Response(
                 {'error': 'El carrito está vacío'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verificar stock disponible para todos los productos (primer chequeo)
-        for item in carrito.items.all():
-            if item.cantidad > item.producto.stock_disponible:
-                return Response(
-                    {'error': f'Stock insuficiente para {item.producto.nombre}. Solo hay {item.producto.stock_disponible} unidades disponibles'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
         direccion_cliente = getattr(request.user, 'address', 'Dirección no proporcionada por el cliente')
         
-        # Crear nuevo pedido
-        pedido = Order.objects.create(
-            usuario=request.user,
-            estado='pendiente',
-            total=carrito.total(),
-            direccion_envio=direccion_cliente
-        )
-        
-        # Transferir items del carrito al pedido (segundo chequeo y reducción de stock)
-        for item in carrito.items.all():
-            # Refrescar el producto desde la base de datos para obtener stock actualizado
-            item.producto.refresh_from_db()
-            
-            # Verificar stock nuevamente (segundo chequeo)
-            if item.cantidad > item.producto.stock_disponible:
-                # Si falla, eliminar el pedido creado y retornar error
-                pedido.delete()
-                return Response(
-                    {'error': f'Stock insuficiente para {item.producto.nombre}. Solo hay {item.producto.stock_disponible} unidades disponibles'}, 
-                    status=status.HTTP_400_BAD_REQUEST
+        # Reserva de stock, pedido y vaciado del carrito en una sola transacción:
+        # si algo falla no queda stock vendido ni pedido a medias
+        try:
+            with transaction.atomic():
+                faltantes = reservar_stock((item.producto_id, item.cantidad) for item in items)
+                if faltantes:
+                    raise StockInsuficiente(faltantes)
+                
+                # bulk_create no pasa por OrderDetail.save(): los totales se cargan acá
+                subtotal = sum(item.subtotal() for item in items)
+                pedido = Order.objects.create(
+                    usuario=request.user,
+                    estado='pendiente',
+                    subtotal=subtotal,
+                    cantidad_items=sum(item.cantidad for item in items),
+                    total=subtotal,
+                    direccion_envio=direccion_cliente
                 )
-            
-            # Crear el detalle del pedido
-            OrderDetail.objects.create(
-                pedido=pedido,
-                producto=item.producto,
-                cantidad=item.cantidad,
-                subtotal=item.cantidad * item.producto.precio
+                
+                # Transferir items del carrito al pedido (un solo INSERT)
+                OrderDetail.objects.bulk_create([
+                    OrderDetail(
+                        pedido=pedido,
+                        producto=item.producto,
+                        cantidad=item.cantidad,
+                        subtotal=item.cantidad * item.producto.precio
+                    )
+                    for item in items
+                ])
+                
+                # Vaciar el carrito
+                carrito.limpiar()
+        except StockInsuficiente as e:
+            return Response(
+                {'error': str(e), 'faltantes': e.faltantes},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Incrementar stock vendido
-            item.producto.stock_vendido += item.cantidad
-            item.producto.save()
-        
-        # Vaciar el carrito
-        carrito.limpiar()
         
         return Response({
             'mensaje': 'Pedido creado correctamente',
@@ -614,6 +906,7 @@ class PayViewSet(viewsets.ModelViewSet):
     queryset = Pay.objects.select_related('pedido', 'pedido__usuario')
     serializer_class = PaySerializer
     permission_classes = [PaymentPermission]
+    pagination_class = KeysetPagination
     parser_classes = [JSONParser, MultiPartParser, FormParser]
 
     def get_queryset(self):
@@ -676,7 +969,7 @@ class PayViewSet(viewsets.ModelViewSet):
         pedido = pago.pedido
         if pedido and pedido.estado == 'pendiente':
             pedido.estado = 'en_revision'
-            pedido.save()
+            pedido.save(update_fields=['estado'])
         return Response(self.get_serializer(pago).data)
 
     @action(detail=True, methods=['post'])
@@ -703,7 +996,7 @@ class PayViewSet(viewsets.ModelViewSet):
         pedido = pago.pedido
         if pedido and pedido.estado == 'en_revision':
             pedido.estado = 'pendiente'
-            pedido.save()
+            pedido.save(update_fields=['estado'])
         return Response(self.get_serializer(pago).data)
 
     @action(detail=True, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
@@ -729,7 +1022,7 @@ class PayViewSet(viewsets.ModelViewSet):
         if pago.pedido.estado == 'pendiente':
             pedido = pago.pedido
             pedido.estado = 'en_revision'
-            pedido.save()
+            pedido.save(update_fields=['estado'])
         return Response(self.get_serializer(pago).data)
 
 class ShipmentViewSet(viewsets.ModelViewSet):
@@ -741,13 +1034,20 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     queryset = Shipment.objects.all()
     serializer_class = ShipmentSerializer
     permission_classes = [ShipmentPermission]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         """Filtra para que clientes vean solo envíos de sus órdenes"""
         user = self.request.user
         if user.role in ['admin', 'operator']:
-            return Shipment.objects.all()
-        return Shipment.objects.filter(pedido__usuario=user)
+            queryset = Shipment.objects.all()
+        else:
+            queryset = Shipment.objects.filter(pedido__usuario=user)
+        
+        if self.action in ['list', 'retrieve']:
+            # pedido_detalle muestra cliente y productos del pedido
+            queryset = queryset.select_related('pedido__usuario').prefetch_related('pedido__detalles__producto')
+        return queryset
     
     @action(detail=True, methods=['get'], permission_classes=[TrackingPermission])
     def tracking(self, request, pk=None):
@@ -781,12 +1081,12 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         # Si se marca como enviado, actualizar también el pedido
         if nuevo_estado == 'en camino' and shipment.pedido.estado != 'enviado':
             shipment.pedido.estado = 'enviado'
-            shipment.pedido.save()
+            shipment.pedido.save(update_fields=['estado'])
             
         # Si se marca como entregado, actualizar también el pedido
         if nuevo_estado == 'entregado' and shipment.pedido.estado != 'entregado':
             shipment.pedido.estado = 'entregado'
-            shipment.pedido.save()
+            shipment.pedido.save(update_fields=['estado'])
             
         shipment.save()
         return Response({'status': 'Estado de envío actualizado'}, status=status.HTTP_200_OK)
@@ -801,7 +1101,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Retorna solo los items del carrito del usuario actual"""
-        return CartItem.objects.filter(carrito__usuario=self.request.user)
+        return CartItem.objects.filter(carrito__usuario=self.request.user).select_related('producto__categoria')
     
     def list(self, request, *args, **kwargs):
         """Lista todos los items del carrito del usuario"""
@@ -934,7 +1234,7 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
-from market.scraper import sync_external_products
+from market.sync_jobs import enqueue_sync
 import logging
 
 logger = logging.getLogger(__name__)
@@ -944,35 +1244,75 @@ logger = logging.getLogger(__name__)
 @permission_classes([IsAdminOrOperator])
 def manual_sync_products(request):
     """
-    Endpoint para sincronización manual de productos externos.
-    Accesible por administradores y operadores.
+    Encola una sincronización manual de productos externos.
+    Accesible por administradores y operadores. La sincronización corre en el
+    scheduler; el avance se consulta en GET /api/market/sync-external/<job_id>/.
+    Si ya hay una sincronización activa, se devuelve esa.
     
-    POST /api/products/sync-external/
+    POST /api/market/sync-external/
     
-    Returns:
+    Returns (202):
         {
-            "success": true,
-            "productos_nuevos": 10,
-            "productos_actualizados": 517,
-            "total": 527,
-            "desactivados": 0,
-            "errores": []
+            "job_id": 12,
+            "estado": "pendiente",
+            "ya_en_curso": false
         }
     """
     try:
-        logger.info("Sincronización manual iniciada por usuario: " + request.user.username)
-        resultado = sync_external_products()
+        logger.info("Sincronización manual solicitada por usuario: " + request.user.username)
+        job, created = enqueue_sync(request.user)
         
-        return Response(resultado, status=status.HTTP_200_OK)
+        return Response({
+            'job_id': job.id,
+            'estado': job.estado,
+            'ya_en_curso': not created
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
-        logger.error(f"Error en sincronización manual: {str(e)}")
+        logger.error(f"Error al encolar sincronización manual: {str(e)}")
         return Response({
             'success': False,
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminOrOperator])
+def sync_job_status(request, job_id):
+    """
+    Estado y avance de una sincronización encolada.
+    
+    GET /api/market/sync-external/<job_id>/
+    
+    Returns:
+        {
+            "id": 12,
+            "estado": "completado",
+            "categorias_completadas": 3,
+            "paginas_obtenidas": 48,
+            "filas_escritas": 37,
+            "resultado": {"success": true, "nuevos": 10, "actualizados": 27, "unchanged": 480, ...},
+            ...
+        }
+    """
+    job = get_object_or_404(SyncJob, pk=job_id)
+    return Response(SyncJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Contadores del cache de este proceso (aciertos por nivel, fallos, hit ratio).
+    
+    GET /api/market/cache-stats/
+    """
+    stats = getattr(cache, 'stats', None)
+    if stats is None:
+        return Response({'error': 'El backend de cache configurado no expone métricas'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(stats(), status=status.HTTP_200_OK)
+
+
 @api_view(['PATCH'])
 @permission_classes([IsAdminUser])
 def update_product_price(request, pk):
@@ -1039,7 +1379,7 @@ def reset_stock_vendido(request, pk):
     try:
         producto = Product.objects.get(pk=pk)
         producto.stock_vendido = 0
-        producto.save()
+        producto.save(update_fields=['stock_vendido'])
         
         return Response({
             'success': True,
@@ -1108,6 +1448,7 @@ def bulk_update_markup(request):
 # ============================================================
 
 from .mercadopago_service import create_preference, process_payment_notification
+from .mp_inbox import despertar_worker, registrar_notificacion
 
 
 @api_view(['POST'])
@@ -1169,7 +1510,14 @@ def create_mp_preference(request):
         if not serializer.is_valid():
             return Response({'success': False, 'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
         
-        order = serializer.save()
+        try:
+            # El stock vendido queda como reserva con vencimiento hasta que MP apruebe el pago
+            with transaction.atomic():
+                order = serializer.save()
+                crear_reservas(order)
+        except serializers.ValidationError as e:
+            # Stock insuficiente o producto inexistente: no se creó el pedido
+            return Response({'success': False, 'error': e.detail}, status=status.HTTP_400_BAD_REQUEST)
         
         # Registrar uso del código de descuento si existe
         codigo_str = request.data.get('codigo_descuento')
@@ -1219,85 +1567,13 @@ def mercadopago_webhook(request):
     """
     Webhook para recibir notificaciones de Mercado Pago.
     POST /market/mp/webhook/
+    
+    Solo guarda la notificación y responde: la consulta a MP y la
+    actualización del pedido las hace el worker de market/mp_inbox.py.
     """
     try:
-        topic = request.query_params.get('topic') or request.data.get('type')
-        resource_id = request.query_params.get('id') or request.data.get('data', {}).get('id')
-        
-        logger.info(f"Webhook MP - Topic: {topic}, ID: {resource_id}")
-        
-        if topic == 'payment' and resource_id:
-            payment_info = process_payment_notification(resource_id)
-            order_id = payment_info.get('order_id')
-            
-            if order_id:
-                try:
-                    order = Order.objects.get(id=order_id)
-                    
-                    if payment_info['status'] == 'approved':
-                        order.estado_pago = 'completado'
-                        order.estado = 'pagado'
-                        pay_estado = 'completado'
-                    elif payment_info['status'] == 'pending':
-                        order.estado_pago = 'pendiente'
-                        pay_estado = 'pendiente'
-                    elif payment_info['status'] in ['rejected', 'cancelled']:
-                        order.estado_pago = 'fallido'
-                        pay_estado = 'fallido'
-                    else:
-                        pay_estado = 'en_revision'
-                    
-                    order.save()
-                    
-                    # Crear o actualizar registro de pago
-                    existing_pay = Pay.objects.filter(pedido=order, external_id=str(payment_info['payment_id'])).first()
-                    previous_estado = existing_pay.estado if existing_pay else None
-
-                    pay, created = Pay.objects.get_or_create(
-                        pedido=order,
-                        external_id=str(payment_info['payment_id']),
-                        defaults={
-                            'metodo': 'tarjeta',
-                            'monto_pagado': payment_info['transaction_amount'],
-                            'estado': pay_estado,
-                            'metadata': {
-                                'payment_method_id': payment_info['payment_method_id'],
-                                'status_detail': payment_info['status_detail'],
-                                'mp_payment_id': payment_info['payment_id']
-                            }
-                        }
-                    )
-                    if not created:
-                        # Actualizar si ya existe
-                        pay.estado = pay_estado
-                        pay.monto_pagado = payment_info['transaction_amount']
-                        pay.metadata.update({
-                            'payment_method_id': payment_info['payment_method_id'],
-                            'status_detail': payment_info['status_detail'],
-                            'mp_payment_id': payment_info['payment_id']
-                        })
-                        pay.save()
-
-                    logger.info(f"Orden {order_id} actualizada: {payment_info['status']}, Pay {'creado' if created else 'actualizado'}")
-
-                    # Notificar a Telegram solo si el estado pasó a 'completado'
-                    try:
-                        should_notify = False
-                        if pay_estado == 'completado':
-                            if created:
-                                should_notify = True
-                            else:
-                                if previous_estado != 'completado':
-                                    should_notify = True
-
-                        if should_notify:
-                            send_order_paid_notification(order)
-                    except Exception:
-                        logger.exception('Error al enviar notificación a Telegram')
-                    
-                except Order.DoesNotExist:
-                    logger.error(f"Orden {order_id} no encontrada")
-        
+        if registrar_notificacion(request):
+            despertar_worker()
         return Response({'status': 'ok'}, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -1470,7 +1746,7 @@ def reset_stock_vendido(request, pk):
     try:
         producto = Product.objects.get(pk=pk)
         producto.stock_vendido = 0
-        producto.save()
+        producto.save(update_fields=['stock_vendido'])
         
         return Response({
             'mensaje': 'Stock vendido reseteado correctamente',
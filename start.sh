@@ -30,4 +30,4 @@ else
 fi
 
 # Tu comando de start (tal cual lo pediste)
-bash -c "python manage.py makemigrations && python manage.py migrate --noinput && python manage.py collectstatic --noinput && gunicorn -b 0.0.0.0:$PORT Velorum.wsgi:application"
+bash -c "python manage.py makemigrations && python manage.py migrate --noinput && python manage.py createcachetable && python manage.py collectstatic --noinput && gunicorn -b 0.0.0.0:$PORT Velorum.wsgi:application"